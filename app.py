@@ -2,7 +2,6 @@
 import os
 import gc # FIX: Added missing import
 import streamlit as st
-import google.generativeai as genai
 import requests
 import json
 import time
@@ -14,6 +13,24 @@ from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from duckduckgo_search import DDGS
 from yugioh_scraper import YuGiOhMetaScraper
+import card_catalog
+from card_matcher import CardNameMatcher, CardMentionExtractor
+from image_cache import get_image_cache
+import deck_renderer
+import deck_delta
+from verdict_cache import get_verdict_cache, card_keys, make_key, rulings_hash
+from rate_limiter import get_rate_limiter, estimate_tokens, IMAGE_TOKENS
+from key_pool import get_key_pool
+from llm_providers import get_provider
+from model_router import get_model_router
+import llm_calls
+from judge_prompts import (
+    JUDGE_PROMPT_VERSION, split_verdict, card_context_entry, build_judge_prompt, build_followup_prompt,
+    build_ocg_reval_prompt, extra_rulings_for
+)
+from prompt_compiler import Section, compile_prompt, prompt_stats
+from meta_index import get_meta_index
+from meta_query import get_meta_query_planner
 from PIL import Image
 import pandas as pd
 
@@ -37,59 +54,77 @@ st.markdown("""
 
 # --- Funzioni di Supporto ---
 
+def current_rate_limiter():
+    """Limiter condiviso della key attiva (stesso profilo = stesso budget per tutte le sessioni)."""
+    return get_rate_limiter(st.session_state.get("api_key", ""))
+
+def active_key_pool():
+    """KeyPool del processo se la modalità pool è attiva, altrimenti None."""
+    if not st.session_state.get("key_pool_enabled") or len(stored_keys) < 2:
+        return None
+    return get_key_pool(stored_keys)
+
+def call_gemini_limited(model, prompt_tokens, call):
+    """call(modello) -> (testo, token) sotto limiter, pool e router della key attiva (vedi llm_calls)."""
+    return llm_calls.call_limited(model, st.session_state.get("api_key", ""), prompt_tokens, call,
+                                  pool=active_key_pool(), notify=st.toast)
+
 def get_gemini_response(model, prompt):
-    """Genera una risposta usando il modello Gemini con retry automatico per Rate Limit (429)."""
-    max_retries = 3
-    base_delay = 5  # secondi
-    
-    for attempt in range(max_retries):
-        try:
-            response = model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            error_str = str(e)
-            if "429" in error_str or "quota" in error_str.lower():
-                if attempt < max_retries - 1:
-                    wait_time = base_delay * (attempt + 1)
-                    st.toast(f"⚠️ Rate limit raggiunto. Riprovo tra {wait_time}s... ({attempt+1}/{max_retries})")
-                    time.sleep(wait_time)
-                    continue
-            return f"Errore API Gemini: {e}"
-    return "Errore: Rate limit persistente. Riprova più tardi."
-
-@st.cache_data
+    """Genera una risposta usando il modello Gemini, sotto il rate limiter condiviso della key."""
+    return llm_calls.generate(model, st.session_state.get("api_key", ""), prompt,
+                              pool=active_key_pool(), notify=st.toast)
+
+def stream_gemini_response(model, prompt, on_text):
+    """
+    Come get_gemini_response ma in streaming: on_text(testo_parziale) viene chiamata
+    a ogni chunk. Un tentativo fallito riparte da testo vuoto.
+    """
+    return llm_calls.stream(model, st.session_state.get("api_key", ""), prompt, on_text,
+                            pool=active_key_pool(), notify=st.toast)
+
 def load_card_database():
-    """Scarica DB carte (Nome -> Tipo). Light version."""
-    try:
-        url = "https://db.ygoprodeck.com/api/v7/cardinfo.php"
-        # Timeout added to prevent freeze
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            data = response.json()["data"]
-            # Map: "Dark Magician" -> "Normal Monster"
-            db = {}
-            for card in data:
-                db[card["name"]] = card["type"]
-            return db
-        return {}
-    except Exception as e:
-        print(f"DB Load Error: {e}")
-        return {}
+    """Catalogo carte del processo (Nome -> Tipo via .get), condiviso per riferimento tra sessioni."""
+    return card_catalog.get_catalog()
 
-@st.cache_data
 def load_all_card_names():
-    """Scarica e catch'a la lista di tutti i nomi delle carte (leggero)."""
-    try:
-        url = "https://db.ygoprodeck.com/api/v7/cardinfo.php"
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            data = response.json()["data"]
-            return [card["name"] for card in data]
-        return []
-    except Exception:
-        return []
+    """Tupla di tutti i nomi delle carte (dal catalogo condiviso, nessuna copia)."""
+    return card_catalog.get_catalog().names
+
+def load_localized_card_names():
+    """Nomi localizzati (es. Italiano) -> nome ufficiale inglese."""
+    return card_catalog.get_catalog().localized
+
+@st.cache_resource(max_entries=1)
+def _build_card_labels(catalog_version):
+    return {en: f"{en} · {loc}" for loc, en in load_localized_card_names().items()}
+
+def load_card_labels():
+    """Etichette autocomplete "Nome EN · Nome IT": il filtro del multiselect trova anche il nome italiano."""
+    return _build_card_labels(load_card_database().version)
+
+@st.cache_resource(max_entries=1)
+def _build_card_matcher(catalog_version):
+    return CardNameMatcher(load_all_card_names(), localized=load_localized_card_names())
+
+def load_card_matcher():
+    """Indice fuzzy (trigrammi + prefissi) sui nomi EN + IT, condiviso tra sessioni."""
+    return _build_card_matcher(load_card_database().version)
+
+@st.cache_resource(max_entries=1)
+def _build_mention_extractor(catalog_version):
+    return CardMentionExtractor(load_all_card_names(), localized=load_localized_card_names())
+
+def load_mention_extractor():
+    """Automa Aho-Corasick su nomi ufficiali + alias, condiviso tra sessioni."""
+    return _build_mention_extractor(load_card_database().version)
+
+def extract_cards(user_question, allow_llm_fallback=True):
+    """Trova le carte citate nella domanda: prima il matcher locale, Gemini solo se non trova nulla."""
+    local_cards = load_mention_extractor().find_mentions(user_question)
+    if local_cards or not allow_llm_fallback:
+        return local_cards
+    model, _model_name = resolve_working_model()
 
-def extract_cards(model, user_question):
     prompt = f"""
     Sei un esperto di Yu-Gi-Oh!. Identifica le carte menzionate nella domanda.
     
@@ -117,7 +152,9 @@ def extract_cards(model, user_question):
         end = response_text.rfind(']') + 1
         if start != -1 and end != -1:
             json_str = response_text[start:end]
-            return json.loads(json_str)
+            # Riporta i nomi del modello a quelli ufficiali quando possibile
+            card_matcher = load_card_matcher()
+            return [card_matcher.best_match(n, cutoff=0.8) or n for n in json.loads(json_str) if isinstance(n, str)]
         return []
     except Exception:
         return []
@@ -162,8 +199,13 @@ def analyze_image_for_cards(model, image):
     """
     
     try:
-        response = model.generate_content([prompt, image])
-        response_text = response.text
+        def call(bound_model):
+            response = bound_model.generate_content([prompt, image])
+            return response.text, llm_calls.usage_tokens(response)
+        response_text = call_gemini_limited(model, estimate_tokens(prompt) + IMAGE_TOKENS, call)
+        if response_text.startswith("Errore"):
+            st.error(response_text)
+            return {}
         
         # Cleanup Markdown
         cleaned_text = response_text.replace("```json", "").replace("```", "").strip()
@@ -263,47 +305,78 @@ def scrape_deck_list(deck_url):
         return (f"Errore scraping deck: {e}", [], [], [])
 
 def get_card_data(card_name):
-    # Rimuovi spazi extra per sicurezza
+    """Risolve una singola carta (wrapper di get_cards_data)."""
     card_name = card_name.strip()
-    url = "https://db.ygoprodeck.com/api/v7/cardinfo.php"
-    params = {"fname": card_name}
-    try:
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            # Prende la corrispondenza migliore (spesso la prima è esatta o fuzzy match)
-            return response.json()["data"][0]
-        else:
-            return None
-    except Exception:
-        return None
+    return get_cards_data([card_name]).get(card_name)
+
+def get_cards_data(card_names):
+    """Risolve tutte le carte in blocco: memo di processo, snapshot locale, poi una sola richiesta remota."""
+    return card_catalog.get_cards_data(card_names)
 
 def resolve_working_model():
-    """Tenta automaticamente di trovare un modello funzionante."""
-    candidate_models = [
-        "gemini-2.5-flash",
-        "gemini-2.5-pro",
-        "gemini-2.0-flash",
-        "gemini-flash-latest",
-        "gemini-pro-latest",
-        "gemini-1.5-flash"
-    ]
-    
-    for model_name in candidate_models:
-        try:
-            model = genai.GenerativeModel(model_name)
-            return model, model_name
-        except Exception:
-            continue
-            
-    return genai.GenerativeModel("gemini-2.5-flash"), "gemini-2.5-flash (Default)"
+    """Modello scelto dal router (health check + latenza), condiviso dal processo per la key attiva."""
+    return llm_calls.resolve_model(st.session_state.get("api_key", ""))
 
 
 # --- UTILITY: Streamlit Compatibility Helper ---
-def render_responsive_image(image_url):
+THUMB_PREVIEW_WIDTH = 120  # Anteprime Step 2
+
+def render_responsive_image(image_url, width=None):
+    """Mostra l'immagine dal mirror locale (miniatura se `width`), con fallback all'URL remoto."""
+    image = get_image_cache().get(image_url, width) if image_url else None
+    source = image if image is not None else image_url
     try:
-        st.image(image_url, use_container_width=True)
+        st.image(source, use_container_width=True)
     except TypeError:
-        st.image(image_url, use_column_width=True)
+        st.image(source, use_column_width=True)
+
+def search_card_names(query, limit=20):
+    """Top-k nomi per la query (prefisso + fuzzy, ordinati per popolarità)."""
+    return load_card_matcher().search(query, limit=limit, popularity=load_card_database().popularity)
+
+def card_search_box(target_key, label, placeholder="Cerca una carta (anche in italiano)..."):
+    """
+    Ricerca carte lato server: al browser arrivano solo i risultati della query
+    corrente, non l'intero elenco di ~13k nomi. Le carte scelte vengono aggiunte
+    a st.session_state[target_key].
+    """
+    labels = load_card_labels()
+    query_key = f"{target_key}_query"
+    picks_key = f"{target_key}_picks"
+
+    def add_picks_callback():
+        current = st.session_state.get(target_key, [])
+        for card in st.session_state[picks_key]:
+            if card not in current:
+                current.append(card)
+        st.session_state[target_key] = current
+        # Pulisce ricerca e risultati
+        st.session_state[picks_key] = []
+        st.session_state[query_key] = ""
+
+    query = st.text_input(label, key=query_key, placeholder=placeholder)
+    if query.strip():
+        matches = search_card_names(query)
+        st.multiselect(
+            f"Risultati per '{query.strip()}':",
+            options=matches,
+            key=picks_key,
+            format_func=lambda n: labels.get(n, n),
+            on_change=add_picks_callback,
+            placeholder="Scegli una o più carte..." if matches else "Nessuna carta trovata."
+        )
+
+def render_deck_section(cards):
+    """Una sezione di decklist come singola immagine composta (con nome carta al passaggio del mouse)."""
+    image_url, image_bytes, hotspots = deck_renderer.render_section(cards)
+    if image_url:
+        st.markdown(deck_renderer.section_html(image_url, hotspots), unsafe_allow_html=True)
+    elif image_bytes:
+        # Immagini carta non scaricate (segnaposto): render non salvato, quindi senza URL né link
+        try:
+            st.image(image_bytes, use_container_width=True)
+        except TypeError:
+            st.image(image_bytes, use_column_width=True)
 
 # --- Gestione Autenticazione ---
 def load_keys():
@@ -358,6 +431,16 @@ if stored_keys:
         st.session_state.api_key = ""
         st.session_state.active_profile = ""
 
+    # Modalità pool: le chiamate ruotano su tutte le key configurate
+    if len(stored_keys) >= 2:
+        if "key_pool_enabled" not in st.session_state:
+            st.session_state.key_pool_enabled = os.getenv("YGO_KEY_POOL", "") == "1"
+        st.sidebar.toggle("🔀 Pool chiavi (round-robin)", key="key_pool_enabled",
+                          help="Distribuisce le chiamate su tutti i profili, saltando quelli in cooldown dopo un 429.")
+        if st.session_state.key_pool_enabled and not st.session_state.api_key:
+            st.session_state.api_key = next(iter(stored_keys.values()))
+            st.session_state.active_profile = "🔀 Pool"
+
 # Se non ci sono chiavi salvate o siamo in "Manuale", usiamo la logica standard
 if not stored_keys or (st.session_state.get("active_profile") == "🔑 Inserimento Manuale") or (not st.session_state.api_key and "active_profile" not in st.session_state):
     
@@ -382,20 +465,63 @@ if not stored_keys or (st.session_state.get("active_profile") == "🔑 Inserimen
             if os.path.exists(".env"): os.remove(".env") # Opzionale: pulizia
             st.rerun()
 
+elif st.session_state.get("key_pool_enabled") and len(stored_keys) >= 2:
+     st.sidebar.success(f"Pool attivo: **{len(stored_keys)} key** ✅")
+     for key_name, cooling, calls, errors in get_key_pool(stored_keys).status():
+         state = f"⏸️ cooldown {cooling:.0f}s" if cooling > 0 else "🟢"
+         key_limiter = get_rate_limiter(stored_keys[key_name])
+         st.sidebar.caption(f"{state} {key_name} · {calls} chiamate · {errors}× 429 · "
+                            f"{key_limiter.queue_depth} in coda · ~{key_limiter.expected_wait():.0f}s")
+
 elif st.session_state.api_key:
      st.sidebar.success(f"Profilo Attivo: **{selected_profile}** ✅")
 
+if get_provider().name == "stub":
+    # Provider locale (benchmark / load test): nessuna key reale necessaria
+    st.session_state.api_key = st.session_state.api_key or "stub"
+    st.sidebar.warning("🧪 Provider LLM stub attivo: risposte simulate, nessuna chiamata a Gemini.")
+
 if not st.session_state.api_key:
     st.info("👈 Seleziona un Profilo o inserisci una Key per iniziare.")
     st.stop()
 
 # --- Configurazione Gemini ---
+# Nessun genai.configure globale: ogni key ha il suo client, condiviso dal processo
 try:
-    genai.configure(api_key=st.session_state.api_key)
+    get_provider().validate_key(st.session_state.api_key)
 except Exception as e:
     st.error(f"Errore critico di configurazione: {e}")
     st.stop()
 
+_limiter = current_rate_limiter()
+if active_key_pool() is None:
+    st.sidebar.caption(
+        f"🚦 Gemini: {_limiter.queue_depth} in coda · attesa stimata {_limiter.expected_wait():.0f}s "
+        f"· budget {_limiter.rpm} RPM / {_limiter.tpm // 1000}k TPM"
+    )
+else:
+    # In modalità pool coda e attesa sono per key (elenco del pool sopra)
+    st.sidebar.caption(f"🚦 Gemini: budget {_limiter.rpm} RPM / {_limiter.tpm // 1000}k TPM per key")
+
+with st.sidebar.expander("📡 Stato Modelli"):
+    _router = get_model_router(st.session_state.api_key)
+    for _name, _summary in _router.stats().items():
+        if not _summary["samples"]:
+            continue
+        _p50 = _summary["call_p50"] or _summary["probe_p50"]
+        _p95 = _summary["call_p95"] or _summary["probe_p95"]
+        _lat = f"p50 {_p50:.1f}s · p95 {_p95:.1f}s" if _p50 is not None else "nessuna risposta"
+        _mark = "🟢" if _router.is_healthy(_name) else "🔴"
+        st.caption(f"{_mark} {_name}: {_lat} · errori {_summary['error_rate']:.0%}")
+
+with st.sidebar.expander("📏 Dimensione Prompt"):
+    _prompt_stats = prompt_stats()
+    if not _prompt_stats:
+        st.caption("Nessun prompt inviato finora.")
+    for _kind, _s in _prompt_stats.items():
+        st.caption(f"{_kind}: {_s['calls']} chiamate · media ~{_s['avg_tokens']} · max ~{_s['max_tokens']} token"
+                   f" · ridotti {_s['reduced']}")
+
 # --- Navigazione Modalità ---
 st.sidebar.markdown("---")
 st.sidebar.subheader("📱 Modalità")
@@ -406,15 +532,19 @@ if mode == "👨‍⚖️ AI Judge":
     st.title("AI Yu-Gi-Oh! Judge ⚖️")
     st.markdown("### Il tuo assistente per i ruling complessi")
 
-    # Inizializza modello standard per Judge
-    model, active_model_name = resolve_working_model()
-    st.sidebar.caption(f"🤖 Modello Judge: `{active_model_name}`")
+    # Il modello del Judge si sceglie allo Step 3 e resta fissato in step3_context:
+    # nessuna risoluzione del modello a ogni rerun
+    if st.session_state.get("step3_context"):
+        st.sidebar.caption(f"🤖 Modello Judge: `{st.session_state.step3_context['model_name']}`")
 
 
 
 
-    # Caricamento database carte (avviene una volta sola all'avvio)
+    # Caricamento database carte (una volta per processo, condiviso tra sessioni)
     all_card_names = load_all_card_names()
+    catalog = load_card_database()
+    st.sidebar.caption(f"🗂️ Catalogo: {len(catalog)} carte · {catalog.memory_footprint() / 1e6:.1f} MB per processo")
+    card_labels = load_card_labels()
 
     # --- State Management Judge ---
     if "step" not in st.session_state:
@@ -432,7 +562,7 @@ if mode == "👨‍⚖️ AI Judge":
 
     # Funzione per reset Judge
     def reset_judge():
-        keys_to_keep = ['api_key', 'active_profile']
+        keys_to_keep = ['api_key', 'active_profile', 'key_pool_enabled']
         for key in list(st.session_state.keys()):
             if key in keys_to_keep: continue
             del st.session_state[key]
@@ -447,6 +577,7 @@ if mode == "👨‍⚖️ AI Judge":
         st.session_state.verdict_ready = False
         st.session_state.verdict_short = ""
         st.session_state.verdict_deep = ""
+        st.session_state.similar_verdict_declined = False
         
         st.rerun()
 
@@ -460,17 +591,21 @@ if mode == "👨‍⚖️ AI Judge":
         st.caption("Usa questo box per trovare i nomi ufficiali sicuri al 100%:")
         
         # Persistence Logic: Pre-fill if returning from Step 2
-        default_cards = st.session_state.get("detected_cards", [])
-        # Filter to ensure they are in options (safety check)
-        default_cards = [c for c in default_cards if c in all_card_names]
+        if "step1_cards" not in st.session_state:
+            # Filter to ensure they are official names (safety check)
+            st.session_state.step1_cards = [c for c in st.session_state.get("detected_cards", []) if c in catalog]
+        
+        card_search_box("step1_cards", "Cerca Carta:", placeholder="Scrivi 'Ash Blossom', 'Cenere Fiorita', 'Nibiru'...")
         
+        # Solo le carte già scelte come opzioni: il payload non dipende dalla dimensione del catalogo
         manual_selection = st.multiselect(
             "Carte Coinvolte:", 
-            options=all_card_names,
-            default=default_cards,
-            placeholder="Scrivi 'Ash Blossom', 'Nibiru'...",
-            key="search_multiselect"
+            options=st.session_state.step1_cards,
+            default=st.session_state.step1_cards,
+            format_func=lambda n: card_labels.get(n, n),
+            placeholder="Nessuna carta selezionata."
         )
+        st.session_state.step1_cards = manual_selection
 
         st.subheader("2. Descrivi Scenario")
         question_input = st.text_area(
@@ -514,20 +649,20 @@ if mode == "👨‍⚖️ AI Judge":
                                      situation_desc = vision_data.get("situation", "")
                              
                              # --- FUZZY MATCHING CORRECTION ---
-                             import difflib
+                             card_matcher = load_card_matcher()
                              vision_cards_corrected = []
                              
                              if vision_cards:
                                  for raw_name in vision_cards:
                                      # Try exact match first
-                                     if raw_name in all_card_names:
+                                     if raw_name in catalog:
                                          vision_cards_corrected.append(raw_name)
                                      else:
                                          # Try Fuzzy Match
-                                         matches = difflib.get_close_matches(raw_name, all_card_names, n=1, cutoff=0.5)
-                                         if matches:
-                                             st.toast(f"Corretto: {raw_name} -> {matches[0]}")
-                                             vision_cards_corrected.append(matches[0])
+                                         match = card_matcher.best_match(raw_name, cutoff=0.5)
+                                         if match:
+                                             st.toast(f"Corretto: {raw_name} -> {match}")
+                                             vision_cards_corrected.append(match)
                                          else:
                                              vision_cards_corrected.append(raw_name)
                                  vision_cards = vision_cards_corrected
@@ -559,8 +694,12 @@ if mode == "👨‍⚖️ AI Judge":
                 if not manual_selection and not question_input:
                      st.warning("Scrivi qualcosa o seleziona una carta.")
                 else:
+                     # Carte citate nel testo (locale; Gemini solo se non è stata scelta nessuna carta)
+                     text_cards = []
+                     if question_input:
+                         text_cards = extract_cards(question_input, allow_llm_fallback=not manual_selection)
                      st.session_state.question_text = question_input
-                     st.session_state.detected_cards = list(set(manual_selection))
+                     st.session_state.detected_cards = list(dict.fromkeys(manual_selection + text_cards))
                      st.session_state.step = 2
                      st.rerun()
 
@@ -573,34 +712,15 @@ if mode == "👨‍⚖️ AI Judge":
         st.divider()
         st.subheader("🛠 Busta Carte")
         
-        # --- CALLBACK LOGIC START ---
-        def add_cards_callback():
-            """Adds selected cards to the main list and clears the widget."""
-            new_selection = st.session_state.step2_multiselect
-            current_cards = st.session_state.detected_cards
-            
-            # Add unique new cards
-            for card in new_selection:
-                if card not in current_cards:
-                    current_cards.append(card)
-                    # Optional: Toast feedback
-                    # st.toast(f"Aggiunto: {card}")
-            
-            # Update main list
-            st.session_state.detected_cards = current_cards
-            # Clear the widget
-            st.session_state.step2_multiselect = []
-
-        # --- CALLBACK LOGIC END ---
-        
         final_cards_list = []
+        previews = get_cards_data(st.session_state.detected_cards)
         
         for i, card in enumerate(st.session_state.detected_cards):
             col_img, col_input = st.columns([0.15, 0.85])
-            preview_data = get_card_data(card)
+            preview_data = previews.get(card.strip())
             with col_img:
                 if preview_data and "card_images" in preview_data:
-                    render_responsive_image(preview_data["card_images"][0]["image_url_small"])
+                    render_responsive_image(preview_data["card_images"][0]["image_url_small"], THUMB_PREVIEW_WIDTH)
                 else:
                     st.write("🖼️")
             with col_input:
@@ -615,12 +735,7 @@ if mode == "👨‍⚖️ AI Judge":
                # Add a "Remove" button per card? (Out of scope for now, but good for future)
 
         # Dynamic Add Box
-        st.multiselect(
-            "Aggiungi altre carte (si sposteranno sopra dopo l'invio):", 
-            options=all_card_names, 
-            key="step2_multiselect",
-            on_change=add_cards_callback  # This triggers the "Action"
-        )
+        card_search_box("detected_cards", "Aggiungi altre carte (si sposteranno sopra dopo l'invio):")
         
         st.divider()
         
@@ -628,6 +743,7 @@ if mode == "👨‍⚖️ AI Judge":
         col_back, col_confirm = st.columns([1, 1])
         with col_back:
             if st.button("🔙 Modifica Domanda", use_container_width=True):
+                st.session_state.step1_cards = [c for c in st.session_state.detected_cards if c in catalog]
                 st.session_state.step = 1
                 st.rerun()
                 
@@ -636,6 +752,7 @@ if mode == "👨‍⚖️ AI Judge":
                 # Now we just need to save the edits from the text inputs
                 clean_list = list(set([c.strip() for c in final_cards_list if c.strip()]))
                 st.session_state.detected_cards = clean_list
+                st.session_state.similar_verdict_declined = False
                 st.session_state.step = 3
                 st.rerun()
 
@@ -643,124 +760,131 @@ if mode == "👨‍⚖️ AI Judge":
     elif st.session_state.step == 3:
         st.subheader("⚖️ Verdetto del Giudice")
         
-        found_cards_data = []
-        cards_context = ""
-        missing_cards = []
-
-        with st.status("Consultazione Database Ufficiale...", expanded=True):
-            progress_bar = st.progress(0)
-            total_cards = len(st.session_state.detected_cards)
-            
-            for idx, card_name in enumerate(st.session_state.detected_cards):
-                st.write(f"🔍 Cerco: **{card_name}**...")
-                card_data = get_card_data(card_name)
+        # Contesto carte + modello fissati in sessione: i rerun del follow-up
+        # (chat_input) non rifanno lookup né scelta del modello.
+        cards_signature = tuple(st.session_state.detected_cards)
+        step3_context = st.session_state.get("step3_context")
+        
+        if step3_context is None or step3_context["cards"] != cards_signature:
+            found_cards_data = []
+            cards_context = ""
+            missing_cards = []
+
+            with st.status("Consultazione Database Ufficiale...", expanded=True):
+                progress_bar = st.progress(0)
+                total_cards = len(st.session_state.detected_cards)
+                resolved_cards = get_cards_data(st.session_state.detected_cards)
                 
-                if card_data:
-                    found_cards_data.append(card_data)
-                    # FIX: Add ATK/DEF/Type to context for accurate stat rulings
-                    c_type = card_data.get('type', 'Unknown')
-                    c_atk = f"ATK: {card_data.get('atk', '?')}" if 'Monster' in c_type else ""
-                    c_def = f"DEF: {card_data.get('def', '?')}" if 'Monster' in c_type else ""
-                    c_stats = f"[{c_type} | {c_atk} {c_def}]".replace("  ", " ").strip()
+                for idx, card_name in enumerate(st.session_state.detected_cards):
+                    st.write(f"🔍 Cerco: **{card_name}**...")
+                    card_data = resolved_cards.get(card_name.strip())
+                    
+                    if card_data:
+                        found_cards_data.append(card_data)
+                        cards_context += card_context_entry(card_data)
+                        st.success(f"✅ Trovata: {card_data['name']}")
+                    else:
+                        missing_cards.append(card_name)
+                        st.error(f"❌ Non trovata: {card_name}")
                     
-                    cards_context += f"NOME UFFICIALE: {card_data['name']}\nDATI: {c_stats}\nTESTO AGGIORNATO: {card_data['desc']}\n\n"
+                    if total_cards > 0:
+                        progress_bar.progress((idx + 1) / total_cards)
+
+            # 4. Generazione Verdetto (CACHE o NUOVO)
+            judge_model, model_name = resolve_working_model()
+            step3_context = {
+                "cards": cards_signature,
+                "found": found_cards_data,
+                "missing": missing_cards,
+                "cards_context": cards_context,
+                "model": judge_model,
+                "model_name": model_name,
+            }
+            st.session_state.step3_context = step3_context
+        else:
+            found_cards_data = step3_context["found"]
+            missing_cards = step3_context["missing"]
+            cards_context = step3_context["cards_context"]
+            judge_model, model_name = step3_context["model"], step3_context["model_name"]
+            with st.status(f"Database Ufficiale: {len(found_cards_data)} carte trovate", state="complete", expanded=False):
+                for card_data in found_cards_data:
                     st.success(f"✅ Trovata: {card_data['name']}")
-                else:
-                    missing_cards.append(card_name)
+                for card_name in missing_cards:
                     st.error(f"❌ Non trovata: {card_name}")
-                
-                if total_cards > 0:
-                    progress_bar.progress((idx + 1) / total_cards)
         
         # PERSIST DATA FOR BUTTONS
         st.session_state.found_cards_cache = found_cards_data      
-
-        # 4. Generazione Verdetto (CACHE o NUOVO)
-        # MOVED OUTSIDE FOR SCOPE SAFETY
-        judge_model, model_name = resolve_working_model()
         
         if not st.session_state.get("verdict_ready", False):
-             with st.spinner("Generazione verdetto in corso..."):
-                 
-                 # RULING UFFICIALI AGGIUNTIVE
-                 extra_rulings_db = """
- Q: Both players control a face-up Mirrorjade the Iceblade Dragon. Can I activate Mind Control targeting my opponent's copy of Mirrorjade? If yes, what happens when it resolves?
- A: You can activate Mind Control. If you still control a face-up Mirrorjade when Mind Control resolves, you take control of your opponent's Mirrorjade, and it is then immediately destroyed.
-                 
- Q: I control a face-up Mirrorjade the Iceblade Dragon. Can I use Polymerization to Fusion Summon another copy of Mirrorjade the Iceblade Dragon, using the copy on my field as material?
- A: No, you cannot. You can only control 1 face-up "Mirrorjade the Iceblade Dragon", and cannot attempt to Summon another copy if you already do.
- 
- Q: If Mirrorjade's Quick Effect is negated, or its activation is negated, can that Mirrorjade use that effect again the next turn?
- A: Yes. This card cannot use this effect next turn is part of Mirrorjade's effect. If Mirrorjade's effect, or its activation, is negated, the entire effect is not applied, including that part.
- 
- Q: I activate Mirrorjade's Quick Effect. In response, the effect of my opponent's Destiny HERO - Destroyer Phoenix Enforcer resolves, destroying both it and another card on my field. If Mirrorjade is the only monster on the field when its Quick Effect resolves, what happens?
- A: When Mirrorjade's effect resolves, you must attempt to banish a monster on the field. If Mirrorjade is the only monster on the field that you can attempt to banish, you must banish Mirrorjade itself.
- """
-     
-                 prompt_ruling = f"""
-                 Sei un **HEAD JUDGE UFFICIALE DI YU-GI-OH** (Livello 3).
-                 Il tuo compito è emettere ruling tecnici estremamente precisi e pignoli.
-         
-                REGOLAMENTO CRITICO (PSCT - Problem Solving Card Text):
-                - **ALGORITMO PUNTEGGIATURA**: Scansiona il testo carattere per carattere. Cerchi i "due punti" (:).
-                - **SE C'È IL DUE PUNTI (:)**: L'effetto SI ATTIVA (Starts a Chain). È un effetto Innescato o Rapido. NON è inerente. (Esempio: "If you control...: You can Special Summon...").
-                - **SE NON C'È**: Solo se mancano sia : che ; allora è un'Evocazione Inerente (Non-Activated).
-                - **Damage Step**: Sii ESTREMAMENTE severo. Solo carte che modificano direttamente ATK/DEF, Counter Traps, o effetti che negano specificamente *l'attivazione* (non l'effetto) possono essere attivate qui.
-                - **Condizioni di Gioco (Game State)**: Verifica sempre se l'azione è permessa dallo stato attuale del gioco.
-                - **Statistiche & Floodgate**: PRIMA di giudicare, calcola l'ATK/DEF attuale considerando Magie/Trappole continue in campo (es: carte che aumentano ATK). Controlla se esistono Floodgate attivi (es: "Super Starslayer TY-PHON - Sky Crisis", "Bagooska") che inibiscono l'attivazione in base a queste stats *modificate*.
-         
-                 TESTI UFFICIALI (Fonte di Verità):
-                 ---
-                 {cards_context}
-                 ---
-                 
-                 DATABASE RULING EXTRA (PRECEDENZA ASSOLUTA):
-                 {extra_rulings_db}
-                 ---
-         
-                 SCENARIO UTENTE:
-                 "{st.session_state.question_text}"
-                 
-                 ISTRUZIONI:
-                 1. Analizza lo scenario cercando cavilli legali.
-                 2. Se la mossa è illegale, dillo chiaramente.
-                 3. RAGIONA PASSO-PASSO prima di rispondere.
-                 
-                 FORMATO RISPOSTA RICHIESTO:
-                 Devi dividere la risposta in due parti separate da una riga con scritto esattamente "---DETTAGLI---".
-                 
-                 Parte 1 (Prima di ---DETTAGLI---):
-                 - Risposta diretta e concisa (es: "Sì, legale" oppure "No, mossa illegale").
-                 
-                 ---DETTAGLI---
-                 
-                 Parte 2 (Dopo ---DETTAGLI---):
-                 - Analisi tecnica step-by-step.
-                 - Cita le regole del Damage Step se rilevante.
-                 """
-                 
-                 response = get_gemini_response(judge_model, prompt_ruling)
-                 
-                 if "---DETTAGLI---" in response:
-                     short_answer, deep_dive = response.split("---DETTAGLI---")
-                 else:
-                     short_answer = response
-                     deep_dive = "Nessun dettaglio tecnico aggiuntivo fornito."
-                     
-                 # SALVA IN SESSION STATE
-                 st.session_state.verdict_short = short_answer
-                 st.session_state.verdict_deep = deep_dive
-                 st.session_state.verdict_ready = True
+             # Cache condivisa: stessa combinazione di carte + stessa domanda = verdetto istantaneo
+             verdict_card_ids = card_keys(found_cards_data, missing_cards)
+             extra_rulings = extra_rulings_for(found_cards_data, missing_cards)
+             verdict_rulings = rulings_hash(extra_rulings)
+             verdict_key = make_key(verdict_card_ids, st.session_state.question_text, model_name, JUDGE_PROMPT_VERSION,
+                                    verdict_rulings)
+             verdict_cache = get_verdict_cache()
+             response = verdict_cache.get(verdict_key)
+
+             if response is not None:
+                 st.toast("⚡ Verdetto già emesso per questo scenario (cache).")
+             elif not st.session_state.get("similar_verdict_declined", False):
+                 # Stesse carte, domanda formulata diversamente: proponi il verdetto già emesso
+                 similar = verdict_cache.find_similar(verdict_card_ids, st.session_state.question_text,
+                                                      model_name, JUDGE_PROMPT_VERSION, verdict_rulings)
+                 if similar:
+                     st.info(f"♻️ Domanda molto simile già giudicata (somiglianza {similar['similarity']:.0%}):\n\n> {similar['scenario']}")
+                     col_reuse, col_new = st.columns(2)
+                     if col_reuse.button("✅ Usa questo verdetto", use_container_width=True):
+                         verdict_cache.touch(similar["key"])
+                         response = similar["response"]
+                     elif col_new.button("⚖️ Genera nuovo verdetto", use_container_width=True):
+                         st.session_state.similar_verdict_declined = True
+                     else:
+                         st.stop()
+
+        # Cornice del verdetto: in streaming si riempie mentre il modello scrive
+        verdict_streaming = not st.session_state.get("verdict_ready", False) and response is None
+        st.success(f"Verdetto Rapido (Model: {model_name}):")
+        short_slot = st.empty()
+        with st.expander("🧐 Spiegazione Tecnica Approfondita", expanded=verdict_streaming):
+            deep_slot = st.empty()
+
+        if verdict_streaming:
+                 short_slot.info("⏳ Generazione verdetto in corso...")
                  
+                 prompt_ruling = build_judge_prompt(cards_context, st.session_state.question_text,
+                                                    extra_rulings, model_name)
+
+                 def render_partial_verdict(text):
+                     # Il verdetto breve appare appena arriva il separatore, poi scorrono i dettagli
+                     partial_short, partial_deep = split_verdict(text)
+                     if partial_deep is None:
+                         short_slot.markdown(partial_short + "▌")
+                     else:
+                         short_slot.markdown(partial_short)
+                         deep_slot.markdown(partial_deep.strip() + "▌")
+
+                 response = stream_gemini_response(judge_model, prompt_ruling, render_partial_verdict)
+                 if not response.startswith("Errore"):
+                     verdict_cache.put(verdict_key, response, verdict_card_ids, st.session_state.question_text,
+                                       model_name, JUDGE_PROMPT_VERSION, verdict_rulings)
+
+        if not st.session_state.get("verdict_ready", False):
+            short_answer, deep_dive = split_verdict(response)
+            if deep_dive is None:
+                deep_dive = "Nessun dettaglio tecnico aggiuntivo fornito."
+                
+            # SALVA IN SESSION STATE
+            st.session_state.verdict_short = short_answer
+            st.session_state.verdict_deep = deep_dive
+            st.session_state.verdict_ready = True
+            
         # LEGGI DA SESSION STATE
         short_answer = st.session_state.verdict_short
         deep_dive = st.session_state.verdict_deep
     
-        st.success(f"Verdetto Rapido (Model: {model_name}):")
-        st.markdown(short_answer)
-        
-        with st.expander("🧐 Spiegazione Tecnica Approfondita"):
-            st.markdown(deep_dive.strip())
+        short_slot.markdown(short_answer)
+        deep_slot.markdown(deep_dive.strip())
 
         # --- CHAT CONTESTUALE ---
         st.divider()
@@ -781,21 +905,14 @@ if mode == "👨‍⚖️ AI Judge":
             
             # Genera risposta
             with st.chat_message("assistant"):
-                with st.spinner("Consultando il regolamento..."):
-                    context_full = f"""
-                    CONTESTO CARTE:
-                    {cards_context}
-                    
-                    VERDETTO PRECEDENTE:
-                    {short_answer}
-                    {deep_dive}
-                    
-                    DOMANDA UTENTE:
-                    {detail_prompt}
-                    """
-                    followup_resp = get_gemini_response(judge_model, context_full)
-                    st.markdown(followup_resp)
-                    st.session_state.judge_chat_history.append({"role": "assistant", "content": followup_resp})
+                context_full = build_followup_prompt(cards_context, f"{short_answer}\n{deep_dive}", detail_prompt, model_name)
+                followup_slot = st.empty()
+                followup_slot.markdown("⏳ Consultando il regolamento...")
+                followup_resp = stream_gemini_response(
+                    judge_model, context_full, lambda text: followup_slot.markdown(text + "▌")
+                )
+                followup_slot.markdown(followup_resp)
+                st.session_state.judge_chat_history.append({"role": "assistant", "content": followup_resp})
 
         # --- ACTIONS FOOTER ---
         st.divider()
@@ -873,55 +990,25 @@ if mode == "👨‍⚖️ AI Judge":
                                      
                                      # --- NEW: AUTO-REEVALUATION ---
                                      st.markdown("### 🧠 Rivalutazione con Ruling OCG...")
-                                     with st.spinner("Il Giudice sta rileggendo il caso alla luce dei nuovi ruling..."):
-                                         try:
-                                             # Re-construct context from session state
-                                             cards_context_reval = ""
-                                             cached_cards = st.session_state.get("found_cards_cache", [])
-                                             for c in cached_cards:
-                                                  cards_context_reval += f"NOME UFFICIALE: {c['name']}\nTESTO: {c['desc']}\n\n"
-                                             
-                                             judge_model, model_name = resolve_working_model()
-                                             
-                                             reval_prompt = f"""
-                                             SEI UN HEAD JUDGE DI YU-GI-OH.
-                                             
-                                             SITUAZIONE PRECEDENTE:
-                                             Hai dato un verdetto su una domanda dell'utente.
-                                             Tuttavia, sono stati appena trovati dei **RULING UFFICIALI OCG (Giapponesi)** specifici per questo caso.
-                                             
-                                             I ruling OCG hanno la precedenza tecnica su qualsiasi logica generale.
-                                             
-                                             TESTO CARTE:
-                                             {cards_context_reval}
-                                             
-                                             NUOVI RULING TROVATI (EVIDENZA CRITICA):
-                                             ---
-                                             {final_ruling_text}
-                                             ---
-                                             
-                                             DOMANDA UTENTE:
-                                             "{st.session_state.question_text}"
-                                             
-                                             COMPITO:
-                                             1. Leggi attentamente i nuovi ruling trovati.
-                                             2. Se contraddicono la tua logica precedente, AMMETTILO e correggi il verdetto.
-                                             3. Se confermano la tua logica, usali come prova definitiva.
-                                             4. Fornisci un verdetto finale SINTETICO ma TECNICO.
-                                             
-                                             FORMATO RISPOSTA:
-                                             "Verdetto Aggiornato: [Sì/No/Dipende]"
-                                             "Spiegazione: [Spiegazione tecnica citando il ruling]"
-                                             """
-                                             
-                                             reval_response = judge_model.generate_content(reval_prompt)
-                                             
-                                             st.success("Verdetto Aggiornato (Basato su OCG):")
-                                             st.write(reval_response.text)
+                                     try:
+                                         # Stesso modello e stesso contesto carte del verdetto (fissati in step3_context)
+                                         reval_context = st.session_state.step3_context
+                                         reval_prompt = build_ocg_reval_prompt(reval_context["cards_context"], final_ruling_text,
+                                                                               st.session_state.question_text,
+                                                                               reval_context["model_name"])
+                                         
+                                         st.success("Verdetto Aggiornato (Basato su OCG):")
+                                         reval_slot = st.empty()
+                                         reval_slot.markdown("⏳ Il Giudice sta rileggendo il caso alla luce dei nuovi ruling...")
+                                         reval_text = stream_gemini_response(
+                                             reval_context["model"], reval_prompt, lambda text: reval_slot.markdown(text + "▌")
+                                         )
+                                         reval_slot.markdown(reval_text)
+                                         if not reval_text.startswith("Errore"):
                                              st.toast("Verdetto aggiornato con successo!")
-                                             
-                                         except Exception as reval_e:
-                                             st.error(f"Errore durante la rivalutazione: {reval_e}")
+                                         
+                                     except Exception as reval_e:
+                                         st.error(f"Errore durante la rivalutazione: {reval_e}")
 
 
 
@@ -1204,22 +1291,27 @@ elif mode == "📊 Meta Analyst":
                     all_processed_items_global = st.session_state.batch_results
                     
                     # 2. Build Context
-                    premier_text = "=== 🏆 PREMIER EVENTS (YCS, WCQ, CHAMPIONSHIPS) ===\n"
-                    regional_text = "=== 🌍 REGIONAL / MAJOR EVENTS ===\n"
-                    other_text = "=== 🏠 LOCALS / OTHER ===\n"
+                    premier_entries = ["=== 🏆 PREMIER EVENTS (YCS, WCQ, CHAMPIONSHIPS) ===\n"]
+                    regional_entries = ["=== 🌍 REGIONAL / MAJOR EVENTS ===\n"]
+                    other_entries = ["=== 🏠 LOCALS / OTHER ===\n"]
+                    
+                    # Liste compatte: core list per archetipo + delta di ogni mazzo (vedi deck_delta)
+                    cores_text, compact_details = deck_delta.encode_report_items(all_processed_items_global)
                     
-                    for item in all_processed_items_global:
+                    for item, details in zip(all_processed_items_global, compact_details):
                         source = item.get('event_source', '').lower()
-                        entry = f"- {item.get('place','?')}: {item.get('player','?')} -> {item.get('deck_text','?')} (Event: {item.get('event_source','?')}){item.get('details','')}\n"
+                        entry = f"- {item.get('place','?')}: {item.get('player','?')} -> {item.get('deck_text','?')} (Event: {item.get('event_source','?')}){details}\n"
                         
                         if "ycs" in source or "championship" in source or "wcq" in source:
-                            premier_text += entry
+                            premier_entries.append(entry)
                         elif "regional" in source or "major" in source:
-                            regional_text += entry
+                            regional_entries.append(entry)
                         else:
-                            other_text += entry
+                            other_entries.append(entry)
+                    premier_text, regional_text, other_text = ("".join(e) for e in (premier_entries, regional_entries, other_entries))
                     
-                    aggregated_text = f"DATA REPORT: {datetime.now().strftime('%d %B %Y')}\nFONTE: YGOProDeck (Recenti)\n\n" + f"\n{premier_text}\n{regional_text}\n{other_text}"
+                    cores_section = f"=== 🧬 CORE LIST ARCHETIPI (i mazzi sotto sono delta rispetto a queste) ===\n{cores_text}\n" if cores_text else ""
+                    aggregated_text = f"DATA REPORT: {datetime.now().strftime('%d %B %Y')}\nFONTE: YGOProDeck (Recenti)\n\n" + f"{cores_section}\n{premier_text}\n{regional_text}\n{other_text}"
                     
                     st.session_state.meta_context = aggregated_text
                     st.session_state.meta_last_update = datetime.now().strftime("%H:%M")
@@ -1526,25 +1618,17 @@ elif mode == "📊 Meta Analyst":
                                         sections[current_section].append({"name": name, "url": url})
                                 except: pass
                         
-                        # RENDER GRID
-                        if "card_db" not in st.session_state:
-                             st.session_state.card_db = load_card_database()
-                        db = st.session_state.card_db
+                        # RENDER GRID (una sola immagine composta per sezione)
+                        db = load_card_database()
+                        deck_export_sections = []
 
                         for sec_name, cards in sections.items():
                             if cards:
                                 
                                 # 1. MAIN DECK & SIDE DECK: Split by Type
                                 if sec_name in ["Main Deck", "Side Deck"]:
-                                    monsters = []
-                                    spells = []
-                                    traps = []
-                                    
-                                    for card in cards:
-                                        c_type = db.get(card['name'], "Monster") # Default to Monster
-                                        if "Spell" in c_type: spells.append(card)
-                                        elif "Trap" in c_type: traps.append(card)
-                                        else: monsters.append(card)
+                                    # Categorie precalcolate all'ingest (Default: Mostro)
+                                    monsters, spells, traps = db.split_main_deck(cards, key=lambda c: c['name'])
                                     
                                     # Render Sub-grids with Headers
                                     sub_sections = [("Mostri", monsters), ("Magie", spells), ("Trappole", traps)]
@@ -1553,46 +1637,38 @@ elif mode == "📊 Meta Analyst":
                                     for sub_name, sub_cards in sub_sections:
                                         if sub_cards:
                                             st.markdown(f"**{sub_name}** ({len(sub_cards)})")
-                                            cols = st.columns(8)
-                                            for i, card in enumerate(sub_cards):
-                                                col_idx = i % 8
-                                                with cols[col_idx]:
-                                                    render_responsive_image(card['url'])
+                                            render_deck_section(sub_cards)
+                                            deck_export_sections.append((f"{sec_name} - {sub_name} ({len(sub_cards)})", sub_cards))
                                 
                                 # 2. EXTRA DECK: Sort by Type (Fused together)
                                 elif sec_name == "Extra Deck":
-                                    # Custom Sort Order
-                                    def get_extra_sort_index(card):
-                                        c_type = db.get(card['name'], "").lower()
-                                        if "fusion" in c_type: return 0
-                                        if "synchro" in c_type: return 1
-                                        if "xyz" in c_type: return 2
-                                        if "link" in c_type: return 3
-                                        return 4
-                                    
-                                    cards.sort(key=get_extra_sort_index)
+                                    # Custom Sort Order: Fusion, Synchro, XYZ, Link
+                                    cards.sort(key=lambda card: card_catalog.extra_deck_sort_index(db.category_of(card['name'])))
                                     
                                     st.markdown(f"##### {sec_name} ({len(cards)})")
-                                    cols = st.columns(8)
-                                    for i, card in enumerate(cards):
-                                        col_idx = i % 8
-                                        with cols[col_idx]:
-                                            render_responsive_image(card['url'])
+                                    render_deck_section(cards)
+                                    deck_export_sections.append((f"{sec_name} ({len(cards)})", cards))
                                 
                                 else:
                                     # Fallback
                                     st.markdown(f"##### {sec_name} ({len(cards)})")
-                                    cols = st.columns(8)
-                                    for i, card in enumerate(cards):
-                                         with cols[i % 8]:
-                                             render_responsive_image(card['url'])
+                                    render_deck_section(cards)
+                                    deck_export_sections.append((f"{sec_name} ({len(cards)})", cards))
+
+                        # Export immagine unica del mazzo (condivisibile)
+                        deck_image = deck_renderer.render_deck(deck_export_sections)
+                        if deck_image:
+                            st.download_button(
+                                "🖼️ Scarica Immagine Decklist",
+                                data=deck_image,
+                                file_name=f"{item.get('deck_text', 'deck')}_{item.get('player', '')}.jpg".replace(" ", "_"),
+                                mime="image/jpeg"
+                            )
                         
                         # Fallback Text (Formatted for Print)
                         st.markdown("#### 📋 Copia Lista Testuale")
                         if True: # Removed nested expander
-                            if "card_db" not in st.session_state:
-                                 st.session_state.card_db = load_card_database()
-                            db = st.session_state.card_db
+                            db = load_card_database()
                             
                             # Re-bucket just for printing text (deduplicated)
                             from collections import Counter
@@ -1606,10 +1682,7 @@ elif mode == "📊 Meta Analyst":
 
                             print_text = ""
                             # Main
-                            m_cards = [c for c in sections["Main Deck"]]
-                            monsters = [c for c in m_cards if "Spell" not in db.get(c['name'], "Monster") and "Trap" not in db.get(c['name'], "Monster")]
-                            spells = [c for c in m_cards if "Spell" in db.get(c['name'], "")]
-                            traps = [c for c in m_cards if "Trap" in db.get(c['name'], "")]
+                            monsters, spells, traps = db.split_main_deck(sections["Main Deck"], key=lambda c: c['name'])
                             
                             print_text += format_section(monsters, "Monsters")
                             print_text += format_section(spells, "Spells")
@@ -1665,6 +1738,8 @@ elif mode == "📊 Meta Analyst":
                         aggregated_text += f"=== MAIN DECK TECHS ===\n{str(data['techs'])}\n\n"
                         aggregated_text += f"=== SIDE DECK STAPLES ===\n{str(data['side'])}\n"
                         st.session_state.meta_context = aggregated_text
+                        # Gli item del planner locale devono venire dallo stesso report (mai da una fonte precedente)
+                        st.session_state.meta_all_items_global = []
                         st.session_state.meta_last_update = datetime.now().strftime("%H:%M")
                         
                         # PERSIST STRUCTURED DATA
@@ -1730,6 +1805,8 @@ elif mode == "📊 Meta Analyst":
                         aggregated_text += f"=== T3 (COMPETITIVE) TECHS ===\n{str(data['t3'])}\n"
                         
                         st.session_state.meta_context = aggregated_text
+                        # Gli item del planner locale devono venire dallo stesso report (mai da una fonte precedente)
+                        st.session_state.meta_all_items_global = []
                         st.session_state.meta_last_update = datetime.now().strftime("%H:%M")
                         st.success("🧠 Report Comparativo pronto per l'AI!")
 
@@ -1807,15 +1884,31 @@ elif mode == "📊 Meta Analyst":
                                     aggregated_text += f"COVERAGE GLOBALE: {coverage_report}\n\n"
                                     st.info(coverage_report)
 
+                                    # Core list per archetipo: ogni mazzo entra come delta rispetto alla sua core
+                                    decks_by_archetype = {}
+                                    for deck in all_decks_data:
+                                        arch = (deck.get("deckType") or {}).get("name", "Unknown Deck")
+                                        decks_by_archetype.setdefault(arch, []).append(deck_delta.card_counts(deck.get("main", [])))
+                                    archetype_cores = deck_delta.build_cores(decks_by_archetype)
+                                    if archetype_cores:
+                                        aggregated_text += "=== 🧬 CORE LIST ARCHETIPI (i mazzi sotto sono delta rispetto a queste) ===\n"
+                                        for arch, core in archetype_cores.items():
+                                            aggregated_text += f"- CORE {arch} ({len(decks_by_archetype[arch])} mazzi)\n   Main Deck: {deck_delta.render_cards(core)}\n"
+                                        aggregated_text += "\n=== MAZZI ===\n"
+
                                     # Processing Decks
+                                    deck_blocks = []
                                     for i, deck in enumerate(all_decks_data):
                                         ename = deck.get("_eventName", "Unknown Event")
-                                        parsed_deck = scraper.parse_deck_list(deck)
+                                        parsed_deck = scraper.parse_deck_list(deck, archetype_cores.get((deck.get("deckType") or {}).get("name", "Unknown Deck")))
                                         # Add Event Name to the deck summary
                                         parsed_deck = f"Event: {ename}\n" + parsed_deck
-                                        aggregated_text += f"=== DECK {i+1} ===\n{parsed_deck}\n{'='*30}\n"
+                                        deck_blocks.append(f"=== DECK {i+1} ===\n{parsed_deck}\n{'='*30}\n")
+                                    aggregated_text += "".join(deck_blocks)
                                     
                                     st.session_state.meta_context = aggregated_text
+                                    # Gli item del planner locale devono venire dallo stesso report (mai da una fonte precedente)
+                                    st.session_state.meta_all_items_global = []
                                     st.session_state.meta_last_update = datetime.now().strftime("%H:%M")
                                     
                                     # PERSIST STRUCTURED DATA
@@ -1824,7 +1917,7 @@ elif mode == "📊 Meta Analyst":
                                     from collections import Counter
                                     deck_names = []
                                     for d in all_decks_data:
-                                         d_name = d.get("deckType", {}).get("name", "Unknown Deck")
+                                         d_name = (d.get("deckType") or {}).get("name", "Unknown Deck")
                                          deck_names.append(d_name)
                                     
                                     cnt = Counter(deck_names)
@@ -1841,7 +1934,7 @@ elif mode == "📊 Meta Analyst":
                                             "country": d.get("country", "Global"), # Check if this exists in deck dict, might need to pass it down
                                             "place": d.get("tournamentPlacement", "N/A"),
                                             "player": d.get("author", "Unknown"),
-                                            "deck_text": d.get("deckType", {}).get("name", "Unknown"),
+                                            "deck_text": (d.get("deckType") or {}).get("name", "Unknown"),
                                             "players": 0, # Not readily available in deck dict unless passed down
                                             "event_type": "Other", # Context needed
                                             "details": scraper.parse_deck_list(d), # String format for legacy viewer
@@ -1959,13 +2052,19 @@ elif mode == "📊 Meta Analyst":
             st.session_state.chat_history.append({"role": "assistant", "content": err_msg})
             with st.chat_message("assistant"):
                 st.error(err_msg)
+        elif local_answer := get_meta_query_planner(st.session_state.get("meta_all_items_global", [])).answer(meta_query):
+            # 3a. Domanda statistica: calcolata sul dataset in memoria, senza chiamare il modello
+            with st.chat_message("assistant"):
+                st.markdown(local_answer)
+                st.caption("⚡ Calcolato in locale sui dati dei tornei (nessuna chiamata al modello).")
+            st.session_state.chat_history.append({"role": "assistant", "content": local_answer})
         else:
             # 3. AI Generation
             with st.chat_message("assistant"):
                 placeholder = st.empty()
                 placeholder.markdown("⏳ *Analisi strategica in corso...*")
                 
-                meta_model, _ = resolve_working_model()
+                meta_model, meta_model_name = resolve_working_model()
                 
                 # Construct History Text for Prompt
                 history_text = ""
@@ -1973,11 +2072,18 @@ elif mode == "📊 Meta Analyst":
                     role_label = "UTENTE" if msg["role"] == "user" else "AI"
                     history_text += f"{role_label}: {msg['content']}\n"
 
-                prompt_rag = f"""
+                # Solo i blocchi del report rilevanti per la domanda (+ riepilogo aggregato).
+                # La domanda precedente dell'utente aiuta con i follow-up ("e nel side?").
+                meta_index = get_meta_index(st.session_state.meta_context, st.session_state.get("meta_structured_data"))
+                previous_questions = [m["content"] for m in st.session_state.chat_history[:-1] if m["role"] == "user"][-1:]
+                meta_retrieved, n_retrieved = meta_index.context_for(" ".join(previous_questions + [meta_query]))
+
+                # Budget: prima la domanda, poi i dati recuperati, la cronologia si accorcia dall'inizio
+                prompt_rag = compile_prompt("meta_rag", """
                 Sei un esperto di Yu-Gi-Oh! TCG.
                 
                 FONTE DI VERITÀ (DATI TORNEI):
-                {st.session_state.meta_context}
+                {meta_retrieved}
                 
                 CRONOLOGIA CHAT RECENTE:
                 {history_text}
@@ -1997,18 +2103,25 @@ elif mode == "📊 Meta Analyst":
                 3. **REGOLE**:
                    - Ignora OCG.
                    - Se la domanda si riferisce a "ciò che abbiamo detto prima", usa la CRONOLOGIA.
-                """
+                   - Gli estratti sono solo una parte dei dati: per conteggi e percentuali usa il RIEPILOGO DATASET.
+                """, [
+                    Section("meta_query", meta_query, priority=0),
+                    Section("meta_retrieved", meta_retrieved, priority=1),
+                    Section("history_text", history_text, priority=2, keep="end"),
+                ], meta_model_name).text
                 
                 # Stream Response
                 full_response = ""
                 # placeholder is already created above
                 try:
-                    stream = meta_model.generate_content(prompt_rag, stream=True)
-                    for chunk in stream:
-                        if chunk.text:
-                            full_response += chunk.text
-                            placeholder.markdown(full_response + "▌", unsafe_allow_html=True)
+                    full_response = stream_gemini_response(
+                        meta_model, prompt_rag,
+                        lambda text: placeholder.markdown(text + "▌", unsafe_allow_html=True)
+                    )
+                    if full_response.startswith("Errore"):
+                        raise RuntimeError(full_response)
                     placeholder.markdown(full_response, unsafe_allow_html=True)
+                    st.caption(f"🔎 {n_retrieved}/{len(meta_index)} blocchi del report · prompt ~{estimate_tokens(prompt_rag)} token")
                     
                     # Add to history
                     st.session_state.chat_history.append({"role": "assistant", "content": full_response})
@@ -0,0 +1,173 @@
+"""
+Batch judge: verdetti in blocco da un file JSONL, senza Streamlit.
+
+Ogni riga di input: {"cards": ["Ash Blossom", ...], "question": "...", "id": opzionale}.
+Se "cards" manca o è vuoto, le carte vengono estratte dalla domanda con il
+matcher locale (nomi ufficiali, nomi italiani e alias).
+Le carte sono risolte con lo stesso codice dell'app (card_catalog), il prompt
+è quello dello Step 3 (judge_prompts) e le chiamate passano dal rate limiter
+condiviso, con concorrenza limitata.
+
+Uso:
+  python batch_judge.py input.jsonl output.jsonl [--concurrency 4] [--use-cache]
+
+Key da GEMINI_API_KEY (obbligatoria); con YGO_LLM_PROVIDER=stub gira offline senza key.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+import card_catalog
+import llm_calls
+from card_matcher import CardMentionExtractor
+from judge_prompts import (
+    JUDGE_PROMPT_VERSION, build_cards_context, build_judge_prompt, extra_rulings_for, split_verdict
+)
+from rate_limiter import estimate_tokens
+from verdict_cache import get_verdict_cache, card_keys, make_key, rulings_hash
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+
+def _mention_extractor():
+    global _extractor
+    with _extractor_lock:
+        if _extractor is None:
+            catalog = card_catalog.get_catalog()
+            _extractor = CardMentionExtractor(catalog.names, localized=catalog.localized)
+        return _extractor
+
+
+def judge_scenario(scenario, api_key, use_cache=False):
+    """Un verdetto: Returns il record di output (con tempi in secondi)."""
+    t_start = time.perf_counter()
+    question = scenario.get("question", "")
+    card_names = [c for c in scenario.get("cards") or [] if isinstance(c, str) and c.strip()]
+    if not card_names:
+        card_names = _mention_extractor().find_mentions(question)
+
+    resolved = card_catalog.get_cards_data(card_names)
+    found = [resolved[name.strip()] for name in card_names if resolved.get(name.strip())]
+    missing = [name for name in card_names if not resolved.get(name.strip())]
+    t_lookup = time.perf_counter()
+
+    model, model_name = llm_calls.resolve_model(api_key)
+    verdict_ids = card_keys(found, missing)
+    extra_rulings = extra_rulings_for(found, missing)
+    verdict_rulings = rulings_hash(extra_rulings)
+    key = make_key(verdict_ids, question, model_name, JUDGE_PROMPT_VERSION, verdict_rulings)
+    timings = {}
+    prompt_tokens = 0
+    response = get_verdict_cache().get(key) if use_cache else None
+    cached = response is not None
+    if not cached:
+        prompt = build_judge_prompt(build_cards_context(found), question, extra_rulings, model_name)
+        prompt_tokens = estimate_tokens(prompt)
+        response = llm_calls.generate(model, api_key, prompt, timings=timings,
+                                      notify=lambda msg: print(f"[{scenario.get('id', '?')}] {msg}", file=sys.stderr))
+        if use_cache and not response.startswith("Errore"):
+            get_verdict_cache().put(key, response, verdict_ids, question, model_name, JUDGE_PROMPT_VERSION,
+                                    verdict_rulings)
+
+    short_answer, deep_dive = split_verdict(response)
+    t_end = time.perf_counter()
+    return {
+        "id": scenario.get("id"),
+        "question": question,
+        "cards": [card["name"] for card in found],
+        "missing_cards": missing,
+        "model": model_name,
+        "prompt_version": JUDGE_PROMPT_VERSION,
+        "cached": cached,
+        "prompt_tokens": prompt_tokens,
+        "error": response if response.startswith("Errore") else None,
+        "verdict_short": short_answer.strip(),
+        "verdict_deep": (deep_dive or "").strip(),
+        "timings": {
+            "lookup_s": round(t_lookup - t_start, 4),
+            "queue_s": round(timings.get("queue_s", 0.0), 4),
+            "llm_s": round(timings.get("llm_s", 0.0), 4),
+            "attempts": timings.get("attempts", 0),
+            "total_s": round(t_end - t_start, 4),
+        },
+    }
+
+
+def _read_scenarios(path):
+    scenarios = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                scenario = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Riga {line_no} ignorata (JSON non valido): {e}", file=sys.stderr)
+                continue
+            scenario.setdefault("id", line_no)
+            scenarios.append(scenario)
+    return scenarios
+
+
+def run(input_path, output_path, concurrency=4, use_cache=False, api_key=None):
+    api_key = api_key or os.getenv("GEMINI_API_KEY", "")
+    if not api_key:
+        if os.getenv("YGO_LLM_PROVIDER", "gemini").lower() != "stub":
+            print("GEMINI_API_KEY mancante: impostala (o usa YGO_LLM_PROVIDER=stub per girare offline).",
+                  file=sys.stderr)
+            return 1
+        api_key = "stub"
+    scenarios = _read_scenarios(input_path)
+    if not scenarios:
+        print("Nessuno scenario in input.", file=sys.stderr)
+        return 1
+    card_catalog.ensure_catalog()
+
+    def safe_judge(scenario):
+        try:
+            return judge_scenario(scenario, api_key, use_cache)
+        except Exception as e:
+            return {"id": scenario.get("id"), "question": scenario.get("question", ""), "error": f"Errore batch: {e}"}
+
+    t0 = time.perf_counter()
+    totals = []
+    errors = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor, \
+            open(output_path, "w", encoding="utf-8") as out:
+        # map mantiene l'ordine di input; le righe vengono scritte appena pronte
+        for done, result in enumerate(executor.map(safe_judge, scenarios), 1):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            errors += bool(result.get("error"))
+            if "timings" in result:
+                totals.append(result["timings"]["total_s"])
+            print(f"{done}/{len(scenarios)} id={result.get('id')} "
+                  f"{'ERRORE' if result.get('error') else 'ok'}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - t0
+    totals.sort()
+    if totals:
+        p50 = totals[len(totals) // 2]
+        p95 = totals[min(len(totals) - 1, int(0.95 * (len(totals) - 1) + 0.5))]
+        print(f"Scenari: {len(scenarios)} | errori: {errors} | tempo: {elapsed:.1f}s | "
+              f"p50 {p50:.2f}s · p95 {p95:.2f}s per verdetto", file=sys.stderr)
+    return 0 if not errors else 2
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Batch judge su file JSONL di scenari.")
+    parser.add_argument("input", help="JSONL con {cards, question}")
+    parser.add_argument("output", help="JSONL dei risultati")
+    parser.add_argument("--concurrency", type=int, default=4, help="Verdetti in parallelo (default 4)")
+    parser.add_argument("--use-cache", action="store_true", help="Legge/scrive la cache dei verdetti")
+    args = parser.parse_args()
+    sys.exit(run(args.input, args.output, args.concurrency, args.use_cache))
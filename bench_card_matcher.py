@@ -0,0 +1,133 @@
+"""
+Benchmark offline: difflib.get_close_matches vs CardNameMatcher.
+
+Usa lo snapshot locale del catalogo (card_catalog) e una lista di nomi
+"sporcati" come quelli restituiti dalla Vision su foto di campo reali.
+Senza rete (catalogo vuoto) o con --synthetic gira su un corpus sintetico
+di dimensione simile al catalogo reale; --names usa una lista di nomi da
+file (uno per riga).
+
+Uso: python bench_card_matcher.py [--repeat N] [--synthetic | --names file.txt]
+"""
+import sys
+import time
+import random
+import difflib
+
+import card_catalog
+from card_matcher import CardNameMatcher
+
+# (Nome letto dall'OCR / modello, nome ufficiale atteso)
+OCR_SAMPLES = [
+    ("Ash Blossom & Joyus Spring", "Ash Blossom & Joyous Spring"),
+    ("Ash Blosom", "Ash Blossom & Joyous Spring"),
+    ("Nibiru the Primal Being", "Nibiru, the Primal Being"),
+    ("Infinite Impermanance", "Infinite Impermanence"),
+    ("Effect Veller", "Effect Veiler"),
+    ("Ghost Ogre & Snow Rabit", "Ghost Ogre & Snow Rabbit"),
+    ("Called by the Grave", "Called by the Grave"),
+    ("Crossout Designator", "Crossout Designator"),
+    ("Pot of Prosperty", "Pot of Prosperity"),
+    ("Triple Tactics Thrust", "Triple Tactics Thrust"),
+    ("Super Starslayer TY-PHON Sky Crisis", "Super Starslayer TY-PHON - Sky Crisis"),
+    ("Accesscode Talker", "Accesscode Talker"),
+    ("Backup @lgnister", "Backup @Ignister"),
+    ("Linguriboh", "Linguriboh"),
+    ("K9-17 Ripper", "K9-17 \"Ripper\""),
+    ("Mirrorjade the lceblade Dragon", "Mirrorjade the Iceblade Dragon"),
+    ("Snake-Eye Ash", "Snake-Eye Ash"),
+    ("Diabellstar the Black Witch", "Diabellstar the Black Witch"),
+    ("Maxx C", "Maxx \"C\""),
+    ("Droll & Lock Brid", "Droll & Lock Bird"),
+    ("Dimension Shifer", "Dimension Shifter"),
+    ("Kashtira Fenrlr", "Kashtira Fenrir"),
+    ("Forbiden Droplet", "Forbidden Droplet"),
+    ("Evenly Matchd", "Evenly Matched"),
+    ("Harpies Feather Duster", "Harpie's Feather Duster"),
+    ("Destiny HERO Destroyer Phoenix Enforcer", "Destiny HERO - Destroyer Phoenix Enforcer"),
+    ("I:P Masquerena", "I:P Masquerena"),
+    ("Baronne de Fleur", "Baronne de Fleur"),
+    ("Apollousa Bow of the Goddes", "Apollousa, Bow of the Goddess"),
+    ("Bystial Druiswurm", "Bystial Druiswurm"),
+]
+
+
+SYNTHETIC_SIZE = 13000  # Ordine di grandezza del catalogo reale
+_SYNTHETIC_WORDS = (
+    "Dragon Knight Witch Blossom Spring Being Grave Dark Ruler Primal Shadow Iceblade Bird Lock "
+    "Ghost Rabbit Phoenix Destiny HERO Cyber Magician Sky Striker Ace Tri Brigade Snake Eye Flame "
+    "Swordsoul Tenyi Kashtira Labrynth Spright Tearlaments Runick Floowandereeze Branded Despia "
+    "Mathmech Salamangreat Eldlich Virtual World Unchained Soul Abomination Gate Fusion Ritual "
+    "Warrior Beast Fairy Fiend Machine Pyro Wyrm Sorcerer Talker Link Pot Sword Shield Mirror"
+).split()
+
+
+def synthetic_names(count=SYNTHETIC_SIZE, seed=42):
+    """Nomi finti ma realistici (2-6 parole) più i nomi attesi dai campioni OCR."""
+    rng = random.Random(seed)
+    names = {expected for _raw, expected in OCR_SAMPLES}
+    while len(names) < count:
+        words = rng.sample(_SYNTHETIC_WORDS, rng.randint(2, 6))
+        if rng.random() < 0.2:
+            words.insert(rng.randint(1, len(words) - 1), "of the" if rng.random() < 0.5 else "&")
+        names.add(" ".join(words))
+    return sorted(names)
+
+
+def load_names(names_path=None, synthetic=False):
+    """(nomi, origine): file di nomi, catalogo locale o corpus sintetico se il catalogo è vuoto."""
+    if names_path:
+        with open(names_path, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()], names_path
+    if not synthetic:
+        names = card_catalog.load_card_names()
+        if names:
+            return names, "catalogo locale"
+        print("Catalogo vuoto (nessuna rete?): uso il corpus sintetico.")
+    return synthetic_names(), "corpus sintetico"
+
+
+def run(repeat=1, names_path=None, synthetic=False):
+    names, origin = load_names(names_path, synthetic)
+    if not names:
+        print("Nessun nome da indicizzare.")
+        return 1
+
+    t0 = time.perf_counter()
+    matcher = CardNameMatcher(names)
+    build_time = time.perf_counter() - t0
+    print(f"Carte: {len(names)} ({origin}) | Build indice: {build_time * 1000:.0f} ms")
+
+    def timed(fn):
+        out = []
+        start = time.perf_counter()
+        for _ in range(repeat):
+            out = [fn(raw) for raw, _ in OCR_SAMPLES]
+        return out, (time.perf_counter() - start) / repeat
+
+    difflib_res, difflib_time = timed(
+        lambda raw: (difflib.get_close_matches(raw, names, n=1, cutoff=0.5) or [None])[0]
+    )
+    index_res, index_time = timed(lambda raw: matcher.best_match(raw, cutoff=0.5))
+
+    difflib_ok = index_ok = agree = 0
+    for (raw, expected), d_res, i_res in zip(OCR_SAMPLES, difflib_res, index_res):
+        difflib_ok += d_res == expected
+        index_ok += i_res == expected
+        agree += d_res == i_res
+        if d_res != i_res:
+            print(f"  ≠ {raw!r}: difflib={d_res!r} index={i_res!r} (atteso {expected!r})")
+
+    total = len(OCR_SAMPLES)
+    print(f"difflib : {difflib_time * 1000:8.1f} ms | corretti {difflib_ok}/{total}")
+    print(f"indice  : {index_time * 1000:8.1f} ms | corretti {index_ok}/{total}")
+    print(f"Speedup : {difflib_time / max(index_time, 1e-9):.1f}x | accordo {agree}/{total}")
+    return 0
+
+
+if __name__ == "__main__":
+    repeat = 1
+    if "--repeat" in sys.argv:
+        repeat = int(sys.argv[sys.argv.index("--repeat") + 1])
+    names_file = sys.argv[sys.argv.index("--names") + 1] if "--names" in sys.argv else None
+    sys.exit(run(repeat, names_file, "--synthetic" in sys.argv))
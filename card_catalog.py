@@ -0,0 +1,594 @@
+"""
+Catalogo locale delle carte (snapshot SQLite di cardinfo.php).
+
+Un solo ingest scarica il payload completo di YGOProDeck e lo salva su disco;
+load_card_database() e load_all_card_names() leggono da qui invece di
+scaricare ognuno le ~13k carte. Al riavvio del container si riusa l'ultimo
+snapshot valido e il controllo versione (checkDBVer.php) gira in background.
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+from array import array
+from enum import IntEnum
+from types import MappingProxyType
+import requests
+
+from common import CACHE_DIR, connect
+
+CARDINFO_URL = "https://db.ygoprodeck.com/api/v7/cardinfo.php"
+DBVER_URL = "https://db.ygoprodeck.com/api/v7/checkDBVer.php"
+
+CATALOG_PATH = os.path.join(CACHE_DIR, "card_catalog.sqlite")
+
+SCHEMA_VERSION = 5
+REFRESH_INTERVAL = 6 * 3600  # Secondi tra due controlli di versione remota
+INGEST_TIMEOUT = 60
+CARD_DATA_TTL = 3600  # Secondi di validità delle carte risolte in memoria
+LOCALIZED_LANGUAGES = ("it",)  # Lingue extra (parametro language= di cardinfo.php)
+CATALOG_RECHECK = 60  # Secondi tra due controlli "lo snapshot è cambiato?" del catalogo in memoria
+INGEST_RETRY_BACKOFF = int(os.getenv("YGO_INGEST_RETRY_BACKOFF", "300"))  # Secondi prima di ritentare un ingest fallito
+
+_refresh_lock = threading.Lock()
+_refresh_thread = None
+_ingest_failed_at = {}  # path -> time.time() dell'ultimo ingest bloccante fallito
+
+
+class CardCategory(IntEnum):
+    """Categoria compatta della carta, calcolata una volta all'ingest."""
+    UNKNOWN = 0
+    MAIN_MONSTER = 1
+    RITUAL = 2
+    PENDULUM = 3
+    SPELL = 4
+    TRAP = 5
+    FUSION = 6
+    SYNCHRO = 7
+    XYZ = 8
+    LINK = 9
+    TOKEN = 10
+    SKILL = 11
+
+
+EXTRA_DECK_CATEGORIES = (CardCategory.FUSION, CardCategory.SYNCHRO, CardCategory.XYZ, CardCategory.LINK)
+NON_MONSTER_CATEGORIES = (CardCategory.SPELL, CardCategory.TRAP, CardCategory.SKILL)
+_CATEGORY_BY_CODE = tuple(CardCategory)  # codice intero -> membro, senza passare da CardCategory(...)
+
+
+def classify_card_type(card_type):
+    """Tipo YGOProDeck (es. "Synchro Pendulum Effect Monster") -> CardCategory."""
+    if not card_type:
+        return CardCategory.UNKNOWN
+    # L'ordine conta: i Pendulum dell'Extra Deck restano Fusion/Synchro/XYZ
+    for keyword, category in (("Spell", CardCategory.SPELL), ("Trap", CardCategory.TRAP),
+                              ("Skill", CardCategory.SKILL), ("Token", CardCategory.TOKEN),
+                              ("Fusion", CardCategory.FUSION), ("Synchro", CardCategory.SYNCHRO),
+                              ("XYZ", CardCategory.XYZ), ("Link", CardCategory.LINK),
+                              ("Pendulum", CardCategory.PENDULUM), ("Ritual", CardCategory.RITUAL)):
+        if keyword in card_type:
+            return category
+    return CardCategory.MAIN_MONSTER
+
+
+def extra_deck_sort_index(category):
+    """Ordine Extra Deck: Fusion, Synchro, XYZ, Link, poi il resto."""
+    try:
+        return EXTRA_DECK_CATEGORIES.index(category)
+    except ValueError:
+        return len(EXTRA_DECK_CATEGORIES)
+
+
+def read_meta(path=CATALOG_PATH):
+    """Legge i metadati dello snapshot ({} se manca o è corrotto)."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with connect(path) as conn:
+            return dict(conn.execute("SELECT key, value FROM meta").fetchall())
+    except sqlite3.Error:
+        return {}
+
+
+def _write_meta(conn, values):
+    conn.executemany(
+        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+        [(k, str(v)) for k, v in values.items()]
+    )
+
+
+def fetch_remote_version():
+    """Versione corrente del DB YGOProDeck (None se non raggiungibile)."""
+    try:
+        response = requests.get(DBVER_URL, timeout=5)
+        if response.status_code == 200:
+            data = response.json()
+            if isinstance(data, list) and data:
+                return str(data[0].get("database_version"))
+    except Exception as e:
+        print(f"DB Version Check Error: {e}")
+    return None
+
+
+def _download_cards(language=None):
+    # misc=yes aggiunge misc_info (views) usato come popolarità nella ricerca
+    params = {"language": language} if language else {"misc": "yes"}
+    response = requests.get(CARDINFO_URL, params=params, timeout=INGEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()["data"]
+
+
+def _download_localized_names():
+    """{lingua: [(id, nome localizzato)]}. Una lingua che fallisce viene saltata."""
+    localized = {}
+    for language in LOCALIZED_LANGUAGES:
+        try:
+            localized[language] = [(c["id"], c["name"]) for c in _download_cards(language)]
+        except Exception as e:
+            print(f"Catalog Ingest Error ({language}): {e}")
+    return localized
+
+
+def _card_views(card):
+    misc = card.get("misc_info") or [{}]
+    try:
+        return int(misc[0].get("views", 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _build_snapshot(conn, cards, localized=None):
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("""
+        CREATE TABLE cards (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            type TEXT,
+            category INTEGER DEFAULT 0,
+            views INTEGER DEFAULT 0,
+            data TEXT
+        )
+    """)
+    conn.executemany(
+        "INSERT OR REPLACE INTO cards (id, name, type, category, views, data) VALUES (?, ?, ?, ?, ?, ?)",
+        [(c["id"], c["name"], c.get("type", ""), int(classify_card_type(c.get("type", ""))), _card_views(c),
+          json.dumps(c, separators=(",", ":"))) for c in cards]
+    )
+    conn.execute("CREATE INDEX idx_cards_name ON cards (name COLLATE NOCASE)")
+
+    # Indice multilingua nome -> id (inglese incluso, così basta una query)
+    conn.execute("CREATE TABLE card_names (id INTEGER NOT NULL, lang TEXT NOT NULL, name TEXT NOT NULL)")
+    rows = [(c["id"], "en", c["name"]) for c in cards]
+    for language, names in (localized or {}).items():
+        rows.extend((card_id, language, name) for card_id, name in names)
+    conn.executemany("INSERT INTO card_names (id, lang, name) VALUES (?, ?, ?)", rows)
+    conn.execute("CREATE INDEX idx_card_names_name ON card_names (name COLLATE NOCASE)")
+
+
+def ingest(path=CATALOG_PATH, db_version=None):
+    """
+    Scarica tutte le carte e sostituisce atomicamente lo snapshot.
+    Se il download fallisce lo snapshot precedente resta intatto.
+    Returns True se lo snapshot è stato aggiornato.
+    """
+    try:
+        cards = _download_cards()
+    except Exception as e:
+        print(f"Catalog Ingest Error: {e}")
+        return False
+    localized = _download_localized_names()
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    try:
+        with connect(tmp_path) as conn:
+            _build_snapshot(conn, cards, localized)
+            now = time.time()
+            _write_meta(conn, {
+                "schema_version": SCHEMA_VERSION,
+                "db_version": db_version or fetch_remote_version() or "",
+                "ingested_at": now,
+                "checked_at": now,
+                "card_count": len(cards),
+                "languages": ",".join(["en"] + sorted(localized)),
+            })
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        print(f"Catalog Write Error: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def refresh_if_outdated(path=CATALOG_PATH):
+    """Re-ingest solo se la versione remota è cambiata rispetto allo snapshot."""
+    meta = read_meta(path)
+    remote_version = fetch_remote_version()
+    if remote_version is None:
+        return False  # Offline: teniamo l'ultimo snapshot buono
+
+    if remote_version != meta.get("db_version"):
+        return ingest(path, db_version=remote_version)
+
+    try:
+        with connect(path) as conn:
+            _write_meta(conn, {"checked_at": time.time()})
+    except sqlite3.Error as e:
+        print(f"Catalog Meta Error: {e}")
+    return False
+
+
+def _background_refresh(path):
+    global _refresh_thread
+    with _refresh_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return
+        _refresh_thread = threading.Thread(target=refresh_if_outdated, args=(path,), daemon=True)
+        _refresh_thread.start()
+
+
+def ensure_catalog(path=CATALOG_PATH):
+    """
+    Garantisce che esista uno snapshot utilizzabile.
+    - Nessuno snapshot (o schema vecchio): ingest bloccante. Se fallisce (offline,
+      API giù) non si ritenta prima di INGEST_RETRY_BACKOFF secondi: nel frattempo
+      il catalogo resta vuoto invece di bloccare ogni chiamata per INGEST_TIMEOUT.
+    - Snapshot presente ma non controllato da REFRESH_INTERVAL: si usa subito
+      e il controllo versione parte in un thread separato.
+    Returns True se lo snapshot è disponibile.
+    """
+    meta = read_meta(path)
+    if meta.get("schema_version") != str(SCHEMA_VERSION):
+        if time.time() - _ingest_failed_at.get(path, 0) < INGEST_RETRY_BACKOFF:
+            return bool(meta)
+        with _refresh_lock:
+            # Un'altra sessione potrebbe averlo appena creato (o aver appena fallito)
+            if (read_meta(path).get("schema_version") != str(SCHEMA_VERSION)
+                    and time.time() - _ingest_failed_at.get(path, 0) >= INGEST_RETRY_BACKOFF):
+                if ingest(path):
+                    _ingest_failed_at.pop(path, None)
+                else:
+                    _ingest_failed_at[path] = time.time()
+        return bool(read_meta(path))
+
+    try:
+        checked_at = float(meta.get("checked_at", 0))
+    except ValueError:
+        checked_at = 0
+    if time.time() - checked_at > REFRESH_INTERVAL:
+        _background_refresh(path)
+    return True
+
+
+def load_card_types(path=CATALOG_PATH):
+    """Mappa Nome -> Tipo (es. "Dark Magician" -> "Normal Monster")."""
+    if not ensure_catalog(path):
+        return {}
+    try:
+        with connect(path) as conn:
+            return dict(conn.execute("SELECT name, type FROM cards ORDER BY name").fetchall())
+    except sqlite3.Error as e:
+        print(f"Catalog Read Error: {e}")
+        return {}
+
+
+def load_card_names(path=CATALOG_PATH):
+    """Lista di tutti i nomi ufficiali (ordine alfabetico)."""
+    if not ensure_catalog(path):
+        return []
+    try:
+        with connect(path) as conn:
+            return [row[0] for row in conn.execute("SELECT name FROM cards ORDER BY name")]
+    except sqlite3.Error as e:
+        print(f"Catalog Read Error: {e}")
+        return []
+
+
+def load_localized_names(path=CATALOG_PATH):
+    """Mappa Nome localizzato -> Nome ufficiale inglese (es. IT -> EN)."""
+    if not ensure_catalog(path):
+        return {}
+    try:
+        with connect(path) as conn:
+            return dict(conn.execute("""
+                SELECT n.name, c.name FROM card_names n JOIN cards c ON c.id = n.id
+                WHERE n.lang != 'en' AND n.name != c.name
+            """).fetchall())
+    except sqlite3.Error as e:
+        print(f"Catalog Read Error: {e}")
+        return {}
+
+
+def load_name_index(path=CATALOG_PATH):
+    """Indice bilingue Nome (qualsiasi lingua) -> ID canonico della carta."""
+    if not ensure_catalog(path):
+        return {}
+    try:
+        with connect(path) as conn:
+            return dict(conn.execute("SELECT name, id FROM card_names").fetchall())
+    except sqlite3.Error as e:
+        print(f"Catalog Read Error: {e}")
+        return {}
+
+
+# --- Catalogo in memoria (uno per processo, condiviso tra le sessioni) ---
+
+class CardCatalog:
+    """
+    Vista immutabile del catalogo, letta per riferimento da tutte le sessioni.
+    Stringhe internate, colonne compatte (array) e un'unica tabella dei tipi:
+    nessuna copia per sessione e nessun pickle come con st.cache_data.
+    Espone get(nome, default) come il vecchio dict Nome -> Tipo.
+    """
+    __slots__ = ("version", "names", "localized", "_localized", "_ids", "_views", "_categories",
+                 "_type_codes", "_type_table", "_row_by_name")
+
+    def __init__(self, rows, localized=None, version=""):
+        type_table = []
+        type_index = {}
+        names = []
+        ids = array("l")
+        views = array("q")
+        categories = array("B")
+        type_codes = array("H")
+        for card_id, name, c_type, c_category, c_views in rows:
+            c_type = c_type or ""
+            if c_type not in type_index:
+                type_index[c_type] = len(type_table)
+                type_table.append(sys.intern(c_type))
+            names.append(sys.intern(name))
+            ids.append(card_id)
+            views.append(c_views or 0)
+            categories.append(c_category or 0)
+            type_codes.append(type_index[c_type])
+
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "names", tuple(names))
+        object.__setattr__(self, "_ids", ids)
+        object.__setattr__(self, "_views", views)
+        object.__setattr__(self, "_categories", categories)
+        object.__setattr__(self, "_type_codes", type_codes)
+        object.__setattr__(self, "_type_table", tuple(type_table))
+        object.__setattr__(self, "_row_by_name", {name: i for i, name in enumerate(names)})
+        row_by_name = self._row_by_name
+        object.__setattr__(self, "_localized", {
+            sys.intern(loc): names[row_by_name[en]]
+            for loc, en in (localized or {}).items() if en in row_by_name
+        })
+        object.__setattr__(self, "localized", MappingProxyType(self._localized))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CardCatalog è in sola lettura")
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._row_by_name
+
+    def get(self, name, default=None):
+        """Tipo della carta (es. "Effect Monster"), come dict.get."""
+        row = self._row_by_name.get(name)
+        return default if row is None else self._type_table[self._type_codes[row]]
+
+    def id_of(self, name):
+        row = self._row_by_name.get(name)
+        return None if row is None else self._ids[row]
+
+    def category_of(self, name):
+        """CardCategory della carta (UNKNOWN se non è nel catalogo)."""
+        row = self._row_by_name.get(name)
+        return CardCategory.UNKNOWN if row is None else _CATEGORY_BY_CODE[self._categories[row]]
+
+    def group_by_category(self, items, key=None):
+        """
+        Raggruppa `items` per categoria mantenendo l'ordine.
+        `key` estrae il nome da ogni elemento (default: l'elemento stesso).
+        Returns {CardCategory: [items]}.
+        """
+        groups = {}
+        for item in items:
+            name = key(item) if key else item
+            groups.setdefault(self.category_of(name), []).append(item)
+        return groups
+
+    def split_main_deck(self, items, key=None):
+        """(mostri, magie, trappole) in un solo passaggio; le carte sconosciute contano come mostri."""
+        monsters, spells, traps = [], [], []
+        for item in items:
+            category = self.category_of(key(item) if key else item)
+            if category == CardCategory.SPELL:
+                spells.append(item)
+            elif category == CardCategory.TRAP:
+                traps.append(item)
+            else:
+                monsters.append(item)
+        return monsters, spells, traps
+
+    def popularity(self, name):
+        """Visualizzazioni YGOProDeck della carta (0 se sconosciuta)."""
+        row = self._row_by_name.get(name)
+        return 0 if row is None else self._views[row]
+
+    def memory_footprint(self):
+        """Stima in byte della memoria occupata (contenitori + stringhe, contate una volta)."""
+        seen = set()
+        total = 0
+        for obj in (self.names, self._ids, self._views, self._categories, self._type_codes, self._type_table,
+                    self._row_by_name, self._localized):
+            total += sys.getsizeof(obj)
+        for text in self.names + self._type_table + tuple(self._localized):
+            if id(text) not in seen:
+                seen.add(id(text))
+                total += sys.getsizeof(text)
+        return total
+
+
+_catalog = None
+_catalog_checked_at = 0.0
+_catalog_lock = threading.Lock()
+
+
+def _build_catalog(path):
+    if not ensure_catalog(path):
+        return CardCatalog([])
+    try:
+        version = read_meta(path).get("ingested_at", "")
+        with connect(path) as conn:
+            rows = conn.execute("SELECT id, name, type, category, views FROM cards ORDER BY name").fetchall()
+        return CardCatalog(rows, load_localized_names(path), version=version)
+    except sqlite3.Error as e:
+        print(f"Catalog Read Error: {e}")
+        return CardCatalog([])
+
+
+def get_catalog(path=CATALOG_PATH):
+    """
+    Il CardCatalog del processo. Viene ricostruito solo quando lo snapshot su
+    disco cambia (es. dopo il refresh in background), controllando al massimo
+    ogni CATALOG_RECHECK secondi.
+    """
+    global _catalog, _catalog_checked_at
+    now = time.time()
+    if _catalog is not None and len(_catalog) and now - _catalog_checked_at < CATALOG_RECHECK:
+        return _catalog
+
+    with _catalog_lock:
+        if _catalog is None or not len(_catalog) or read_meta(path).get("ingested_at", "") != _catalog.version:
+            _catalog = _build_catalog(path)
+        _catalog_checked_at = now
+        return _catalog
+
+
+# --- Risoluzione carte (batch + memo di processo) ---
+
+class TTLCache:
+    """Dizionario thread-safe con scadenza per chiave ed eviction del più vecchio."""
+
+    def __init__(self, ttl, maxsize=4096):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            if key not in self._data and len(self._data) >= self.maxsize:
+                oldest = min(self._data, key=lambda k: self._data[k][0])
+                del self._data[oldest]
+            self._data[key] = (time.time() + self.ttl, value)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_card_data_cache = TTLCache(CARD_DATA_TTL)
+_MISS = object()
+
+
+def _lookup_local(names, path=CATALOG_PATH):
+    """Cerca i nomi nello snapshot: match esatto (anche localizzato), poi "contiene" (come fname)."""
+    found = {}
+    if not names or not ensure_catalog(path):
+        return found
+    try:
+        with connect(path) as conn:
+            for name in names:
+                row = conn.execute(
+                    "SELECT data FROM cards WHERE name = ? COLLATE NOCASE LIMIT 1", (name,)
+                ).fetchone()
+                if row is None:
+                    # Nome localizzato (es. "Cenere Fiorita") -> carta canonica
+                    row = conn.execute("""
+                        SELECT c.data FROM card_names n JOIN cards c ON c.id = n.id
+                        WHERE n.name = ? COLLATE NOCASE LIMIT 1
+                    """, (name,)).fetchone()
+                if row is None:
+                    pattern = "%" + name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                    row = conn.execute("""
+                        SELECT c.data FROM card_names n JOIN cards c ON c.id = n.id
+                        WHERE n.name LIKE ? ESCAPE '\\' ORDER BY n.lang != 'en', n.name LIMIT 1
+                    """, (pattern,)).fetchone()
+                if row is not None:
+                    found[name] = json.loads(row[0])
+    except sqlite3.Error as e:
+        print(f"Catalog Read Error: {e}")
+    return found
+
+
+def _lookup_remote(names):
+    """
+    Un'unica richiesta cardinfo.php?name=A|B|C per tutte le carte mancanti.
+    Returns (trovate, risposta valida): solo con una risposta valida un nome
+    assente dal risultato è davvero inesistente (e non un errore di rete).
+    """
+    found = {}
+    names = [n for n in names if "|" not in n]
+    if not names:
+        return found, False
+    try:
+        response = requests.get(CARDINFO_URL, params={"name": "|".join(names)}, timeout=10)
+        if response.status_code != 200:
+            print(f"Remote Card Lookup Error: HTTP {response.status_code}")
+            return found, False
+        by_name = {c["name"].lower(): c for c in response.json().get("data", [])}
+        for name in names:
+            if name.lower() in by_name:
+                found[name] = by_name[name.lower()]
+        return found, True
+    except Exception as e:
+        print(f"Remote Card Lookup Error: {e}")
+        return found, False
+
+
+def get_cards_data(card_names, path=CATALOG_PATH):
+    """
+    Risolve una lista di nomi in un colpo solo.
+    Ordine: memo di processo -> snapshot locale -> una sola richiesta remota.
+    Returns dict {nome richiesto: dati carta o None}, nell'ordine di input.
+    """
+    results = {}
+    missing = []
+    for raw_name in card_names:
+        name = raw_name.strip()
+        if not name or name in results:
+            continue
+        cached = _card_data_cache.get(name.lower(), _MISS)
+        if cached is _MISS:
+            results[name] = None
+            missing.append(name)
+        else:
+            results[name] = cached
+
+    if missing:
+        resolved = _lookup_local(missing, path)
+        still_missing = [n for n in missing if n not in resolved]
+        remote, remote_ok = _lookup_remote(still_missing)
+        resolved.update(remote)
+        for name in missing:
+            results[name] = resolved.get(name)
+            # I "non trovati" vanno in cache solo se il remoto ha risposto davvero:
+            # dopo un errore di rete (o a catalogo vuoto) si riprova alla prossima richiesta
+            if results[name] is not None or (remote_ok and "|" not in name):
+                _card_data_cache.set(name.lower(), results[name])
+
+    return results
+
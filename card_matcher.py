@@ -0,0 +1,312 @@
+"""
+Matching fuzzy dei nomi carta con indice a trigrammi + prefissi.
+
+Sostituisce difflib.get_close_matches(raw, all_card_names) nel percorso Vision:
+invece di un SequenceMatcher completo su ~13k nomi, l'indice a trigrammi
+seleziona poche decine di candidati e solo quelli vengono valutati.
+"""
+import re
+import bisect
+import difflib
+import heapq
+import unicodedata
+from collections import defaultdict
+
+_NON_ALNUM = re.compile(r"[^0-9a-z@]+")
+_NON_ALNUM_CASED = re.compile(r"[^0-9A-Za-z@]+")
+
+
+def _strip_accents(name):
+    name = unicodedata.normalize("NFKD", name)
+    return "".join(ch for ch in name if not unicodedata.combining(ch))
+
+
+def normalize_name(name):
+    """Minuscolo, senza accenti e con la punteggiatura ridotta a spazi singoli."""
+    return _NON_ALNUM.sub(" ", _strip_accents(name).lower()).strip()
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CardNameMatcher:
+    """
+    Indice immutabile sui nomi ufficiali, costruito una volta per processo.
+    `localized` ({nome localizzato: nome ufficiale}) aggiunge all'indice i nomi
+    in altre lingue: un match su "Cenere Fiorita" restituisce il nome inglese.
+    """
+
+    def __init__(self, names, localized=None):
+        localized = localized or {}
+        self.names = list(names) + list(localized.values())
+        indexed = list(names) + list(localized.keys())
+        self._norm = [normalize_name(n) for n in indexed]
+        self._exact = {}
+        self._postings = defaultdict(list)
+        self._gram_counts = []
+
+        for idx, norm in enumerate(self._norm):
+            self._exact.setdefault(norm, idx)
+            grams = _trigrams(norm)
+            self._gram_counts.append(len(grams))
+            for gram in grams:
+                self._postings[gram].append(idx)
+
+        prefix_sorted = sorted(range(len(self._norm)), key=lambda i: self._norm[i])
+        self._prefix_keys = [self._norm[i] for i in prefix_sorted]
+        self._prefix_ids = prefix_sorted
+
+    def __len__(self):
+        return len(self.names)
+
+    def _candidates(self, norm, limit):
+        """I `limit` nomi con il coefficiente di Dice sui trigrammi più alto."""
+        grams = _trigrams(norm)
+        hits = defaultdict(int)
+        for gram in grams:
+            for idx in self._postings.get(gram, ()):
+                hits[idx] += 1
+        q_len = len(grams)
+        return heapq.nlargest(
+            limit, hits,
+            key=lambda idx: 2.0 * hits[idx] / (q_len + self._gram_counts[idx])
+        )
+
+    def top_matches(self, query, n=5, cutoff=0.5, candidates=50):
+        """
+        Returns [(nome, score)] ordinati per score decrescente.
+        Lo score è il ratio di SequenceMatcher sui nomi normalizzati, quindi
+        `cutoff` ha lo stesso significato che aveva con get_close_matches.
+        """
+        norm = normalize_name(query)
+        if not norm:
+            return []
+        if norm in self._exact:
+            return [(self.names[self._exact[norm]], 1.0)]
+
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(norm)
+        scored = []
+        for idx in self._candidates(norm, candidates):
+            matcher.set_seq1(self._norm[idx])
+            if matcher.real_quick_ratio() < cutoff or matcher.quick_ratio() < cutoff:
+                continue
+            score = matcher.ratio()
+            if score >= cutoff:
+                scored.append((score, -idx))
+
+        results = []
+        seen = set()
+        for score, neg_idx in sorted(scored, reverse=True):
+            name = self.names[-neg_idx]
+            if name not in seen:
+                seen.add(name)
+                results.append((name, score))
+            if len(results) >= n:
+                break
+        return results
+
+    def best_match(self, query, cutoff=0.5):
+        """Nome ufficiale più vicino a `query`, o None sotto il cutoff."""
+        matches = self.top_matches(query, n=1, cutoff=cutoff)
+        return matches[0][0] if matches else None
+
+    def prefix_matches(self, prefix, limit=20):
+        """Nomi il cui testo normalizzato inizia con `prefix` (ordine alfabetico)."""
+        norm = normalize_name(prefix)
+        if not norm:
+            return []
+        start = bisect.bisect_left(self._prefix_keys, norm)
+        results = []
+        for pos in range(start, len(self._prefix_keys)):
+            if not self._prefix_keys[pos].startswith(norm) or len(results) >= limit:
+                break
+            name = self.names[self._prefix_ids[pos]]
+            if name not in results:
+                results.append(name)
+        return results
+
+    def search(self, query, limit=20, popularity=None):
+        """
+        Top-k per la ricerca mentre si digita (lato server).
+        Ordine: prefisso del nome > prefisso di una parola > fuzzy; a parità di
+        gruppo vince la carta più popolare (`popularity(nome) -> numero`).
+        """
+        norm = normalize_name(query)
+        if not norm:
+            return []
+        rank = popularity or (lambda name: 0)
+
+        prefix = self.prefix_matches(norm, limit=200)
+        word_prefix = []
+        for idx in self._candidates(norm, 200):
+            if f" {self._norm[idx]}".find(f" {norm}") > 0:
+                word_prefix.append(self.names[idx])
+        # Fuzzy sull'inizio del nome: "ahs blosom" deve trovare "Ash Blossom & ..."
+        fuzzy = []
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(norm)
+        for idx in self._candidates(norm, 100):
+            matcher.set_seq1(self._norm[idx][:len(norm)])
+            if matcher.ratio() >= 0.7:
+                fuzzy.append(self.names[idx])
+
+        results = []
+        for group in (prefix, word_prefix, fuzzy):
+            for name in sorted(dict.fromkeys(group), key=rank, reverse=True):
+                if name not in results:
+                    results.append(name)
+                if len(results) >= limit:
+                    return results
+        return results
+
+
+# --- Estrazione menzioni dal testo (Aho-Corasick a livello di parola) ---
+
+# Nickname / slang -> nome ufficiale inglese. Le chiavi vengono normalizzate
+# come i nomi (minuscolo, senza punteggiatura). Niente parole di dizionario
+# ("belle", "ogre", "desires", ...): un falso positivo locale salta il
+# fallback LLM di extract_cards.
+CARD_ALIASES = {
+    "ash blossom": "Ash Blossom & Joyous Spring",
+    "nibiru": "Nibiru, the Primal Being",
+    "snatchy": "Snatch Steal",
+    "imperm": "Infinite Impermanence",
+    "impermanence": "Infinite Impermanence",
+    "veiler": "Effect Veiler",
+    "maxx c": "Maxx \"C\"",
+    "droll lock": "Droll & Lock Bird",
+    "ghost ogre": "Ghost Ogre & Snow Rabbit",
+    "ghost belle": "Ghost Belle & Haunted Mansion",
+    "crossout": "Crossout Designator",
+    "bagooska": "Bagooska the Terribly Tired Tapir",
+    "typhon": "Super Starslayer TY-PHON - Sky Crisis",
+    "ty phon": "Super Starslayer TY-PHON - Sky Crisis",
+    "accesscode": "Accesscode Talker",
+    "apollousa": "Apollousa, Bow of the Goddess",
+    "masquerena": "I:P Masquerena",
+    "baronne": "Baronne de Fleur",
+    "dimension shifter": "Dimension Shifter",
+    "mirrorjade": "Mirrorjade the Iceblade Dragon",
+    "forbidden droplet": "Forbidden Droplet",
+    "feather duster": "Harpie's Feather Duster",
+    "fenrir": "Kashtira Fenrir",
+    "diabellstar": "Diabellstar the Black Witch",
+    "linguriboh": "Linguriboh",
+    # Slang italiano
+    "cenere": "Ash Blossom & Joyous Spring",
+    "cenere fiorita": "Ash Blossom & Joyous Spring",
+    "impermanenza": "Infinite Impermanence",
+    "vaso della prosperita": "Pot of Prosperity",
+    "vaso dei desideri": "Pot of Desires",
+}
+
+# Sigle e nomi brevi riconosciuti solo se scritti esattamente così (maiuscole
+# comprese): "ASH" è la carta, "ash" può essere una parola qualsiasi.
+CARD_ACRONYMS = {
+    "Ash": "Ash Blossom & Joyous Spring",
+    "ASH": "Ash Blossom & Joyous Spring",
+    "NIB": "Nibiru, the Primal Being",
+    "CBTG": "Called by the Grave",
+    "HFD": "Harpie's Feather Duster",
+    "DRNM": "Dark Ruler No More",
+    "TTT": "Triple Tactics Thrust",
+}
+
+
+class CardMentionExtractor:
+    """
+    Automa Aho-Corasick costruito una volta su nomi ufficiali, nomi localizzati
+    (`localized`, {nome IT: nome EN}) e alias.
+    Lavora su token (parole normalizzate), quindi i confini di parola sono
+    garantiti e la ricerca è lineare nella lunghezza della domanda.
+    `acronyms` ({sigla: nome}) sono parole singole confrontate con le maiuscole
+    del testo originale, fuori dall'automa.
+    """
+
+    def __init__(self, names, aliases=None, localized=None, min_name_length=6, acronyms=None):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        entries = [(name, name) for name in names]
+        entries += list((localized or {}).items())
+        entries += list((CARD_ALIASES if aliases is None else aliases).items())
+        for name, canonical in entries:
+            tokens = normalize_name(name).split()
+            # Nomi o alias di una sola parola corta ("Hand", "Lava") danno troppi falsi positivi
+            if not tokens or (len(tokens) == 1 and len(tokens[0]) < min_name_length):
+                continue
+            self._add(tokens, canonical)
+        self._build()
+        self._acronyms = dict(CARD_ACRONYMS if acronyms is None else acronyms)
+
+    def _add(self, tokens, canonical):
+        node = 0
+        for tok in tokens:
+            nxt = self._goto[node].get(tok)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][tok] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        if not self._out[node]:  # Il primo inserito vince (nomi ufficiali prima degli alias)
+            self._out[node].append((len(tokens), canonical))
+
+    def _build(self):
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for tok, child in self._goto[node].items():
+                queue.append(child)
+                state = self._fail[node]
+                while state and tok not in self._goto[state]:
+                    state = self._fail[state]
+                fail = self._goto[state].get(tok, 0)
+                self._fail[child] = fail if fail != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find_mentions(self, text):
+        """
+        Returns la lista dei nomi ufficiali menzionati in `text`, in ordine di
+        apparizione, senza duplicati. In caso di sovrapposizione vince il match
+        più a sinistra e poi il più lungo ("Ash Blossom" batte "Ash").
+        """
+        results = []
+        for _start, _end, canonical in self.find_mention_spans(text):
+            if canonical not in results:
+                results.append(canonical)
+        return results
+
+    def find_mention_spans(self, text):
+        """
+        Come find_mentions ma con la posizione: [(inizio, fine, nome)] in token
+        di normalize_name(text), fine esclusa, senza sovrapposizioni.
+        """
+        cased = _NON_ALNUM_CASED.sub(" ", _strip_accents(text)).split()
+        spans = []
+        state = 0
+        for i, original in enumerate(cased):
+            if original in self._acronyms:
+                spans.append((i, -1, self._acronyms[original]))
+            tok = original.lower()
+            while state and tok not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(tok, 0)
+            for length, canonical in self._out[state]:
+                spans.append((i - length + 1, -length, canonical))
+
+        results = []
+        covered_until = 0
+        for start, neg_len, canonical in sorted(spans):
+            if start < covered_until:
+                continue
+            covered_until = start - neg_len
+            results.append((start, covered_until, canonical))
+        return results
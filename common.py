@@ -0,0 +1,30 @@
+"""
+Utilità condivise dai moduli di cache e dai registri per API key.
+
+- CACHE_DIR: cartella delle cache persistenti (YGO_CACHE_DIR, default "cache").
+- connect(): connessione SQLite breve, commit all'uscita e chiusura sempre.
+- key_id(): identificativo corto di un segreto, per indicizzare limiter,
+  router, pool e client senza tenere la key in chiaro nei dizionari.
+"""
+import os
+import sqlite3
+import hashlib
+from contextlib import contextmanager
+
+CACHE_DIR = os.getenv("YGO_CACHE_DIR", "cache")
+
+
+@contextmanager
+def connect(path, timeout=10):
+    """Connessione breve: commit all'uscita e chiusura sempre."""
+    conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def key_id(secret):
+    """Hash sha256 troncato (16 caratteri esadecimali) di una key o di un insieme di key."""
+    return hashlib.sha256((secret or "").encode("utf-8")).hexdigest()[:16]
@@ -0,0 +1,208 @@
+"""
+Decklist in forma compatta per il contesto LLM: core list + differenze.
+
+I mazzi dello stesso archetipo condividono quasi tutto il Main Deck. Invece
+di ripetere ogni lista intera, per ogni archetipo si calcola una volta la
+core list (le carte giocate da almeno metà dei mazzi, nel numero di copie
+più frequente) e ogni mazzo diventa un delta (+N / -N carte) rispetto alla
+core. La codifica è senza perdita: apply_delta(core, encode_delta(mazzo,
+core)) ricostruisce il mazzo, e anche il testo reso (render_*) si può
+rileggere con parse_cards / parse_delta.
+
+Formato testo: elementi separati da " | " (i nomi delle carte possono
+contenere virgole), immagine opzionale tra < >:
+    core:  "3x Ash Blossom & Joyous Spring <url> | 2x Nibiru, the Primal Being"
+    delta: "+1 Droll & Lock Bird | -2 Nibiru, the Primal Being"  ("= core" se identico)
+"""
+import re
+from collections import Counter, defaultdict
+
+CORE_MIN_SHARE = 0.5  # Quota minima di mazzi che giocano la carta per entrare nella core
+MIN_DECKS_FOR_CORE = 2  # Sotto questa soglia l'archetipo resta in lista intera
+SEPARATOR = " | "
+SAME_AS_CORE = "= core"
+
+# Sezioni dei mazzi YGOProDeck (etichetta, campo raw dell'item)
+DECK_SECTIONS = (("Main Deck", "raw_main"), ("Extra Deck", "raw_extra"), ("Side Deck", "raw_side"))
+
+_CARD_RE = re.compile(r"^(\d+)x (.+?)(?: <([^>]*)>)?$")
+_DELTA_RE = re.compile(r"^([+-]\d+) (.+?)(?: <([^>]*)>)?$")
+
+
+def card_counts(raw_cards):
+    """{nome: copie} da una lista raw [{"amount": N, "card": {"name": ...}}]."""
+    counts = Counter()
+    for entry in raw_cards or []:
+        name = (entry.get("card") or {}).get("name")
+        if name:
+            counts[name] += entry.get("amount", 1)
+    return dict(counts)
+
+
+def card_images(raw_cards):
+    return {(e.get("card") or {}).get("name"): (e.get("card") or {}).get("image")
+            for e in raw_cards or [] if (e.get("card") or {}).get("image")}
+
+
+def core_list(decks, min_share=CORE_MIN_SHARE):
+    """
+    Core list di un gruppo di mazzi ({nome: copie} ciascuno): carte presenti
+    in almeno `min_share` dei mazzi, con il numero di copie più frequente
+    (a parità, il più alto).
+    """
+    if not decks:
+        return {}
+    copies = defaultdict(Counter)
+    for deck in decks:
+        for name, count in deck.items():
+            copies[name][count] += 1
+    core = {}
+    for name, by_count in copies.items():
+        if sum(by_count.values()) / len(decks) >= min_share:
+            core[name] = max(by_count.items(), key=lambda item: (item[1], item[0]))[0]
+    return core
+
+
+def encode_delta(deck, core):
+    """{nome: differenza di copie} rispetto alla core (solo le carte che cambiano)."""
+    delta = {}
+    for name in set(deck) | set(core):
+        diff = deck.get(name, 0) - core.get(name, 0)
+        if diff:
+            delta[name] = diff
+    return delta
+
+
+def apply_delta(core, delta):
+    deck = dict(core)
+    for name, diff in delta.items():
+        deck[name] = deck.get(name, 0) + diff
+    return {name: count for name, count in deck.items() if count}
+
+
+def _with_image(name, images):
+    url = (images or {}).get(name)
+    return f"{name} <{url}>" if url else name
+
+
+def render_cards(counts, images=None):
+    ordered = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return SEPARATOR.join(f"{count}x {_with_image(name, images)}" for name, count in ordered)
+
+
+def render_delta(delta, images=None):
+    """
+    Aggiunte prima, poi rimozioni; "= core" se il mazzo coincide con la core.
+    L'immagine serve solo per le aggiunte (le carte rimosse sono già nella core).
+    """
+    if not delta:
+        return SAME_AS_CORE
+    ordered = sorted(delta.items(), key=lambda item: (item[1] < 0, -abs(item[1]), item[0]))
+    return SEPARATOR.join(f"{diff:+d} {_with_image(name, images) if diff > 0 else name}" for name, diff in ordered)
+
+
+def parse_cards(text):
+    counts = {}
+    for part in filter(None, (p.strip() for p in text.split(SEPARATOR))):
+        match = _CARD_RE.match(part)
+        if match:
+            counts[match.group(2)] = counts.get(match.group(2), 0) + int(match.group(1))
+    return counts
+
+
+def parse_delta(text):
+    if text.strip() == SAME_AS_CORE:
+        return {}
+    delta = {}
+    for part in filter(None, (p.strip() for p in text.split(SEPARATOR))):
+        match = _DELTA_RE.match(part)
+        if match:
+            delta[match.group(2)] = delta.get(match.group(2), 0) + int(match.group(1))
+    return delta
+
+
+def build_cores(decks_by_archetype, min_decks=MIN_DECKS_FOR_CORE):
+    """{archetipo: core} per gli archetipi con almeno `min_decks` mazzi."""
+    return {arch: core_list(decks) for arch, decks in decks_by_archetype.items() if len(decks) >= min_decks}
+
+
+def encode_report_items(items, archetype_key="deck_text", sections=DECK_SECTIONS):
+    """
+    Testo compatto per gli item del report YGOProDeck (con raw_main/raw_extra/raw_side).
+    Returns (testo delle core list, [dettaglio per ogni item, stesso ordine]).
+    Gli item senza liste raw tengono il loro "details" originale.
+    """
+    images = {}
+    grouped = defaultdict(lambda: defaultdict(list))
+    n_decks = Counter()
+    for item in items:
+        if not any(item.get(field) for _label, field in sections):
+            continue
+        arch = item.get(archetype_key) or "Unknown"
+        n_decks[arch] += 1
+        for _label, field in sections:
+            grouped[arch][field].append(card_counts(item.get(field)))
+            images.update(card_images(item.get(field)))
+
+    cores = {}
+    core_lines = []
+    for arch in sorted(grouped, key=lambda a: (-n_decks[a], a)):
+        if n_decks[arch] < MIN_DECKS_FOR_CORE:
+            continue
+        cores[arch] = {field: core_list(grouped[arch][field]) for _label, field in sections}
+        core_lines.append(f"- CORE {arch} ({n_decks[arch]} mazzi)\n")
+        for label, field in sections:
+            if cores[arch][field]:
+                core_lines.append(f"   {label}: {render_cards(cores[arch][field], images)}\n")
+
+    details = []
+    for item in items:
+        if not any(item.get(field) for _label, field in sections):
+            details.append(item.get("details", ""))
+            continue
+        arch = item.get(archetype_key) or "Unknown"
+        if arch in cores:
+            lines = [f"\n   [DELTA vs CORE {arch}]"]
+            for label, field in sections:
+                delta = encode_delta(card_counts(item.get(field)), cores[arch][field])
+                lines.append(f"   {label}: {render_delta(delta, images)}")
+        else:
+            lines = ["\n   [LISTA COMPLETA]"]
+            for label, field in sections:
+                counts = card_counts(item.get(field))
+                if counts:
+                    lines.append(f"   {label}: {render_cards(counts, images)}")
+        details.append("\n".join(lines) + "\n")
+    return "".join(core_lines), details
+
+
+if __name__ == "__main__":
+    # Verifica round trip e risparmio sui mazzi YuGiOhMeta salvati: python deck_delta.py [latest_decks.json]
+    import sys
+    import json
+    path = sys.argv[1] if len(sys.argv) > 1 else "latest_decks.json"
+    with open(path, "r", encoding="utf-8") as f:
+        raw_decks = json.load(f)
+
+    by_arch = defaultdict(list)
+    for d in raw_decks:
+        by_arch[(d.get("deckType") or {}).get("name", "Unknown")].append(card_counts(d.get("main")))
+    cores = build_cores(by_arch)
+
+    full_chars = delta_chars = 0
+    for arch, decks in by_arch.items():
+        core = cores.get(arch)
+        for deck in decks:
+            full_text = render_cards(deck)
+            full_chars += len(full_text)
+            assert parse_cards(full_text) == deck
+            if core is None:
+                delta_chars += len(full_text)
+                continue
+            delta_text = render_delta(encode_delta(deck, core))
+            delta_chars += len(delta_text)
+            assert apply_delta(core, parse_delta(delta_text)) == deck, arch
+    delta_chars += sum(len(render_cards(core)) for core in cores.values())
+    print(f"{len(raw_decks)} mazzi, {len(by_arch)} archetipi ({len(cores)} con core): round trip OK")
+    print(f"Main Deck: {full_chars} caratteri in lista intera -> {delta_chars} con core + delta "
+          f"({full_chars / max(1, delta_chars):.1f}x)")
@@ -0,0 +1,171 @@
+"""
+Rendering lato server delle decklist come immagini composite.
+
+Ogni sezione (Mostri/Magie/Trappole/Extra/Side) diventa un'unica immagine
+a griglia composta con Pillow, invece di un widget st.image per copia.
+Le immagini sono salvate con chiave = hash del contenuto della sezione nella
+cartella static/ di Streamlit (servite per URL, server.enableStaticServing),
+contate nel limite di dimensione del mirror immagini, e accompagnate da una
+mappa (x, y, w, h, nome) per hover/click.
+"""
+import io
+import os
+import hashlib
+import html
+import json
+import urllib.parse
+
+from PIL import Image, ImageDraw
+
+from image_cache import get_image_cache
+
+# Streamlit serve i file di static/ (accanto ad app.py) su app/static/
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DECK_IMAGE_DIR = os.path.join(STATIC_DIR, "decks")
+DECK_IMAGE_URL = "app/static/decks"
+RENDER_VERSION = 1  # Da incrementare se cambia il layout (invalida le immagini salvate)
+
+CARD_WIDTH = 160
+CARD_HEIGHT = round(CARD_WIDTH * 614 / 421)  # Proporzioni carta YGOProDeck
+COLUMNS = 8
+GAP = 4
+BACKGROUND = (14, 17, 23)
+PLACEHOLDER = (60, 60, 70)
+HEADER_HEIGHT = 32
+
+
+def _cards_key(cards, columns, extra=""):
+    payload = json.dumps(
+        [RENDER_VERSION, columns, CARD_WIDTH, extra, [(c.get("name", ""), c.get("url", "")) for c in cards]],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def section_hotspots(cards, columns=COLUMNS):
+    """Mappa delle carte nell'immagine: [(x, y, w, h, nome)] in pixel."""
+    spots = []
+    for i, card in enumerate(cards):
+        row, col = divmod(i, columns)
+        x = GAP + col * (CARD_WIDTH + GAP)
+        y = GAP + row * (CARD_HEIGHT + GAP)
+        spots.append((x, y, CARD_WIDTH, CARD_HEIGHT, card.get("name", "")))
+    return spots
+
+
+def section_size(count, columns=COLUMNS):
+    rows = max(1, -(-count // columns))
+    cols = min(max(count, 1), columns)
+    return GAP + cols * (CARD_WIDTH + GAP), GAP + rows * (CARD_HEIGHT + GAP)
+
+
+def _card_tile(data, name):
+    """Returns (tessera, True) con l'immagine della carta, (segnaposto col nome, False) se manca."""
+    if data:
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                return img.convert("RGB").resize((CARD_WIDTH, CARD_HEIGHT), Image.LANCZOS), True
+        except Exception:
+            pass
+    tile = Image.new("RGB", (CARD_WIDTH, CARD_HEIGHT), PLACEHOLDER)
+    ImageDraw.Draw(tile).multiline_text((6, 6), "\n".join(name[i:i + 18] for i in range(0, len(name), 18)),
+                                        fill=(230, 230, 230))
+    return tile, False
+
+
+def _compose(cards, columns):
+    """Returns (immagine, completa): completa è False se almeno una tessera è un segnaposto."""
+    images = get_image_cache().prefetch([c.get("url") for c in cards], CARD_WIDTH)
+    canvas = Image.new("RGB", section_size(len(cards), columns), BACKGROUND)
+    complete = True
+    for (x, y, _w, _h, name), card in zip(section_hotspots(cards, columns), cards):
+        tile, found = _card_tile(images.get(card.get("url")), name)
+        canvas.paste(tile, (x, y))
+        complete = complete and found
+    return canvas, complete
+
+
+def _cached_render(key, build):
+    """
+    Returns (percorso su disco o None, bytes JPEG).
+    Un'immagine con segnaposto (download delle carte fallito) non viene
+    salvata: al prossimo render si riprova con le immagini vere.
+    """
+    cache = get_image_cache()
+    path = cache.file_path(key)
+    if path:
+        try:
+            with open(path, "rb") as f:
+                return path, f.read()
+        except OSError:
+            pass
+    image, complete = build()
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=85, optimize=True)
+    data = out.getvalue()
+    if not complete:
+        return None, data
+    return cache.put_file(key, os.path.join(DECK_IMAGE_DIR, f"{key}.jpg"), data), data
+
+
+def render_section(cards, columns=COLUMNS):
+    """
+    cards: [{"name": ..., "url": ...}] (una voce per copia).
+    Returns (URL dell'immagine o None se non salvata, bytes JPEG, hotspots).
+    """
+    if not cards:
+        return None, None, []
+    path, data = _cached_render(_cards_key(cards, columns), lambda: _compose(cards, columns))
+    url = f"{DECK_IMAGE_URL}/{os.path.basename(path)}" if path else None
+    return url, data, section_hotspots(cards, columns)
+
+
+def render_deck(sections, columns=COLUMNS):
+    """
+    Immagine unica dell'intero mazzo da condividere.
+    sections: [(etichetta, cards)] nell'ordine di visualizzazione.
+    """
+    sections = [(label, cards) for label, cards in sections if cards]
+    if not sections:
+        return None
+    key = _cards_key([c for _label, cards in sections for c in cards], columns,
+                     extra="|".join(f"{label}:{len(cards)}" for label, cards in sections))
+
+    def build():
+        composed = [(label, _compose(cards, columns)) for label, cards in sections]
+        parts = [(label, img) for label, (img, _complete) in composed]
+        width = max(img.width for _label, img in parts)
+        height = sum(HEADER_HEIGHT + img.height for _label, img in parts)
+        canvas = Image.new("RGB", (width, height), BACKGROUND)
+        draw = ImageDraw.Draw(canvas)
+        y = 0
+        for label, img in parts:
+            draw.text((GAP * 2, y + 10), label, fill=(255, 204, 0))
+            canvas.paste(img, (0, y + HEADER_HEIGHT))
+            y += HEADER_HEIGHT + img.height
+        return canvas, all(complete for _label, (_img, complete) in composed)
+
+    return _cached_render(key, build)[1]
+
+
+def section_html(image_url, hotspots, columns=COLUMNS):
+    """
+    HTML responsive: immagine (per URL) + aree trasparenti posizionate in
+    percentuale, con il nome della carta come tooltip (hover) e link alla
+    ricerca (click).
+    """
+    width, height = section_size(len(hotspots), columns)
+    areas = []
+    for x, y, w, h, name in hotspots:
+        safe_name = html.escape(name, quote=True)
+        href = html.escape("https://ygoprodeck.com/card-database/?name=" + urllib.parse.quote_plus(name), quote=True)
+        areas.append(
+            f'<a href="{href}" target="_blank" title="{safe_name}" style="position:absolute;'
+            f'left:{100 * x / width:.3f}%;top:{100 * y / height:.3f}%;'
+            f'width:{100 * w / width:.3f}%;height:{100 * h / height:.3f}%;"></a>'
+        )
+    return (
+        f'<div style="position:relative;display:inline-block;max-width:100%;">'
+        f'<img src="{html.escape(image_url, quote=True)}" style="width:100%;max-width:{width}px;display:block;">'
+        f'{"".join(areas)}</div>'
+    )
@@ -0,0 +1,80 @@
+"""
+Client Gemini per API key, condivisi dal processo.
+
+genai.configure() modifica lo stato globale del modulo: con più sessioni
+Streamlit (thread diversi) e key diverse le configurazioni si sovrascrivono
+a vicenda. Qui ogni key ha il proprio client generativo (e quindi la propria
+connessione gRPC), creato una volta sola; gli handle GenerativeModel vengono
+riusati tra i rerun invece di essere ricostruiti a ogni chiamata.
+
+Il client è costruito con l'API pubblica di google.ai.generativelanguage
+(client_options con la api_key). GenerativeModel invece non accetta un client
+dall'esterno: l'unico aggancio è l'attributo `_client`, che l'SDK legge solo
+se è None. Per questo la versione dell'SDK è vincolata (vedi requirements.txt)
+e verificata all'import: se l'aggancio sparisce si fallisce subito, non con
+chiamate silenziosamente instradate sulla configurazione globale.
+"""
+import threading
+
+import google.generativeai as genai
+from google.ai import generativelanguage as glm
+
+from common import key_id
+from llm_providers import canonical_model_name
+
+# Versioni dell'SDK su cui l'aggancio di `_client` è stato verificato
+SUPPORTED_SDK_PREFIXES = ("0.8.",)
+
+_clients = {}
+_models = {}
+_lock = threading.Lock()
+
+
+def check_sdk():
+    """Verifica che l'SDK installato esponga ancora l'aggancio usato da get_model."""
+    version = getattr(genai, "__version__", "")
+    if not version.startswith(SUPPORTED_SDK_PREFIXES):
+        raise ImportError(
+            f"google-generativeai {version or '?'} non supportato da gemini_clients "
+            f"(supportate: {', '.join(p + 'x' for p in SUPPORTED_SDK_PREFIXES)}): "
+            "verificare GenerativeModel._client prima di aggiornare il pin."
+        )
+    probe = genai.GenerativeModel("gemini-probe")
+    if getattr(probe, "_client", object()) is not None:
+        raise ImportError(
+            f"google-generativeai {version}: GenerativeModel non espone più `_client`, "
+            "impossibile legare il modello al client della key."
+        )
+
+
+check_sdk()
+
+
+def get_client(api_key):
+    """Client generativo dedicato alla key (creato al primo uso, poi riusato)."""
+    client_id = key_id(api_key)
+    with _lock:
+        client = _clients.get(client_id)
+        if client is None:
+            client = _clients[client_id] = glm.GenerativeServiceClient(
+                client_options={"api_key": api_key}
+            )
+        return client
+
+
+def get_model(model_name, api_key):
+    """
+    GenerativeModel legato a `api_key`, condiviso tra sessioni e rerun.
+    Gli handle sono senza stato (niente chat), quindi riusarli tra thread è sicuro.
+    """
+    cache_key = (key_id(api_key), canonical_model_name(model_name))
+    with _lock:
+        model = _models.get(cache_key)
+        if model is not None:
+            return model
+    client = get_client(api_key)
+    model = genai.GenerativeModel(cache_key[1])
+    # Unico punto non pubblico: verificato da check_sdk() all'import
+    model._client = client
+    with _lock:
+        return _models.setdefault(cache_key, model)
@@ -0,0 +1,214 @@
+"""
+Mirror locale delle immagini carta con miniature pre-ridimensionate.
+
+Ogni immagine viene scaricata una volta sola dal CDN di YGOProDeck, salvata
+per contenuto (sha256) e ridotta con Pillow nelle larghezze richieste dalla UI.
+Il mirror ha una dimensione massima: oltre il limite si eliminano i file usati
+meno di recente (LRU). Nello stesso limite rientrano i file derivati dalle
+immagini (es. le decklist composte di deck_renderer, vedi put_file).
+"""
+import io
+import os
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+
+from common import CACHE_DIR, connect
+
+IMAGE_DIR = os.path.join(CACHE_DIR, "images")
+MAX_CACHE_BYTES = int(os.getenv("YGO_IMAGE_CACHE_MB", "512")) * 1024 * 1024
+ACCESS_TOUCH_INTERVAL = 60  # Secondi: non riscriviamo last_access a ogni rerun
+DERIVED_WIDTH = -1  # Valore di files.width per i file derivati (chiave libera al posto del digest)
+
+HEADERS = {"User-Agent": "Mozilla/5.0 (AI Yu-Gi-Oh! Judge image mirror)"}
+
+
+class ImageCache:
+    """Cache su disco content-addressed, thread-safe, con eviction LRU."""
+
+    def __init__(self, root=IMAGE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, digest TEXT NOT NULL)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    digest TEXT NOT NULL,
+                    width INTEGER NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (digest, width)
+                )
+            """)
+
+    def _connect(self):
+        return connect(os.path.join(self.root, "index.sqlite"))
+
+    def _blob_path(self, digest, width):
+        suffix = "orig" if not width else f"w{width}"
+        return os.path.join(self.root, "blobs", digest[:2], f"{digest}_{suffix}")
+
+    def _store(self, conn, digest, width, data, path=None):
+        path = path or self._blob_path(digest, width)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        conn.execute(
+            "INSERT OR REPLACE INTO files (digest, width, path, size, last_access) VALUES (?, ?, ?, ?, ?)",
+            (digest, width, path, len(data), time.time())
+        )
+
+    def _read(self, conn, digest, width):
+        row = conn.execute(
+            "SELECT path, last_access FROM files WHERE digest = ? AND width = ?", (digest, width)
+        ).fetchone()
+        if row is None:
+            return None
+        path, last_access = row
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            conn.execute("DELETE FROM files WHERE digest = ? AND width = ?", (digest, width))
+            return None
+        if time.time() - last_access > ACCESS_TOUCH_INTERVAL:
+            conn.execute(
+                "UPDATE files SET last_access = ? WHERE digest = ? AND width = ?", (time.time(), digest, width)
+            )
+        return data
+
+    @staticmethod
+    def _resize(data, width):
+        with Image.open(io.BytesIO(data)) as img:
+            if img.width <= width:
+                return data
+            height = round(img.height * width / img.width)
+            thumb = img.convert("RGB").resize((width, height), Image.LANCZOS)
+            out = io.BytesIO()
+            thumb.save(out, format="JPEG", quality=85, optimize=True)
+            return out.getvalue()
+
+    def _download(self, url):
+        response = requests.get(url, headers=HEADERS, timeout=10)
+        response.raise_for_status()
+        return response.content
+
+    def get(self, url, width=None):
+        """
+        Bytes dell'immagine (miniatura larga `width` px se indicata).
+        Scarica l'originale solo al primo accesso. Returns None se non disponibile.
+        """
+        if not url:
+            return None
+        width = int(width or 0)
+
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT digest FROM urls WHERE url = ?", (url,)).fetchone()
+            if row is not None:
+                data = self._read(conn, row[0], width)
+                if data is not None:
+                    return data
+
+        # Download fuori dal lock: più immagini in parallelo
+        original = None
+        if row is not None:
+            with self._lock, self._connect() as conn:
+                original = self._read(conn, row[0], 0)
+        if original is None:
+            try:
+                original = self._download(url)
+            except Exception as e:
+                print(f"Image Download Error ({url}): {e}")
+                return None
+
+        digest = hashlib.sha256(original).hexdigest()
+        try:
+            data = self._resize(original, width) if width else original
+        except Exception as e:
+            print(f"Image Resize Error ({url}): {e}")
+            data = original
+
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO urls (url, digest) VALUES (?, ?)", (url, digest))
+            self._store(conn, digest, 0, original)
+            if width:
+                self._store(conn, digest, width, data)
+            self._evict(conn)
+        return data
+
+    def file_path(self, key):
+        """Percorso di un file derivato salvato con put_file, o None se assente (o già eliminato dalla LRU)."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT path, last_access FROM files WHERE digest = ? AND width = ?", (key, DERIVED_WIDTH)
+            ).fetchone()
+            if row is None:
+                return None
+            path, last_access = row
+            if not os.path.exists(path):
+                conn.execute("DELETE FROM files WHERE digest = ? AND width = ?", (key, DERIVED_WIDTH))
+                return None
+            if time.time() - last_access > ACCESS_TOUCH_INTERVAL:
+                conn.execute(
+                    "UPDATE files SET last_access = ? WHERE digest = ? AND width = ?", (time.time(), key, DERIVED_WIDTH)
+                )
+            return path
+
+    def put_file(self, key, path, data):
+        """Salva un file derivato in `path`, contandolo nel limite di dimensione del mirror."""
+        with self._lock, self._connect() as conn:
+            self._store(conn, key, DERIVED_WIDTH, data, path)
+            self._evict(conn)
+        return path
+
+    def prefetch(self, urls, width=None, max_workers=8):
+        """Scarica/ridimensiona in parallelo. Returns {url: bytes o None}."""
+        unique = list(dict.fromkeys(u for u in urls if u))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(unique, executor.map(lambda u: self.get(u, width), unique)))
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        for digest, width, path, size in conn.execute(
+            "SELECT digest, width, path, size FROM files ORDER BY last_access"
+        ).fetchall():
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            conn.execute("DELETE FROM files WHERE digest = ? AND width = ?", (digest, width))
+            total -= size
+        # URL che non hanno più nessun file associato
+        conn.execute("DELETE FROM urls WHERE digest NOT IN (SELECT DISTINCT digest FROM files)")
+
+    def stats(self):
+        """(numero file, byte occupati)."""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files").fetchone()
+
+
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """ImageCache condivisa dal processo."""
+    global _image_cache
+    with _image_cache_lock:
+        if _image_cache is None:
+            _image_cache = ImageCache()
+        return _image_cache
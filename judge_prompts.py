@@ -0,0 +1,159 @@
+"""
+Costruzione del prompt del verdetto (Step 3 del Judge).
+
+Condivisa dall'app Streamlit e dal batch judge (batch_judge.py), così i
+due percorsi producono esattamente lo stesso prompt. Qui anche i prompt di
+follow-up e di rivalutazione OCG; tutti passano dal compilatore con budget
+di token (prompt_compiler).
+"""
+
+from ruling_store import get_ruling_store, ruling_keys, format_rulings
+from prompt_compiler import Section, compile_prompt
+
+# Da incrementare quando cambia il prompt del verdetto (invalida la cache dei verdetti)
+JUDGE_PROMPT_VERSION = 2
+
+VERDICT_SEPARATOR = "---DETTAGLI---"
+
+NO_EXTRA_RULINGS = "Nessun ruling extra in archivio per queste carte."
+
+
+def split_verdict(text):
+    """(verdetto breve, dettagli) — dettagli è None finché il separatore non è arrivato."""
+    short_answer, sep, deep_dive = text.partition(VERDICT_SEPARATOR)
+    return short_answer, (deep_dive if sep else None)
+
+
+def card_context_entry(card_data):
+    """Blocco di contesto di una carta: nome, tipo/ATK/DEF e testo aggiornato."""
+    # FIX: Add ATK/DEF/Type to context for accurate stat rulings
+    c_type = card_data.get('type', 'Unknown')
+    c_atk = f"ATK: {card_data.get('atk', '?')}" if 'Monster' in c_type else ""
+    c_def = f"DEF: {card_data.get('def', '?')}" if 'Monster' in c_type else ""
+    c_stats = f"[{c_type} | {c_atk} {c_def}]".replace("  ", " ").strip()
+    return f"NOME UFFICIALE: {card_data['name']}\nDATI: {c_stats}\nTESTO AGGIORNATO: {card_data['desc']}\n\n"
+
+
+def build_cards_context(cards_data):
+    return "".join(card_context_entry(card_data) for card_data in cards_data)
+
+
+def extra_rulings_for(cards_data, missing_names=()):
+    """Solo i ruling in archivio che riguardano le carte coinvolte (entro il budget di token)."""
+    rulings = get_ruling_store().relevant(ruling_keys(cards_data, missing_names))
+    return format_rulings(rulings) if rulings else NO_EXTRA_RULINGS
+
+
+JUDGE_TEMPLATE = """
+                 Sei un **HEAD JUDGE UFFICIALE DI YU-GI-OH** (Livello 3).
+                 Il tuo compito è emettere ruling tecnici estremamente precisi e pignoli.
+         
+                REGOLAMENTO CRITICO (PSCT - Problem Solving Card Text):
+                - **ALGORITMO PUNTEGGIATURA**: Scansiona il testo carattere per carattere. Cerchi i "due punti" (:).
+                - **SE C'È IL DUE PUNTI (:)**: L'effetto SI ATTIVA (Starts a Chain). È un effetto Innescato o Rapido. NON è inerente. (Esempio: "If you control...: You can Special Summon...").
+                - **SE NON C'È**: Solo se mancano sia : che ; allora è un'Evocazione Inerente (Non-Activated).
+                - **Damage Step**: Sii ESTREMAMENTE severo. Solo carte che modificano direttamente ATK/DEF, Counter Traps, o effetti che negano specificamente *l'attivazione* (non l'effetto) possono essere attivate qui.
+                - **Condizioni di Gioco (Game State)**: Verifica sempre se l'azione è permessa dallo stato attuale del gioco.
+                - **Statistiche & Floodgate**: PRIMA di giudicare, calcola l'ATK/DEF attuale considerando Magie/Trappole continue in campo (es: carte che aumentano ATK). Controlla se esistono Floodgate attivi (es: "Super Starslayer TY-PHON - Sky Crisis", "Bagooska") che inibiscono l'attivazione in base a queste stats *modificate*.
+         
+                 TESTI UFFICIALI (Fonte di Verità):
+                 ---
+                 {cards_context}
+                 ---
+                 
+                 DATABASE RULING EXTRA (PRECEDENZA ASSOLUTA):
+                 {extra_rulings_db}
+                 ---
+         
+                 SCENARIO UTENTE:
+                 "{question}"
+                 
+                 ISTRUZIONI:
+                 1. Analizza lo scenario cercando cavilli legali.
+                 2. Se la mossa è illegale, dillo chiaramente.
+                 3. RAGIONA PASSO-PASSO prima di rispondere.
+                 
+                 FORMATO RISPOSTA RICHIESTO:
+                 Devi dividere la risposta in due parti separate da una riga con scritto esattamente "---DETTAGLI---".
+                 
+                 Parte 1 (Prima di ---DETTAGLI---):
+                 - Risposta diretta e concisa (es: "Sì, legale" oppure "No, mossa illegale").
+                 
+                 ---DETTAGLI---
+                 
+                 Parte 2 (Dopo ---DETTAGLI---):
+                 - Analisi tecnica step-by-step.
+                 - Cita le regole del Damage Step se rilevante.
+                 """
+
+FOLLOWUP_TEMPLATE = """
+                CONTESTO CARTE:
+                {cards_context}
+                
+                VERDETTO PRECEDENTE:
+                {verdict}
+                
+                DOMANDA UTENTE:
+                {question}
+                """
+
+OCG_REVAL_TEMPLATE = """
+                SEI UN HEAD JUDGE DI YU-GI-OH.
+                
+                SITUAZIONE PRECEDENTE:
+                Hai dato un verdetto su una domanda dell'utente.
+                Tuttavia, sono stati appena trovati dei **RULING UFFICIALI OCG (Giapponesi)** specifici per questo caso.
+                
+                I ruling OCG hanno la precedenza tecnica su qualsiasi logica generale.
+                
+                TESTO CARTE:
+                {cards_context}
+                
+                NUOVI RULING TROVATI (EVIDENZA CRITICA):
+                ---
+                {ocg_rulings}
+                ---
+                
+                DOMANDA UTENTE:
+                "{question}"
+                
+                COMPITO:
+                1. Leggi attentamente i nuovi ruling trovati.
+                2. Se contraddicono la tua logica precedente, AMMETTILO e correggi il verdetto.
+                3. Se confermano la tua logica, usali come prova definitiva.
+                4. Fornisci un verdetto finale SINTETICO ma TECNICO.
+                
+                FORMATO RISPOSTA:
+                "Verdetto Aggiornato: [Sì/No/Dipende]"
+                "Spiegazione: [Spiegazione tecnica citando il ruling]"
+                """
+
+
+def card_names_only(cards_context):
+    """Versione ridotta del contesto carte (solo i nomi), se i testi completi non stanno nel budget."""
+    return "\n".join(line for line in cards_context.splitlines() if line.startswith("NOME UFFICIALE"))
+
+
+def build_judge_prompt(cards_context, question, extra_rulings_db=NO_EXTRA_RULINGS, model_name=None):
+    # Testi delle carte e domanda sempre interi; i ruling extra sono i primi a ridursi
+    return compile_prompt("judge", JUDGE_TEMPLATE, [
+        Section("question", question, priority=0),
+        Section("cards_context", cards_context, priority=0),
+        Section("extra_rulings_db", extra_rulings_db, priority=2),
+    ], model_name).text
+
+
+def build_followup_prompt(cards_context, verdict, question, model_name=None):
+    return compile_prompt("followup", FOLLOWUP_TEMPLATE, [
+        Section("question", question, priority=0),
+        Section("verdict", verdict, priority=1),
+        Section("cards_context", cards_context, priority=2, fallback=card_names_only(cards_context)),
+    ], model_name).text
+
+
+def build_ocg_reval_prompt(cards_context, ocg_rulings, question, model_name=None):
+    return compile_prompt("ocg_reval", OCG_REVAL_TEMPLATE, [
+        Section("question", question, priority=0),
+        Section("ocg_rulings", ocg_rulings, priority=1),
+        Section("cards_context", cards_context, priority=2, fallback=card_names_only(cards_context)),
+    ], model_name).text
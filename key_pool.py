@@ -0,0 +1,87 @@
+"""
+Pool di API key Gemini per il deploy condiviso.
+
+In modalità pool le chiamate vengono distribuite a rotazione (round-robin)
+su tutte le key configurate in stored_keys. Una key che risponde 429 va in
+cooldown e viene saltata finché non torna disponibile; se il quota
+giornaliero è esaurito il cooldown è molto più lungo.
+"""
+import time
+import threading
+
+from common import key_id
+
+DAILY_QUOTA_COOLDOWN = 3600  # secondi: il quota giornaliero non torna con un backoff breve
+
+
+def is_quota_error(error_str):
+    return "429" in error_str or "quota" in error_str.lower()
+
+
+def is_daily_quota_error(error_str):
+    lowered = error_str.lower()
+    return "perday" in lowered.replace(" ", "").replace("_", "") or "per day" in lowered
+
+
+class KeyPool:
+    """Rotazione thread-safe delle key con cooldown per key."""
+
+    def __init__(self, keys):
+        # keys: {nome profilo: api key}
+        self._names = list(keys)
+        self._keys = dict(keys)
+        self._cooldown_until = {name: 0.0 for name in self._names}
+        self._calls = {name: 0 for name in self._names}
+        self._errors = {name: 0 for name in self._names}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def next_key(self):
+        """
+        (nome, key) della prossima key disponibile a rotazione.
+        Se sono tutte in cooldown, quella che si libera per prima.
+        """
+        with self._lock:
+            now = time.time()
+            count = len(self._names)
+            for offset in range(count):
+                name = self._names[(self._next + offset) % count]
+                if self._cooldown_until[name] <= now:
+                    self._next = (self._next + offset + 1) % count
+                    break
+            else:
+                name = min(self._names, key=self._cooldown_until.get)
+            self._calls[name] += 1
+            return name, self._keys[name]
+
+    def cooldown(self, name, seconds):
+        with self._lock:
+            self._errors[name] += 1
+            self._cooldown_until[name] = max(self._cooldown_until[name], time.time() + seconds)
+
+    def status(self):
+        """[(nome, secondi di cooldown residui, chiamate, errori 429)]."""
+        with self._lock:
+            now = time.time()
+            return [
+                (name, max(0.0, self._cooldown_until[name] - now), self._calls[name], self._errors[name])
+                for name in self._names
+            ]
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_key_pool(keys):
+    """KeyPool condiviso dal processo per questo insieme di key."""
+    pool_id = key_id("|".join(f"{name}={key}" for name, key in sorted(keys.items())))
+    with _pools_lock:
+        pool = _pools.get(pool_id)
+        if pool is None:
+            pool = _pools[pool_id] = KeyPool(keys)
+        return pool
+
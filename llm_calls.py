@@ -0,0 +1,111 @@
+"""
+Chiamate LLM con rate limiter, pool di key, router dei modelli e retry.
+
+Logica condivisa dall'app Streamlit e dal batch judge (batch_judge.py):
+nessuna dipendenza da Streamlit, le notifiche passano da `notify`.
+"""
+import time
+
+from llm_providers import get_provider, canonical_model_name
+from rate_limiter import get_rate_limiter, estimate_tokens
+from key_pool import is_quota_error, is_daily_quota_error, DAILY_QUOTA_COOLDOWN
+from model_router import get_model_router
+
+
+def usage_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) or None
+
+
+def resolve_model(api_key):
+    """(handle, nome) del modello scelto dal router per la key."""
+    model_name = get_model_router(api_key).current()
+    return get_provider().get_model(model_name, api_key), model_name
+
+
+def call_limited(model, api_key, prompt_tokens, call, pool=None, notify=None, timings=None):
+    """
+    Esegue call(modello) -> (testo, token usati o None) rispettando il budget della key.
+    Le chiamate si mettono in coda nel limiter; su 429 il limiter va in pausa
+    (backoff con jitter) per tutti i chiamanti e la chiamata riprova.
+    Con `pool` ogni tentativo usa la prossima key disponibile a rotazione.
+    `timings` (dict opzionale) riceve queue_s, llm_s e attempts.
+    """
+    notify = notify or print
+    max_retries = max(3, len(pool)) if pool else 3
+    model_name = canonical_model_name(model.model_name)
+    if timings is not None:
+        timings.update(queue_s=0.0, llm_s=0.0, attempts=0)
+
+    for attempt in range(max_retries):
+        key_name = None
+        if pool:
+            key_name, api_key = pool.next_key()
+        bound_model = get_provider().get_model(model_name, api_key)
+        limiter = get_rate_limiter(api_key)
+        router = get_model_router(api_key)
+
+        expected = limiter.expected_wait(prompt_tokens)
+        if expected >= 1:
+            notify(f"🚦 Coda Gemini: {limiter.queue_depth} richieste in attesa, ~{expected:.0f}s")
+        queued = limiter.acquire(prompt_tokens)
+        start = time.perf_counter()
+        try:
+            text, used_tokens = call(bound_model)
+            elapsed = time.perf_counter() - start
+            limiter.settle(prompt_tokens, used_tokens or prompt_tokens + estimate_tokens(text))
+            router.report(model_name, elapsed, True)
+            return text
+        except Exception as e:
+            elapsed = time.perf_counter() - start
+            error_str = str(e)
+            if not is_quota_error(error_str):
+                # Errore del modello (non di quota): il router decide se passare al candidato successivo
+                next_model = router.report(model_name, elapsed, False, error=error_str)
+                if next_model != model_name and attempt < max_retries - 1:
+                    notify(f"🔁 {model_name} non risponde, passo a {next_model}...")
+                    model_name = next_model
+                    continue
+            elif attempt < max_retries - 1:
+                wait_time = limiter.backoff(attempt)
+                if pool:
+                    pool.cooldown(key_name, DAILY_QUOTA_COOLDOWN if is_daily_quota_error(error_str) else wait_time)
+                    notify(f"⚠️ Key '{key_name}' in cooldown, passo alla successiva... ({attempt+1}/{max_retries})")
+                else:
+                    notify(f"⚠️ Rate limit raggiunto. Riprovo tra {wait_time:.0f}s... ({attempt+1}/{max_retries})")
+                continue
+            return f"Errore API Gemini: {e}"
+        finally:
+            if timings is not None:
+                timings["queue_s"] += queued
+                timings["llm_s"] += time.perf_counter() - start
+                timings["attempts"] += 1
+    return "Errore: Rate limit persistente. Riprova più tardi."
+
+
+def generate(model, api_key, prompt, **kwargs):
+    """Risposta completa (testo, o stringa "Errore ..." in caso di fallimento)."""
+    def call(bound_model):
+        response = bound_model.generate_content(prompt)
+        return response.text, usage_tokens(response)
+    return call_limited(model, api_key, estimate_tokens(prompt), call, **kwargs)
+
+
+def stream(model, api_key, prompt, on_text, **kwargs):
+    """
+    Come generate ma in streaming: on_text(testo_parziale) viene chiamata
+    a ogni chunk. Un tentativo fallito riparte da testo vuoto.
+    """
+    def call(bound_model):
+        text = ""
+        response = bound_model.generate_content(prompt, stream=True)
+        for chunk in response:
+            try:
+                piece = chunk.text
+            except ValueError:
+                piece = ""  # Chunk senza testo (es. solo metadati di sicurezza)
+            if piece:
+                text += piece
+                on_text(text)
+        return text, usage_tokens(response)
+    return call_limited(model, api_key, estimate_tokens(prompt), call, **kwargs)
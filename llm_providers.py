@@ -0,0 +1,166 @@
+"""
+Provider LLM intercambiabili.
+
+Il resto dell'app lavora con "handle" di modello che espongono
+generate_content(contents, stream=False, generation_config=None), come
+google.generativeai.GenerativeModel. Il provider decide da dove arrivano:
+
+- GeminiProvider: API reale, client per key (gemini_clients).
+- StubProvider: locale e deterministico, con latenza, chunking dello stream
+  e risposte predefinite/template configurabili. Serve per benchmark e
+  load test dei flussi Judge/Meta senza consumare quota.
+
+Selezione con YGO_LLM_PROVIDER=gemini|stub (default gemini).
+"""
+import os
+import json
+import time
+import random
+import threading
+
+STUB_LATENCY = float(os.getenv("YGO_STUB_LATENCY", "0.5"))  # secondi prima del primo chunk
+STUB_CHUNK_CHARS = int(os.getenv("YGO_STUB_CHUNK_CHARS", "40"))
+STUB_CHUNK_DELAY = float(os.getenv("YGO_STUB_CHUNK_DELAY", "0.02"))
+STUB_ERROR_RATE = float(os.getenv("YGO_STUB_ERROR_RATE", "0"))
+STUB_RESPONSES_PATH = os.getenv("YGO_STUB_RESPONSES", "")
+
+# (frammento del prompt, template della risposta): vince il primo che compare nel prompt.
+# Segnaposto disponibili: {model}, {prompt_chars}, {prompt_tokens}.
+DEFAULT_STUB_RESPONSES = [
+    ("---DETTAGLI---",
+     "Sì, legale (risposta stub di {model}).\n---DETTAGLI---\n"
+     "1. Analisi simulata dello scenario ({prompt_tokens} token di prompt).\n"
+     "2. Nessun ruling reale consultato: provider stub attivo."),
+    ("Verdetto Aggiornato",
+     "Verdetto Aggiornato: Dipende\nSpiegazione: rivalutazione OCG simulata dal provider stub."),
+    ("Output JSON (solo la lista)", "[]"),
+    ('"situation"', '{{"cards": [], "situation": "Analisi immagine simulata (provider stub)."}}'),
+]
+DEFAULT_STUB_FALLBACK = "Risposta simulata da {model} ({prompt_chars} caratteri di prompt)."
+
+
+def canonical_model_name(model_name):
+    return model_name[len("models/"):] if model_name.startswith("models/") else model_name
+
+
+def _prompt_text(contents):
+    """Testo del prompt (le parti non testuali, es. immagini, vengono ignorate)."""
+    if isinstance(contents, str):
+        return contents
+    return "\n".join(part for part in contents if isinstance(part, str))
+
+
+class _StubUsage:
+    def __init__(self, total_token_count):
+        self.total_token_count = total_token_count
+
+
+class _StubResponse:
+    """Risposta completa o stream: stessi attributi usati dall'app (text, usage_metadata, iterazione)."""
+
+    def __init__(self, text, chunks, usage, delay):
+        self.text = text
+        self._chunks = chunks
+        self._delay = delay
+        self.usage_metadata = usage
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            if self._delay:
+                time.sleep(self._delay)
+            yield chunk
+
+
+class _StubChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModel:
+    """Handle finto con la stessa interfaccia di GenerativeModel."""
+
+    def __init__(self, model_name, provider):
+        self.model_name = f"models/{canonical_model_name(model_name)}"
+        self._provider = provider
+
+    def generate_content(self, contents, stream=False, generation_config=None):
+        provider = self._provider
+        prompt = _prompt_text(contents)
+        time.sleep(provider.latency)
+        if provider.should_fail():
+            raise RuntimeError("500 Errore simulato dal provider stub")
+
+        prompt_tokens = max(1, len(prompt) // 4)
+        text = provider.render(prompt, canonical_model_name(self.model_name), prompt_tokens)
+        usage = _StubUsage(prompt_tokens + max(1, len(text) // 4))
+        size = provider.chunk_chars
+        chunks = [_StubChunk(text[i:i + size]) for i in range(0, len(text), size)] or [_StubChunk("")]
+        return _StubResponse(text, chunks, usage, provider.chunk_delay if stream else 0)
+
+
+class StubProvider:
+    name = "stub"
+
+    def __init__(self, latency=STUB_LATENCY, chunk_chars=STUB_CHUNK_CHARS, chunk_delay=STUB_CHUNK_DELAY,
+                 error_rate=STUB_ERROR_RATE, responses=None, fallback=DEFAULT_STUB_FALLBACK, seed=0):
+        self.latency = latency
+        self.chunk_chars = max(1, chunk_chars)
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self.responses = list(DEFAULT_STUB_RESPONSES if responses is None else responses)
+        self.fallback = fallback
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Risposte personalizzate da YGO_STUB_RESPONSES: JSON {"responses": [[frammento, template]], "fallback": ...}."""
+        if STUB_RESPONSES_PATH and os.path.exists(STUB_RESPONSES_PATH):
+            with open(STUB_RESPONSES_PATH, "r", encoding="utf-8") as f:
+                config = json.load(f)
+            return cls(responses=[tuple(r) for r in config.get("responses", [])] + DEFAULT_STUB_RESPONSES,
+                       fallback=config.get("fallback", DEFAULT_STUB_FALLBACK))
+        return cls()
+
+    def should_fail(self):
+        with self._rng_lock:
+            return self._rng.random() < self.error_rate
+
+    def render(self, prompt, model_name, prompt_tokens):
+        values = {"model": model_name, "prompt_chars": len(prompt), "prompt_tokens": prompt_tokens}
+        for fragment, template in self.responses:
+            if fragment in prompt:
+                return template.format(**values)
+        return self.fallback.format(**values)
+
+    def validate_key(self, api_key):
+        pass  # Nessuna key necessaria
+
+    def get_model(self, model_name, api_key):
+        return StubModel(model_name, self)
+
+
+class GeminiProvider:
+    name = "gemini"
+
+    def validate_key(self, api_key):
+        from gemini_clients import get_client
+        get_client(api_key)
+
+    def get_model(self, model_name, api_key):
+        from gemini_clients import get_model
+        return get_model(model_name, api_key)
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider():
+    """Provider del processo, scelto da YGO_LLM_PROVIDER."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            choice = os.getenv("YGO_LLM_PROVIDER", "gemini").lower()
+            _provider = StubProvider.from_env() if choice == "stub" else GeminiProvider()
+        return _provider
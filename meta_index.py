@@ -0,0 +1,262 @@
+"""
+Indice di ricerca locale sul report meta per la chat del Meta Analyst.
+
+Invece di incollare l'intero meta_context (tutte le decklist di tutti i
+tornei) in ogni prompt, il report viene diviso in blocchi (un mazzo / una
+voce per blocco, con la sezione di appartenenza) e indicizzato con BM25 in
+puro Python. Per ogni domanda entrano nel prompt solo i blocchi più
+rilevanti entro un budget di token, più un riepilogo aggregato calcolato una
+volta sola sull'intero dataset: il costo per messaggio non cresce più con il
+numero di tornei scaricati.
+
+L'indice è costruito una volta per contenuto (hash del report) e riusato
+da tutte le sessioni del processo.
+"""
+import re
+import math
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+
+from rate_limiter import estimate_tokens
+
+TOP_K = 8
+CONTEXT_TOKEN_BUDGET = 6000  # Token massimi di blocchi recuperati per prompt
+MAX_CHUNK_CHARS = 2000  # Oltre questa lunghezza un blocco viene spezzato
+HEADER_MAX_CHARS = 1500
+AGGREGATE_TOP_DECKS = 15
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_SECTION_RE = re.compile(r"^=== (.+?) ===\s*$")
+_DECK_RE = re.compile(r"^=== DECK \d+ ===\s*$")
+_SEPARATOR_RE = re.compile(r"^={10,}\s*$")
+_WORD_RE = re.compile(r"\w+")
+# Core list degli archetipi e riferimenti dei mazzi in delta (vedi deck_delta)
+_CORE_RE = re.compile(r"^- CORE (.+?) \(\d+ mazzi\)", re.MULTILINE)
+_DELTA_REF_RE = re.compile(r"\[DELTA vs CORE (.+?)\]")
+
+# Parole troppo comuni nelle domande per distinguere i blocchi
+STOPWORDS = {
+    "il", "lo", "la", "i", "gli", "le", "un", "una", "uno", "di", "del", "della", "dei", "delle", "da",
+    "in", "nel", "nella", "con", "su", "per", "tra", "fra", "e", "o", "che", "chi", "cosa", "come",
+    "quale", "quali", "quanti", "quante", "è", "sono", "ci", "mi", "si", "a", "al", "alla", "ai",
+    "the", "an", "of", "on", "and", "or", "is", "are", "what", "which", "how", "to", "for",
+    "deck", "mazzo", "mazzi", "x",
+}
+
+
+def tokenize(text):
+    return [word for word in _WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+
+
+def _split_long(text, limit=MAX_CHUNK_CHARS):
+    """Spezza un blocco troppo lungo a fine riga o, per i dump di liste, tra un elemento e l'altro."""
+    if len(text) <= limit:
+        return [text]
+    pieces = []
+    current = ""
+    for part in re.split(r"(?<=\n)|(?<=\}, )", text):
+        if current and len(current) + len(part) > limit:
+            pieces.append(current)
+            current = ""
+        current += part
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_meta_report(text):
+    """
+    (intestazione, blocchi) dal testo del report. Riconosce i formati prodotti
+    dall'app: voci "- posto: giocatore -> mazzo" (YGOProDeck), blocchi
+    "=== DECK n ===" (YuGiOhMeta) e sezioni "=== TITOLO ===" con dump di liste.
+    Ogni blocco porta in testa la sezione di appartenenza.
+    """
+    header_lines = []
+    chunks = []
+    section = ""
+    current = None
+    in_deck_block = False
+
+    def close():
+        nonlocal current
+        if current and any(line.strip() for line in current):
+            body = "\n".join(current).strip()
+            label = f"[{section}]\n" if section else ""
+            # Le core list restano intere: servono per leggere i delta dei mazzi
+            pieces = [body] if _CORE_RE.match(body) else _split_long(body)
+            chunks.extend(label + piece.strip() for piece in pieces if piece.strip())
+        current = None
+
+    for line in text.splitlines():
+        if _SEPARATOR_RE.match(line):
+            close()
+            in_deck_block = False
+        elif _DECK_RE.match(line):
+            close()
+            current = [line.strip("= ").strip()]
+            in_deck_block = True
+        elif _SECTION_RE.match(line):
+            close()
+            section = _SECTION_RE.match(line).group(1).strip()
+            current = []
+            in_deck_block = False
+        elif line.startswith("- ") and not in_deck_block:
+            close()
+            current = [line]
+        elif current is not None:
+            current.append(line)
+        else:
+            header_lines.append(line)
+    close()
+    return "\n".join(header_lines).strip(), chunks
+
+
+def build_aggregates(structured_data, header="", chunk_count=0):
+    """Riepilogo dell'intero dataset (sempre nel prompt): intestazione e distribuzione dei mazzi."""
+    lines = []
+    if header:
+        lines.append(header[:HEADER_MAX_CHARS])
+    decks = sorted((d for d in structured_data or [] if d.get("count")), key=lambda d: (-d["count"], d["name"]))
+    total = sum(d["count"] for d in decks)
+    if total:
+        lines.append(f"MAZZI TOTALI: {total} ({len(decks)} archetipi diversi)")
+        lines.append(f"TOP {min(AGGREGATE_TOP_DECKS, len(decks))} ARCHETIPI:")
+        for d in decks[:AGGREGATE_TOP_DECKS]:
+            lines.append(f"- {d['name']}: {d['count']} ({d['count'] / total * 100:.1f}%)")
+        if len(decks) > AGGREGATE_TOP_DECKS:
+            others = sum(d["count"] for d in decks[AGGREGATE_TOP_DECKS:])
+            lines.append(f"- Altri ({len(decks) - AGGREGATE_TOP_DECKS} archetipi): {others}")
+    if chunk_count:
+        lines.append(f"BLOCCHI NEL REPORT COMPLETO: {chunk_count}")
+    return "\n".join(lines)
+
+
+class MetaIndex:
+    """BM25 su blocchi del report; indice invertito termine -> [(blocco, frequenza)]."""
+
+    def __init__(self, text, structured_data=None):
+        self.header, self.chunks = chunk_meta_report(text or "")
+        self.aggregates = build_aggregates(structured_data, self.header, len(self.chunks))
+        self.chunk_tokens = [estimate_tokens(chunk) for chunk in self.chunks]
+        self._cores = {}
+        self._core_refs = []
+        for doc_id, chunk in enumerate(self.chunks):
+            core = _CORE_RE.search(chunk)
+            if core:
+                self._cores.setdefault(core.group(1), doc_id)
+            self._core_refs.append(set(_DELTA_REF_RE.findall(chunk)))
+
+        self._postings = {}
+        self._lengths = []
+        for doc_id, chunk in enumerate(self.chunks):
+            terms = Counter(tokenize(chunk))
+            self._lengths.append(sum(terms.values()))
+            for term, freq in terms.items():
+                self._postings.setdefault(term, []).append((doc_id, freq))
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        n_docs = len(self.chunks)
+        self._idf = {
+            term: math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def scores(self, query):
+        """{blocco: punteggio BM25} solo per i blocchi che contengono almeno un termine."""
+        scores = {}
+        avg = self._avg_length or 1.0
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, freq in self._postings[term]:
+                norm = freq + BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[doc_id] / avg)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (BM25_K1 + 1) / norm
+        return scores
+
+    def search(self, query, k=TOP_K, token_budget=CONTEXT_TOKEN_BUDGET):
+        """
+        Blocchi più rilevanti (in ordine di punteggio) entro k e il budget di token.
+        Se nessun termine corrisponde, i primi blocchi del report (le sezioni
+        più importanti vengono prima). Un mazzo in delta porta con sé la core
+        list del suo archetipo (messa prima del mazzo).
+        """
+        scores = self.scores(query)
+        if scores:
+            ranked = sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+        else:
+            ranked = range(len(self.chunks))
+
+        selected = []
+        chosen = set()
+        used = 0
+        for doc_id in ranked:
+            if len(selected) >= k:
+                break
+            if doc_id in chosen:
+                continue
+            needed = [self._cores[name] for name in sorted(self._core_refs[doc_id])
+                      if name in self._cores and self._cores[name] not in chosen]
+            cost = self.chunk_tokens[doc_id] + sum(self.chunk_tokens[core_id] for core_id in needed)
+            if used + cost > token_budget:
+                continue
+            for added in needed + [doc_id]:
+                selected.append(self.chunks[added])
+                chosen.add(added)
+            used += cost
+        return selected
+
+    def context_for(self, query, k=TOP_K, token_budget=CONTEXT_TOKEN_BUDGET):
+        """Testo per il prompt: riepilogo aggregato + blocchi recuperati. Returns (testo, n blocchi)."""
+        selected = self.search(query, k, token_budget)
+        text = (
+            f"RIEPILOGO DATASET (calcolato su tutti i dati):\n{self.aggregates}\n\n"
+            f"ESTRATTI PIÙ RILEVANTI PER LA DOMANDA ({len(selected)} di {len(self.chunks)} blocchi):\n"
+            + "\n\n".join(selected)
+        )
+        return text, len(selected)
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+_MAX_INDEXES = 4  # Report diversi tenuti in memoria (sessioni con dati diversi)
+
+
+def get_meta_index(text, structured_data=None):
+    """MetaIndex condiviso dal processo per questo contenuto (ricostruito solo se il report cambia)."""
+    digest = hashlib.sha256((text or "").encode("utf-8"))
+    for d in sorted(structured_data or [], key=lambda d: d.get("name", "")):
+        digest.update(f"\n{d.get('name')}={d.get('count')}".encode("utf-8"))
+    key = digest.hexdigest()
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+    index = MetaIndex(text, structured_data)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > _MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+if __name__ == "__main__":
+    # Prova offline: python meta_index.py report.txt "domanda"
+    import sys
+    import time
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        report = f.read()
+    t0 = time.perf_counter()
+    index = MetaIndex(report)
+    t1 = time.perf_counter()
+    context, n_chunks = index.context_for(sys.argv[2] if len(sys.argv) > 2 else "")
+    t2 = time.perf_counter()
+    print(context)
+    print(f"\nReport: {len(report)} caratteri, {len(index)} blocchi | indice {t1 - t0:.3f}s | "
+          f"ricerca {(t2 - t1) * 1000:.1f}ms | contesto ~{estimate_tokens(context)} token "
+          f"(report completo ~{estimate_tokens(report)})")
@@ -0,0 +1,269 @@
+"""
+Planner locale per le domande statistiche della chat Meta.
+
+Domande come "che % dei top gioca Ash Blossom?", "quanti Snake-Eye hanno
+toppato in Italia?" o "top 5 mazzi ai regional" si calcolano direttamente da
+meta_all_items_global (gli stessi conteggi della dashboard) in pochi
+millisecondi, senza chiamare il modello. Il planner riconosce l'intento con
+regole semplici (parole chiave IT/EN + carte/mazzi presenti nel dataset +
+filtri per paese, tipo evento e vincitori); se la domanda è aperta o non si
+risolve con certezza, plan() restituisce None e la domanda va al modello.
+"""
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from card_matcher import CardMentionExtractor, normalize_name
+from deck_delta import card_counts
+
+DEFAULT_TOP_N = 5
+MAX_TOP_N = 25
+
+SECTIONS = (("main", "raw_main", "Main Deck"), ("extra", "raw_extra", "Extra Deck"), ("side", "raw_side", "Side Deck"))
+
+# Senza una richiesta esplicita di statistica (conteggio, percentuale, copie, top cut) la domanda va al modello
+_STAT_RE = re.compile(
+    r"(%|\bpercentual|\bquant[ieao]\b|\bhow many\b|\bcopie\b|\bcop(y|ies)\b|\btop\s*\d+\b|\btop cut\b|"
+    r"\bnumero\b|\bcount\b|\busage\b|\butilizzo\b|\bpi[uù] giocat|\bmost (played|popular|common)\b|"
+    r"\bclassifica\b|\branking\b|\bdistribuzione\b|\bmeta share\b)"
+)
+# Richiesta numerica esplicita: l'unico caso in cui "side" non rende la domanda strategica
+_EXPLICIT_STAT_RE = re.compile(r"(%|\bpercentual|\bquant[ieao]\b|\bhow many\b|\bcopie\b|\bcop(y|ies)\b|\btop\s*\d+\b)")
+# Domande di strategia/opinione: sempre al modello, anche se contengono numeri o carte.
+# "contro/vs/against X" indica un avversario, mai un filtro sui mazzi.
+_OPEN_ENDED_RE = re.compile(
+    r"\b(perch[eé]|why|come (batto|battere|gioc|si gioca)|how (do|to|should)|counter|strategi|consigli|"
+    r"suggeri|dovrei|should|conviene|meglio|better|best way|play(ing)? around|matchup|combo|spiega|explain|"
+    r"analizza|analy[sz]e|decklist|lista completa|html|contro|vs|versus|against|posso|can i)\b"
+)
+_SIDE_RE = re.compile(r"\bsid(e|ing|are)\b")
+_COUNT_RE = re.compile(r"\b(quant[ieao]|how many|numero|count)\b")
+_TOP_RE = re.compile(r"\btop\s*(\d+)\b|\b(pi[uù] giocat[ioea]|most (played|popular|common)|classifica|ranking|distribuzione|meta share)\b")
+_CARDS_WORD_RE = re.compile(r"\b(cart[ae]|cards?|staple|tech)\b")
+_WINNERS_RE = re.compile(r"\b(vincitor[ei]|vint[oi]|winners?|winning|won|wins|1st|primi posti|primo posto)\b")
+_SECTION_WORDS = {"side": r"\bside\b", "extra": r"\bextra\b", "main": r"\bmain\b"}
+
+# Parole dei nomi dei mazzi troppo generiche per dire che la domanda nomina un mazzo
+GENERIC_DECK_WORDS = {"deck", "decks", "mazzo", "mazzi", "unknown", "other", "main", "side", "extra"}
+
+# Parole che filtrano per evento (cercate in nome e tipo dell'evento)
+EVENT_KEYWORDS = ("ycs", "wcq", "regional", "national", "championship", "major", "local", "ots")
+
+# Nomi italiani dei paesi (il dataset usa i nomi inglesi)
+COUNTRY_ALIASES = {
+    "italia": "Italy", "germania": "Germany", "francia": "France", "spagna": "Spain",
+    "stati uniti": "United States", "usa": "United States", "regno unito": "United Kingdom",
+    "inghilterra": "United Kingdom", "olanda": "Netherlands", "paesi bassi": "Netherlands",
+    "belgio": "Belgium", "portogallo": "Portugal", "messico": "Mexico", "brasile": "Brazil",
+    "svizzera": "Switzerland", "austria": "Austria", "polonia": "Poland", "grecia": "Greece",
+}
+
+
+def _contains_phrase(normalized_text, phrase):
+    phrase = normalize_name(phrase)
+    return bool(phrase) and f" {phrase} " in f" {normalized_text} "
+
+
+def _is_winner(item):
+    place = str(item.get("place", "")).lower()
+    return "winner" in place or "1st" in place
+
+
+def _pct(part, total):
+    return f"{part / total * 100:.1f}%" if total else "0%"
+
+
+class MetaQueryPlanner:
+    """Indice in memoria del dataset meta: carte per mazzo, nomi di carte e mazzi riconoscibili nelle domande."""
+
+    def __init__(self, items):
+        self.items = [item for item in items or [] if item.get("deck_text")]
+        self._card_sets = [
+            {key: card_counts(item.get(field)) for key, field, _label in SECTIONS} for item in self.items
+        ]
+        card_names = set()
+        for sets in self._card_sets:
+            for counts in sets.values():
+                card_names.update(counts)
+        self.card_names = card_names
+        self.deck_names = {item["deck_text"].strip() for item in self.items}
+        # Alias delle staple (ash, imperm...) validi solo se la carta è nel dataset
+        self._card_extractor = CardMentionExtractor(card_names)
+        self._deck_extractor = CardMentionExtractor(self.deck_names, aliases={}, min_name_length=3, acronyms={})
+        # Parole dei nomi dei mazzi: servono a capire se la domanda nomina un mazzo non risolto ("i Tenpai")
+        self._deck_words = {
+            word for deck in self.deck_names for word in normalize_name(deck).split()
+            if len(word) >= 4 and word not in GENERIC_DECK_WORDS
+        }
+        self.countries = {str(item.get("country")) for item in self.items if item.get("country")} - {"Unknown", "Global"}
+        self.event_types = {str(item.get("event_type")) for item in self.items if item.get("event_type")} - {"Other"}
+
+    def plan(self, question):
+        """Piano di esecuzione {"intent", ...} oppure None se la domanda va al modello."""
+        if not self.items:
+            return None
+        text = normalize_name(question)
+        raw = question.lower()
+        if not _STAT_RE.search(raw) or _OPEN_ENDED_RE.search(raw):
+            return None
+        if _SIDE_RE.search(raw) and not _EXPLICIT_STAT_RE.search(raw):
+            return None
+
+        card_spans = [span for span in self._card_extractor.find_mention_spans(question) if span[2] in self.card_names]
+        # Un nome di mazzo dentro il nome di una carta ("Snake-Eye" in "Snake-Eye Ash") non è un filtro sui mazzi
+        deck_spans = [
+            span for span in self._deck_extractor.find_mention_spans(question)
+            if span[2] in self.deck_names and not any(c[0] <= span[0] and span[1] <= c[1] for c in card_spans)
+        ]
+        cards = list(dict.fromkeys(span[2] for span in card_spans))
+        decks = list(dict.fromkeys(span[2] for span in deck_spans))
+
+        # Parola di un nome di mazzo fuori da carte e mazzi risolti: mazzo nominato ma non riconosciuto,
+        # meglio il modello che numeri calcolati su tutto il dataset
+        covered = {i for start, end, _name in card_spans + deck_spans for i in range(start, end)}
+        if any(word in self._deck_words for i, word in enumerate(text.split()) if i not in covered):
+            return None
+
+        countries = {c for c in self.countries if _contains_phrase(text, c)}
+        countries.update(country for alias, country in COUNTRY_ALIASES.items()
+                         if country in self.countries and _contains_phrase(text, alias))
+        event_types = sorted(t for t in self.event_types if _contains_phrase(text, t))
+        filters = {
+            "countries": sorted(countries),
+            "event_types": event_types,
+            # Le parole già riconosciute come tipo evento non filtrano una seconda volta
+            "event_keywords": [k for k in EVENT_KEYWORDS if re.search(rf"\b{k}s?\b", text)
+                               and not any(k in normalize_name(t) for t in event_types)],
+            "winners": bool(_WINNERS_RE.search(raw)),
+        }
+        sections = [key for key, pattern in _SECTION_WORDS.items() if re.search(pattern, raw)]
+        top_match = _TOP_RE.search(raw)
+        top_n = min(MAX_TOP_N, int(top_match.group(1))) if top_match and top_match.group(1) else DEFAULT_TOP_N
+
+        if cards:
+            return {"intent": "card_usage", "cards": cards, "decks": decks, "filters": filters, "sections": sections}
+        if top_match and not cards:
+            if _CARDS_WORD_RE.search(raw) or sections:
+                return {"intent": "top_cards", "top_n": top_n, "decks": decks, "filters": filters,
+                        "sections": sections or ["main"]}
+            return {"intent": "top_decks", "top_n": top_n, "filters": filters}
+        if decks and not cards and _COUNT_RE.search(raw):
+            return {"intent": "deck_count", "decks": decks, "filters": filters}
+        return None
+
+    def _filtered(self, filters, decks=()):
+        """Indici degli item che rispettano filtri e (se indicati) archetipi."""
+        selected = []
+        for idx, item in enumerate(self.items):
+            if filters["countries"] and str(item.get("country")) not in filters["countries"]:
+                continue
+            if filters["event_types"] and str(item.get("event_type")) not in filters["event_types"]:
+                continue
+            if filters["event_keywords"]:
+                event = f"{item.get('event_source', '')} {item.get('event_type', '')}".lower()
+                if not any(k in event for k in filters["event_keywords"]):
+                    continue
+            if filters["winners"] and not _is_winner(item):
+                continue
+            if decks and item["deck_text"].strip() not in decks:
+                continue
+            selected.append(idx)
+        return selected
+
+    @staticmethod
+    def _describe_filters(filters, decks=()):
+        parts = []
+        if decks:
+            parts.append("mazzi " + ", ".join(decks))
+        if filters["countries"]:
+            parts.append("paese " + ", ".join(filters["countries"]))
+        if filters["event_types"]:
+            parts.append("tipo evento " + ", ".join(filters["event_types"]))
+        if filters["event_keywords"]:
+            parts.append("eventi " + ", ".join(k.upper() for k in filters["event_keywords"]))
+        if filters["winners"]:
+            parts.append("solo vincitori")
+        return "; ".join(parts) if parts else "nessun filtro"
+
+    def execute(self, plan):
+        """Risposta in markdown per il piano (stessi criteri della dashboard: % = mazzi che giocano la carta)."""
+        intent = plan["intent"]
+        filters = plan["filters"]
+        deck_filter = plan.get("decks") or ()
+        selected = self._filtered(filters, deck_filter)
+        scope = self._describe_filters(filters, deck_filter)
+        if not selected:
+            return f"Nessun mazzo nel dataset corrisponde ai filtri ({scope})."
+
+        if intent == "deck_count":
+            universe = self._filtered(filters)
+            lines = []
+            for deck in plan["decks"]:
+                matching = [i for i in universe if self.items[i]["deck_text"].strip() == deck]
+                wins = sum(_is_winner(self.items[i]) for i in matching)
+                lines.append(f"- **{deck}**: {len(matching)} top su {len(universe)} ({_pct(len(matching), len(universe))})"
+                             f" · vittorie {wins}")
+            return "\n".join(lines) + f"\n\n_Filtri: {self._describe_filters(filters)}_"
+
+        if intent == "top_decks":
+            counts = Counter(self.items[i]["deck_text"].strip() for i in selected)
+            lines = [f"{rank}. **{name}**: {count} ({_pct(count, len(selected))})"
+                     for rank, (name, count) in enumerate(sorted(counts.items(), key=lambda x: (-x[1], x[0]))[:plan["top_n"]], 1)]
+            return f"**Top {plan['top_n']} mazzi** su {len(selected)} top:\n" + "\n".join(lines) + f"\n\n_Filtri: {scope}_"
+
+        valid = [i for i in selected if self._card_sets[i]["main"]]
+        if not valid:
+            return f"Nessuna decklist disponibile per il calcolo ({scope})."
+
+        if intent == "top_cards":
+            blocks = []
+            for key, _field, label in SECTIONS:
+                if key not in plan["sections"]:
+                    continue
+                usage = Counter(name for i in valid for name in self._card_sets[i][key])
+                lines = [f"{rank}. {name}: {_pct(count, len(valid))}"
+                         for rank, (name, count) in enumerate(sorted(usage.items(), key=lambda x: (-x[1], x[0]))[:plan["top_n"]], 1)]
+                blocks.append(f"**{label}** (top {plan['top_n']}):\n" + ("\n".join(lines) or "Nessuna carta."))
+            return f"Carte più giocate su {len(valid)} decklist:\n\n" + "\n\n".join(blocks) + f"\n\n_Filtri: {scope}_"
+
+        # card_usage
+        sections = plan["sections"] or [key for key, _field, _label in SECTIONS]
+        lines = []
+        for card in plan["cards"]:
+            parts = []
+            for key, _field, label in SECTIONS:
+                if key not in sections:
+                    continue
+                playing = [self._card_sets[i][key][card] for i in valid if card in self._card_sets[i][key]]
+                if playing or plan["sections"]:
+                    avg = f", media {sum(playing) / len(playing):.1f} copie" if playing else ""
+                    parts.append(f"{label} {_pct(len(playing), len(valid))} ({len(playing)}/{len(valid)}{avg})")
+            lines.append(f"- **{card}**: " + (" · ".join(parts) if parts else f"non giocata (0/{len(valid)})"))
+        return f"Utilizzo su {len(valid)} decklist:\n" + "\n".join(lines) + f"\n\n_Filtri: {scope}_"
+
+    def answer(self, question):
+        """Risposta calcolata localmente, oppure None se serve il modello."""
+        plan = self.plan(question)
+        return self.execute(plan) if plan else None
+
+
+_planners = OrderedDict()
+_planners_lock = threading.Lock()
+_MAX_PLANNERS = 4
+
+
+def get_meta_query_planner(items):
+    """Planner per questa lista di item (costruito una volta, riusato finché la lista non cambia)."""
+    # La lista resta referenziata nella cache, quindi il suo id non può essere riassegnato
+    key = (id(items), len(items or []))
+    with _planners_lock:
+        entry = _planners.get(key)
+        if entry is not None and entry[0] is items:
+            _planners.move_to_end(key)
+            return entry[1]
+    planner = MetaQueryPlanner(items)
+    with _planners_lock:
+        _planners[key] = (items, planner)
+        while len(_planners) > _MAX_PLANNERS:
+            _planners.popitem(last=False)
+    return planner
@@ -0,0 +1,258 @@
+"""
+Router dei modelli Gemini con health check e statistiche di latenza.
+
+Costruire un GenerativeModel non fallisce mai, quindi la vecchia lista di
+candidati restituiva sempre il primo. Qui ogni candidato viene sondato
+periodicamente con una richiesta minima; per ogni modello si tengono
+latenza p50/p95 e tasso di errore (probe + chiamate reali) e si sceglie,
+in ordine di preferenza, il primo modello sano. Su errori o SLO di latenza
+superato il router passa al candidato successivo.
+
+Il backend è intercambiabile: ProviderBackend per il provider LLM attivo,
+StubBackend per provare la logica di routing offline (tests/test_model_router.py).
+"""
+import time
+import random
+import threading
+from collections import deque
+
+from common import key_id
+from key_pool import is_quota_error
+
+CANDIDATE_MODELS = [
+    "gemini-2.5-flash",
+    "gemini-2.5-pro",
+    "gemini-2.0-flash",
+    "gemini-flash-latest",
+    "gemini-pro-latest",
+    "gemini-1.5-flash",
+]
+PROBE_INTERVAL = 300  # secondi tra un giro di probe e il successivo
+PROBE_PROMPT = "ping"
+PROBE_TOKENS = 8
+LATENCY_SLO = 10.0  # p95 massimo (secondi) di un probe
+MAX_ERROR_RATE = 0.5
+WINDOW = 50  # campioni tenuti per modello
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class ModelStats:
+    """Finestra scorrevole di esiti per un modello."""
+
+    def __init__(self, window=WINDOW):
+        self.probe_latencies = deque(maxlen=window)
+        self.call_latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # True = ok
+        self.last_error = None
+
+    def record(self, latency, ok, probe=False, error=None):
+        if ok and probe:
+            # Il modello risponde di nuovo: gli errori passati non descrivono più il suo stato
+            self.outcomes.clear()
+        self.outcomes.append(ok)
+        if ok:
+            (self.probe_latencies if probe else self.call_latencies).append(latency)
+        else:
+            self.last_error = error
+
+    @property
+    def error_rate(self):
+        return (self.outcomes.count(False) / len(self.outcomes)) if self.outcomes else 0.0
+
+    def summary(self):
+        return {
+            "probe_p50": _percentile(self.probe_latencies, 50),
+            "probe_p95": _percentile(self.probe_latencies, 95),
+            "call_p50": _percentile(self.call_latencies, 50),
+            "call_p95": _percentile(self.call_latencies, 95),
+            "error_rate": self.error_rate,
+            "samples": len(self.outcomes),
+            "last_error": self.last_error,
+        }
+
+
+class ProviderBackend:
+    """Probe reali: una richiesta da 1 token al provider LLM attivo, sotto il rate limiter della key."""
+
+    def __init__(self, api_key):
+        from llm_providers import get_provider
+        from rate_limiter import get_rate_limiter
+        self._api_key = api_key
+        self._provider = get_provider()
+        self._limiter = get_rate_limiter(api_key)
+
+    def quota_backoff(self):
+        """Probe finito in 429: pausa condivisa del limiter della key. Returns i secondi di pausa."""
+        return self._limiter.backoff(0)
+
+    def probe(self, model_name):
+        self._limiter.acquire(PROBE_TOKENS)
+        start = time.perf_counter()
+        self._provider.get_model(model_name, self._api_key).generate_content(
+            PROBE_PROMPT, generation_config={"max_output_tokens": 1}
+        )
+        return time.perf_counter() - start
+
+
+class StubBackend:
+    """
+    Backend finto e deterministico per test offline.
+    profiles: {modello: (latenza media in secondi, probabilità di errore)}.
+    Nessuna attesa reale: la latenza viene solo restituita.
+    """
+
+    def __init__(self, profiles, seed=0):
+        self.profiles = dict(profiles)
+        self._rng = random.Random(seed)
+
+    def probe(self, model_name):
+        latency, error_rate = self.profiles.get(model_name, (1.0, 1.0))
+        if self._rng.random() < error_rate:
+            raise RuntimeError(f"Stub: {model_name} non disponibile")
+        return latency * self._rng.uniform(0.8, 1.2)
+
+
+class ModelRouter:
+    """Scelta del modello condivisa dal processo, con failover."""
+
+    def __init__(self, backend, candidates=CANDIDATE_MODELS, probe_interval=PROBE_INTERVAL,
+                 latency_slo=LATENCY_SLO, max_error_rate=MAX_ERROR_RATE, clock=time.monotonic):
+        self.backend = backend
+        self.candidates = list(candidates)
+        self.probe_interval = probe_interval
+        self.latency_slo = latency_slo
+        self.max_error_rate = max_error_rate
+        self._clock = clock
+        self._stats = {name: ModelStats() for name in self.candidates}
+        self._current = None
+        self._last_probe = None
+        self._deferred_until = None  # Dopo un 429 nei probe: nessun nuovo giro prima di questo istante
+        self._lock = threading.Lock()
+        self._initial_probe_lock = threading.Lock()
+        self._probing = False
+
+    def is_healthy(self, model_name):
+        stats = self._stats[model_name]
+        if not stats.outcomes:
+            return False
+        if not stats.outcomes[-1] or stats.error_rate > self.max_error_rate:
+            return False
+        p95 = _percentile(stats.probe_latencies, 95)
+        return p95 is None or p95 <= self.latency_slo
+
+    def _quota_backoff(self):
+        backoff = getattr(self.backend, "quota_backoff", None)
+        return backoff() if backoff else self.probe_interval
+
+    def _probe(self, model_name):
+        """True se il modello è sano, False se no, None se il probe ha trovato la key senza quota."""
+        try:
+            latency = self.backend.probe(model_name)
+        except Exception as e:
+            if is_quota_error(str(e)):
+                # Quota esaurito: dice qualcosa della key, non della salute del modello
+                print(f"Model Probe Quota ({model_name}): {e}")
+                return None
+            with self._lock:
+                self._stats[model_name].record(None, False, probe=True, error=str(e))
+            print(f"Model Probe Error ({model_name}): {e}")
+            return False
+        with self._lock:
+            self._stats[model_name].record(latency, True, probe=True)
+        return self.is_healthy(model_name)
+
+    def _pick(self):
+        # Un candidato mai provato conta come possibile: al prossimo probe si saprà
+        for name in self.candidates:
+            if self.is_healthy(name) or not self._stats[name].outcomes:
+                return name
+        # Nessuno sano: il meno peggio (meno errori, poi ordine di preferenza)
+        sampled = [name for name in self.candidates if self._stats[name].outcomes]
+        if not sampled:
+            return self.candidates[0]
+        return min(sampled, key=lambda name: (self._stats[name].error_rate, self.candidates.index(name)))
+
+    def refresh(self):
+        """
+        Giro di probe in ordine di preferenza, fermandosi al primo modello sano:
+        pochi token per giro, e si torna al modello preferito appena guarisce.
+        Un 429 ferma il giro: la key è senza quota per tutti i modelli, quindi
+        si tiene la scelta attuale e il prossimo giro aspetta il backoff del
+        limiter (niente probe che consumano il budget delle richieste vere).
+        """
+        deferred_until = None
+        for name in self.candidates:
+            healthy = self._probe(name)
+            if healthy is None:
+                deferred_until = self._clock() + max(self.probe_interval, self._quota_backoff())
+                break
+            if healthy:
+                break
+        with self._lock:
+            if deferred_until is None or self._current is None:
+                self._current = self._pick()
+            self._last_probe = self._clock()
+            self._deferred_until = deferred_until
+            self._probing = False
+        return self._current
+
+    def current(self):
+        """
+        Modello da usare ora. Il primo giro è sincrono (una sola sessione lo
+        esegue, le altre ne aspettano il risultato), i successivi in background.
+        """
+        with self._lock:
+            current = self._current
+            now = self._clock()
+            due = self._last_probe is None or now - self._last_probe > self.probe_interval
+            due = due and (self._deferred_until is None or now >= self._deferred_until)
+            start_background = due and current is not None and not self._probing
+            if start_background:
+                self._probing = True
+        if current is None:
+            with self._initial_probe_lock:
+                with self._lock:
+                    current = self._current
+                return current if current is not None else self.refresh()
+        if start_background:
+            threading.Thread(target=self.refresh, daemon=True).start()
+        return current
+
+    def report(self, model_name, latency, ok, error=None):
+        """Esito di una chiamata reale. Returns il modello da usare dopo (failover se serve)."""
+        with self._lock:
+            stats = self._stats.get(model_name)
+            if stats is None:
+                return self._current or model_name
+            stats.record(latency, ok, error=error)
+            if model_name == self._current and not self.is_healthy(model_name):
+                self._current = self._pick()
+                if self._current != model_name:
+                    print(f"Model Router: failover {model_name} -> {self._current}")
+            return self._current or model_name
+
+    def stats(self):
+        """{modello: summary} per la UI."""
+        with self._lock:
+            return {name: stats.summary() for name, stats in self._stats.items()}
+
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+def get_model_router(api_key):
+    """ModelRouter condiviso per la key (i modelli disponibili dipendono dalla key)."""
+    router_id = key_id(api_key)
+    with _routers_lock:
+        router = _routers.get(router_id)
+        if router is None:
+            router = _routers[router_id] = ModelRouter(ProviderBackend(api_key))
+        return router
+
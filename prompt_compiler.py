@@ -0,0 +1,154 @@
+"""
+Compilatore di prompt con budget di token.
+
+I prompt (verdetto, follow-up, rivalutazione OCG, chat Meta) sono template
+con sezioni variabili ({nome}, graffe letterali raddoppiate come nelle
+f-string). Ogni sezione ha una priorità: le sezioni obbligatorie (priorità 0)
+entrano sempre intere, le altre in ordine di priorità finché c'è budget; chi
+non ci sta passa alla versione riassunta (`fallback`) se prevista, altrimenti
+viene troncata o, sotto `min_tokens`, omessa. La dimensione finale di ogni
+prompt viene registrata (vedi prompt_stats) prima dell'invio.
+"""
+import os
+import time
+import threading
+from collections import deque
+
+from rate_limiter import estimate_tokens, DEFAULT_TPM
+from llm_providers import canonical_model_name
+
+DEFAULT_PROMPT_BUDGET = int(os.getenv("YGO_PROMPT_BUDGET", "30000"))
+# Budget per modello (token di input): i modelli pro sono più lenti e hanno meno quota
+MODEL_TOKEN_BUDGETS = {
+    "gemini-2.5-pro": 20000,
+    "gemini-pro-latest": 20000,
+}
+PROMPT_LOG_SIZE = 200
+
+OMITTED_MARKER = "[sezione omessa per limiti di lunghezza]"
+_MARKER_TOKENS = 20  # Riserva per il marcatore di troncamento
+
+
+def budget_for(model_name=None):
+    """Budget di input del modello, mai oltre il TPM (un prompt più grande non passerebbe mai)."""
+    name = canonical_model_name(model_name or "")
+    return min(MODEL_TOKEN_BUDGETS.get(name, DEFAULT_PROMPT_BUDGET), DEFAULT_TPM)
+
+
+class Section:
+    """
+    Parte variabile di un prompt.
+    priority: 0 = obbligatoria (mai toccata), poi più alto = meno importante.
+    keep: "start" tiene l'inizio del testo, "end" la fine (es. cronologia chat).
+    fallback: versione breve usata se il testo intero non ci sta.
+    """
+
+    def __init__(self, name, text, priority=1, keep="start", min_tokens=50, fallback=None):
+        self.name = name
+        self.text = text or ""
+        self.priority = priority
+        self.keep = keep
+        self.min_tokens = min_tokens
+        self.fallback = fallback
+
+
+def truncate_tokens(text, max_tokens, keep="start"):
+    """Taglia `text` a ~max_tokens (a fine riga se possibile) con un marcatore dei token omessi."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    chars = max(0, (max_tokens - _MARKER_TOKENS) * 4)
+    omitted = estimate_tokens(text) - chars // 4
+    if keep == "end":
+        cut = text[len(text) - chars:]
+        newline = cut.find("\n")
+        if 0 <= newline < len(cut) // 2:
+            cut = cut[newline + 1:]
+        return f"[… {omitted} token precedenti omessi]\n{cut}"
+    cut = text[:chars]
+    newline = cut.rfind("\n")
+    if newline > len(cut) // 2:
+        cut = cut[:newline]
+    return f"{cut}\n[… {omitted} token successivi omessi]"
+
+
+class CompiledPrompt:
+    def __init__(self, kind, text, budget, sections):
+        self.kind = kind
+        self.text = text
+        self.tokens = estimate_tokens(text)
+        self.budget = budget
+        self.sections = sections  # {nome: {"tokens", "original_tokens", "action"}}
+
+    @property
+    def over_budget(self):
+        return self.tokens > self.budget
+
+    @property
+    def reduced(self):
+        """Nomi delle sezioni riassunte, troncate o omesse."""
+        return [name for name, info in self.sections.items() if info["action"] != "full"]
+
+
+_log = deque(maxlen=PROMPT_LOG_SIZE)
+_log_lock = threading.Lock()
+
+
+def compile_prompt(kind, template, sections, model_name=None, budget=None):
+    """
+    Assembla `template` con le sezioni entro il budget del modello.
+    Returns CompiledPrompt (testo in .text); la dimensione viene registrata sotto `kind`.
+    """
+    budget = budget or budget_for(model_name)
+    remaining = budget - estimate_tokens(template.format(**{s.name: "" for s in sections}))
+
+    fitted = {}
+    report = {}
+    for section in sorted(sections, key=lambda s: s.priority):
+        original = estimate_tokens(section.text) if section.text else 0
+        if section.priority == 0 or original <= remaining:
+            text, action = section.text, "full"
+        elif section.fallback is not None and estimate_tokens(section.fallback) <= remaining:
+            text, action = section.fallback, "summarized"
+        elif remaining >= section.min_tokens:
+            text, action = truncate_tokens(section.text, remaining, section.keep), "truncated"
+        else:
+            text, action = OMITTED_MARKER, "omitted"
+        used = estimate_tokens(text) if text else 0
+        remaining = max(0, remaining - used)
+        fitted[section.name] = text
+        report[section.name] = {"tokens": used, "original_tokens": original, "action": action}
+
+    compiled = CompiledPrompt(kind, template.format(**fitted), budget, report)
+    with _log_lock:
+        _log.append({
+            "kind": kind,
+            "model": model_name,
+            "tokens": compiled.tokens,
+            "budget": budget,
+            "reduced": compiled.reduced,
+            "time": time.time(),
+        })
+    if compiled.over_budget:
+        print(f"Prompt '{kind}' oltre il budget: ~{compiled.tokens} token su {budget} (sezioni obbligatorie)")
+    return compiled
+
+
+def recent_prompts(limit=20):
+    with _log_lock:
+        return list(_log)[-limit:]
+
+
+def prompt_stats():
+    """{tipo: {"calls", "avg_tokens", "max_tokens", "reduced"}} sulle ultime PROMPT_LOG_SIZE chiamate."""
+    stats = {}
+    with _log_lock:
+        entries = list(_log)
+    for entry in entries:
+        s = stats.setdefault(entry["kind"], {"calls": 0, "avg_tokens": 0, "max_tokens": 0, "reduced": 0})
+        s["calls"] += 1
+        s["avg_tokens"] += entry["tokens"]
+        s["max_tokens"] = max(s["max_tokens"], entry["tokens"])
+        s["reduced"] += bool(entry["reduced"])
+    for s in stats.values():
+        s["avg_tokens"] = s["avg_tokens"] // s["calls"]
+    return stats
@@ -0,0 +1,131 @@
+"""
+Rate limiter condiviso dal processo per le chiamate Gemini.
+
+Un limiter per API key (tutte le sessioni che usano lo stesso profilo
+condividono lo stesso budget): due token bucket, richieste/minuto e
+token/minuto, con coda FIFO. Le chiamate aspettano il proprio turno invece
+di finire in 429; se il quota viene comunque superato, il limiter si mette
+in pausa per tutti con un backoff esponenziale con jitter.
+"""
+import os
+import time
+import random
+import threading
+from collections import deque
+
+from common import key_id
+
+DEFAULT_RPM = int(os.getenv("GEMINI_RPM", "10"))
+DEFAULT_TPM = int(os.getenv("GEMINI_TPM", "250000"))
+BACKOFF_BASE = 5  # secondi
+BACKOFF_MAX = 60
+IMAGE_TOKENS = 258  # Costo fisso di un'immagine nel conteggio token Gemini
+
+
+def estimate_tokens(text):
+    """Stima grezza (~4 caratteri per token), sufficiente per il budget."""
+    return max(1, len(text or "") // 4)
+
+
+class RateLimiter:
+    """Token bucket doppio (RPM + TPM) thread-safe con coda FIFO."""
+
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, clock=time.monotonic):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._clock = clock
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._last = clock()
+        self._paused_until = 0.0
+        self._queue = deque()
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        elapsed = now - self._last
+        self._last = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _wait_needed(self, requests, tokens, now):
+        wait_requests = (requests - self._requests) * 60 / self.rpm
+        wait_tokens = (tokens - self._tokens) * 60 / self.tpm
+        return max(0.0, wait_requests, wait_tokens, self._paused_until - now)
+
+    @property
+    def queue_depth(self):
+        with self._cond:
+            return len(self._queue)
+
+    def expected_wait(self, tokens=0):
+        """Secondi di attesa stimati per una nuova chiamata da `tokens`, dietro alla coda attuale."""
+        with self._cond:
+            now = self._clock()
+            self._refill(now)
+            queued_tokens = sum(t for _ticket, t in self._queue)
+            return self._wait_needed(len(self._queue) + 1, min(queued_tokens + tokens, self.tpm), now)
+
+    def acquire(self, tokens, timeout=None):
+        """
+        Blocca finché la chiamata rientra nel budget (in ordine di arrivo).
+        Returns i secondi passati in coda; TimeoutError oltre `timeout`.
+        """
+        tokens = min(tokens, self.tpm)  # Una singola chiamata enorme non deve bloccarsi per sempre
+        ticket = object()
+        with self._cond:
+            start = self._clock()
+            self._queue.append((ticket, tokens))
+            try:
+                while True:
+                    now = self._clock()
+                    self._refill(now)
+                    if self._queue[0][0] is ticket:
+                        wait = self._wait_needed(1, tokens, now)
+                        if wait <= 0:
+                            self._requests -= 1
+                            self._tokens -= tokens
+                            return now - start
+                    else:
+                        wait = None
+                    if timeout is not None:
+                        remaining = start + timeout - now
+                        if remaining <= 0:
+                            raise TimeoutError("Rate limiter: attesa massima superata")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                self._queue = deque(item for item in self._queue if item[0] is not ticket)
+                self._cond.notify_all()
+
+    def settle(self, estimated, actual):
+        """Corregge il bucket token con il consumo reale (può andare in debito)."""
+        if actual is None:
+            return
+        with self._cond:
+            self._tokens -= actual - min(estimated, self.tpm)
+            self._cond.notify_all()
+
+    def backoff(self, attempt):
+        """
+        429 nonostante il limiter: pausa condivisa con backoff esponenziale + jitter.
+        Returns i secondi di pausa scelti.
+        """
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)) * random.uniform(0.5, 1.5)
+        with self._cond:
+            self._paused_until = max(self._paused_until, self._clock() + delay)
+            self._cond.notify_all()
+        return delay
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api_key):
+    """RateLimiter condiviso per la key (indicizzato per hash, la key non resta in chiaro)."""
+    limiter_id = key_id(api_key)
+    with _limiters_lock:
+        limiter = _limiters.get(limiter_id)
+        if limiter is None:
+            limiter = _limiters[limiter_id] = RateLimiter()
+        return limiter
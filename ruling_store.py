@@ -0,0 +1,218 @@
+"""
+Archivio locale dei ruling, indicizzato per carta e per coppia di carte.
+
+Sostituisce il blocco fisso extra_rulings_db del prompt del Judge: per ogni
+verdetto entrano solo i ruling delle carte coinvolte, prima quelli sulle
+interazioni tra le carte (coppie), poi quelli sulle singole carte, entro un
+budget di token. I ruling si caricano in blocco da JSON:
+
+    {"rulings": [{"cards": ["Mirrorjade the Iceblade Dragon", 37520316],
+                  "question": "...", "answer": "...", "source": "..."}]}
+
+Le carte possono essere nomi o ID; i nomi vengono risolti in ID con il
+catalogo locale (se non risolvibili restano come "name:<nome>").
+"""
+import os
+import json
+import hashlib
+import threading
+from itertools import combinations
+
+import card_catalog
+from common import CACHE_DIR, connect
+from rate_limiter import estimate_tokens
+
+RULINGS_DB_PATH = os.path.join(CACHE_DIR, "rulings.sqlite")
+SEED_RULINGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rulings.json")
+RULINGS_TOKEN_BUDGET = 1500  # Token massimi di ruling extra per prompt
+
+
+def ruling_keys(cards_data, missing_names=()):
+    """Chiavi con cui cercare i ruling: ID e nome di ogni carta risolta, nome di quelle mancanti."""
+    keys = set()
+    for card in cards_data:
+        if card.get("id") is not None:
+            keys.add(str(card["id"]))
+        if card.get("name"):
+            keys.add(f"name:{card['name'].strip().lower()}")
+    keys.update(f"name:{name.strip().lower()}" for name in missing_names if name.strip())
+    return keys
+
+
+def format_rulings(rulings):
+    """Testo per il prompt, stesso formato Q/A del vecchio blocco fisso."""
+    return "\n".join(f"Q: {question}\nA: {answer}\n" for question, answer in rulings)
+
+
+class RulingStore:
+    """SQLite thread-safe: tabelle rulings, ruling_cards (indice per carta), ruling_pairs (indice per coppia)."""
+
+    def __init__(self, path=RULINGS_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rulings (
+                    id INTEGER PRIMARY KEY,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    source TEXT,
+                    tokens INTEGER NOT NULL,
+                    content_hash TEXT UNIQUE NOT NULL,
+                    seeded INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            # Archivi creati prima della colonna seeded (ruling del file del repo)
+            if "seeded" not in {row[1] for row in conn.execute("PRAGMA table_info(rulings)")}:
+                conn.execute("ALTER TABLE rulings ADD COLUMN seeded INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE TABLE IF NOT EXISTS ruling_cards (card_key TEXT NOT NULL, ruling_id INTEGER NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ruling_cards ON ruling_cards (card_key)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ruling_pairs (
+                    card_a TEXT NOT NULL, card_b TEXT NOT NULL, ruling_id INTEGER NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ruling_pairs ON ruling_pairs (card_a, card_b)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _connect(self):
+        return connect(self.path)
+
+    @staticmethod
+    def _card_key(card, name_index):
+        if isinstance(card, int) or (isinstance(card, str) and card.isdigit()):
+            return str(card)
+        card_id = name_index.get(card.strip().lower())
+        return str(card_id) if card_id is not None else f"name:{card.strip().lower()}"
+
+    @staticmethod
+    def _read_entries(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("rulings", [])
+
+    @staticmethod
+    def _name_index():
+        return {name.lower(): card_id for name, card_id in card_catalog.load_name_index().items()}
+
+    def _insert(self, conn, entries, name_index, seeded=False):
+        """Inserisce i ruling nella transazione `conn`; quelli già presenti vengono saltati. Returns quanti nuovi."""
+        added = 0
+        for entry in entries:
+            question, answer = entry.get("question", "").strip(), entry.get("answer", "").strip()
+            cards = sorted({self._card_key(c, name_index) for c in entry.get("cards", []) if str(c).strip()})
+            if not question or not answer or not cards:
+                continue
+            content_hash = hashlib.sha256(
+                json.dumps([cards, question, answer], ensure_ascii=False).encode("utf-8")
+            ).hexdigest()
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO rulings (question, answer, source, tokens, content_hash, seeded) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (question, answer, entry.get("source"), estimate_tokens(f"Q: {question}\nA: {answer}\n"),
+                 content_hash, int(seeded))
+            )
+            if not cursor.rowcount:
+                if seeded:
+                    # Già importato a mano: ora fa parte del seed e ne segue gli aggiornamenti
+                    conn.execute("UPDATE rulings SET seeded = 1 WHERE content_hash = ?", (content_hash,))
+                continue
+            ruling_id = cursor.lastrowid
+            conn.executemany("INSERT INTO ruling_cards (card_key, ruling_id) VALUES (?, ?)",
+                             [(key, ruling_id) for key in cards])
+            conn.executemany("INSERT INTO ruling_pairs (card_a, card_b, ruling_id) VALUES (?, ?, ?)",
+                             [(a, b, ruling_id) for a, b in combinations(cards, 2)])
+            added += 1
+        return added
+
+    def load_json(self, path):
+        """Import in blocco (una transazione). I ruling già presenti vengono saltati. Returns quanti nuovi."""
+        entries = self._read_entries(path)
+        name_index = self._name_index()
+        with self._lock, self._connect() as conn:
+            return self._insert(conn, entries, name_index)
+
+    def ensure_seed(self, path=SEED_RULINGS_PATH):
+        """
+        Importa il file di ruling del repo quando cambia (hash del contenuto).
+        I ruling del seed precedente vengono sostituiti nella stessa transazione:
+        un ruling corretto o rimosso dal file non resta in archivio.
+        """
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            seed_hash = hashlib.sha256(f.read()).hexdigest()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'seed_hash'").fetchone()
+        if row and row[0] == seed_hash:
+            return
+        entries = self._read_entries(path)
+        name_index = self._name_index()
+        with self._lock, self._connect() as conn:
+            stale = "SELECT id FROM rulings WHERE seeded = 1"
+            conn.execute(f"DELETE FROM ruling_cards WHERE ruling_id IN ({stale})")
+            conn.execute(f"DELETE FROM ruling_pairs WHERE ruling_id IN ({stale})")
+            conn.execute("DELETE FROM rulings WHERE seeded = 1")
+            self._insert(conn, entries, name_index, seeded=True)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('seed_hash', ?)", (seed_hash,))
+
+    def relevant(self, keys, token_budget=RULINGS_TOKEN_BUDGET):
+        """
+        [(domanda, risposta)] per le carte `keys`, entro `token_budget`.
+        Priorità: ruling su una coppia di carte presenti (interazioni), poi
+        quelli che coinvolgono più carte presenti, poi i più brevi.
+        """
+        keys = sorted(keys)
+        if not keys:
+            return []
+        placeholders = ",".join("?" * len(keys))
+        with self._connect() as conn:
+            pair_ids = {row[0] for row in conn.execute(
+                f"SELECT ruling_id FROM ruling_pairs WHERE card_a IN ({placeholders}) AND card_b IN ({placeholders})",
+                keys + keys
+            )}
+            rows = conn.execute(f"""
+                SELECT r.id, r.question, r.answer, r.tokens, COUNT(DISTINCT c.card_key) AS matched
+                FROM ruling_cards c JOIN rulings r ON r.id = c.ruling_id
+                WHERE c.card_key IN ({placeholders})
+                GROUP BY r.id
+            """, keys).fetchall()
+
+        rows.sort(key=lambda r: (r[0] not in pair_ids, -r[4], r[3], r[0]))
+        selected = []
+        used = 0
+        for _id, question, answer, tokens, _matched in rows:
+            if used + tokens > token_budget:
+                continue
+            selected.append((question, answer))
+            used += tokens
+        return selected
+
+    def stats(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*), COALESCE(SUM(tokens), 0) FROM rulings").fetchone()
+
+
+_ruling_store = None
+_ruling_store_lock = threading.Lock()
+
+
+def get_ruling_store():
+    """RulingStore condiviso dal processo, con il seed del repo importato."""
+    global _ruling_store
+    with _ruling_store_lock:
+        if _ruling_store is None:
+            store = RulingStore()
+            store.ensure_seed()
+            _ruling_store = store
+        return _ruling_store
+
+
+if __name__ == "__main__":
+    # Import in blocco: python ruling_store.py file1.json [file2.json ...]
+    import sys
+    store = get_ruling_store()
+    for json_path in sys.argv[1:]:
+        print(f"{json_path}: {store.load_json(json_path)} ruling nuovi")
+    count, tokens = store.stats()
+    print(f"Archivio: {count} ruling, ~{tokens} token")
@@ -0,0 +1,20 @@
+import batch_judge
+
+
+def test_missing_key_fails_before_reading_input(tmp_path, monkeypatch, capsys):
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    monkeypatch.setenv("YGO_LLM_PROVIDER", "gemini")
+    assert batch_judge.run(str(tmp_path / "assente.jsonl"), str(tmp_path / "out.jsonl")) == 1
+    assert "GEMINI_API_KEY" in capsys.readouterr().err
+    assert not (tmp_path / "out.jsonl").exists()
+
+
+def test_stub_provider_runs_without_key(tmp_path, monkeypatch, capsys):
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    monkeypatch.setenv("YGO_LLM_PROVIDER", "stub")
+    empty = tmp_path / "in.jsonl"
+    empty.write_text("\n", encoding="utf-8")
+    # Nessuno scenario: esce dopo aver letto l'input, senza errori sulla key
+    assert batch_judge.run(str(empty), str(tmp_path / "out.jsonl")) == 1
+    err = capsys.readouterr().err
+    assert "Nessuno scenario" in err and "GEMINI_API_KEY" not in err
@@ -0,0 +1,119 @@
+import pytest
+
+import card_catalog
+
+CARDS = [
+    {"id": 14558127, "name": "Ash Blossom & Joyous Spring", "type": "Tuner Effect Monster", "desc": "...",
+     "misc_info": [{"views": 900}]},
+    {"id": 10045474, "name": "Infinite Impermanence", "type": "Trap Card", "desc": "..."},
+    {"id": 1861629, "name": "Decode Talker", "type": "Link Effect Monster", "desc": "..."},
+]
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    monkeypatch.setattr(card_catalog, "fetch_remote_version", lambda: "1")
+    monkeypatch.setattr(card_catalog, "_download_localized_names", lambda: {"it": [(14558127, "Cenere Fiorita")]})
+    monkeypatch.setattr(card_catalog, "_ingest_failed_at", {})
+    card_catalog._card_data_cache.clear()
+
+
+@pytest.fixture
+def snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(card_catalog, "_download_cards", lambda language=None: CARDS)
+    path = str(tmp_path / "catalog.sqlite")
+    assert card_catalog.ingest(path)
+    return path
+
+
+def test_lookup_exact_localized_and_partial(snapshot, monkeypatch):
+    monkeypatch.setattr(card_catalog, "_lookup_remote", lambda names: ({}, True))
+    found = card_catalog.get_cards_data(["ash blossom & joyous spring", "Cenere Fiorita", "Impermanence"], snapshot)
+    assert found["ash blossom & joyous spring"]["id"] == 14558127
+    assert found["Cenere Fiorita"]["id"] == 14558127
+    assert found["Impermanence"]["name"] == "Infinite Impermanence"
+
+
+def test_remote_fallback_only_for_missing_names(snapshot, monkeypatch):
+    calls = []
+
+    def fake_remote(names):
+        calls.append(list(names))
+        return {"Brand New Card": {"id": 1, "name": "Brand New Card"}}, True
+
+    monkeypatch.setattr(card_catalog, "_lookup_remote", fake_remote)
+    found = card_catalog.get_cards_data(["Decode Talker", "Brand New Card", "Nope"], snapshot)
+    assert calls == [["Brand New Card", "Nope"]]
+    assert found["Brand New Card"]["id"] == 1 and found["Nope"] is None
+    # I risultati (anche i "non trovati") sono in memo: nessuna nuova richiesta remota
+    card_catalog.get_cards_data(["Nope"], snapshot)
+    assert len(calls) == 1
+
+
+def test_catalog_from_snapshot(snapshot, monkeypatch):
+    monkeypatch.setattr(card_catalog, "_catalog", None)
+    catalog = card_catalog.get_catalog(snapshot)
+    assert len(catalog) == 3
+    assert catalog.get("Decode Talker") == "Link Effect Monster"
+    assert catalog.category_of("Decode Talker") == card_catalog.CardCategory.LINK
+    assert catalog.category_of("Infinite Impermanence") == card_catalog.CardCategory.TRAP
+    assert catalog.localized["Cenere Fiorita"] == "Ash Blossom & Joyous Spring"
+
+
+def test_failed_ingest_is_not_retried_before_backoff(tmp_path, monkeypatch):
+    attempts = []
+
+    def failing_download(language=None):
+        attempts.append(language)
+        raise ConnectionError("offline")
+
+    monkeypatch.setattr(card_catalog, "_download_cards", failing_download)
+    path = str(tmp_path / "catalog.sqlite")
+    for _ in range(5):
+        assert card_catalog.ensure_catalog(path) is False
+    assert len(attempts) == 1
+
+    # Scaduto il backoff si ritenta
+    card_catalog._ingest_failed_at[path] -= card_catalog.INGEST_RETRY_BACKOFF + 1
+    card_catalog.ensure_catalog(path)
+    assert len(attempts) == 2
+
+
+def test_offline_get_catalog_serves_empty_catalog_without_blocking(tmp_path, monkeypatch):
+    attempts = []
+
+    def failing_download(language=None):
+        attempts.append(language)
+        raise ConnectionError("offline")
+
+    monkeypatch.setattr(card_catalog, "_download_cards", failing_download)
+    monkeypatch.setattr(card_catalog, "_catalog", None)
+    path = str(tmp_path / "catalog.sqlite")
+    for _ in range(3):
+        assert len(card_catalog.get_catalog(path)) == 0
+    assert len(attempts) == 1
+
+
+def test_remote_failure_is_not_cached_as_miss(snapshot, monkeypatch):
+    calls = []
+
+    def failing_remote(names):
+        calls.append(list(names))
+        return {}, False
+
+    monkeypatch.setattr(card_catalog, "_lookup_remote", failing_remote)
+    assert card_catalog.get_cards_data(["Blip Card"], snapshot)["Blip Card"] is None
+    # Errore di rete: al prossimo giro si riprova invece di servire un "non trovata" per un'ora
+    card_catalog.get_cards_data(["Blip Card"], snapshot)
+    assert len(calls) == 2
+    # Le carte trovate in locale restano in cache comunque
+    card_catalog.get_cards_data(["Decode Talker"], snapshot)
+    assert card_catalog._card_data_cache.get("decode talker")["id"] == 1861629
+
+
+def test_lookup_remote_reports_http_errors(monkeypatch):
+    class Response:
+        status_code = 503
+
+    monkeypatch.setattr(card_catalog.requests, "get", lambda *args, **kwargs: Response())
+    assert card_catalog._lookup_remote(["Decode Talker"]) == ({}, False)
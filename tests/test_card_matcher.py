@@ -0,0 +1,61 @@
+import pytest
+
+from card_matcher import CardMentionExtractor, CardNameMatcher, normalize_name
+
+NAMES = [
+    "Ash Blossom & Joyous Spring",
+    "Ghost Belle & Haunted Mansion",
+    "Ghost Ogre & Snow Rabbit",
+    "Called by the Grave",
+    "Infinite Impermanence",
+    "Nibiru, the Primal Being",
+    "Lava",
+    "Decode Talker",
+]
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    return CardMentionExtractor(NAMES, localized={"Cenere Fiorita": "Ash Blossom & Joyous Spring"})
+
+
+def test_normalize_name():
+    assert normalize_name("Maxx \"C\"") == "maxx c"
+    assert normalize_name("Città  Perduta!") == "citta perduta"
+
+
+@pytest.mark.parametrize("question", [
+    "Le carte belle sono ash",
+    "Is the ogre in my deck evenly matched?",
+    "Questa carta è called by chi?",
+    "Posso attivare Lava?",
+])
+def test_dictionary_words_are_not_mentions(extractor, question):
+    assert extractor.find_mentions(question) == []
+
+
+def test_official_localized_alias_and_acronym(extractor):
+    question = "Se attivo Cenere Fiorita su Decode Talker, l'avversario può rispondere con imperm e CBTG?"
+    assert extractor.find_mentions(question) == [
+        "Ash Blossom & Joyous Spring", "Decode Talker", "Infinite Impermanence", "Called by the Grave",
+    ]
+    assert extractor.find_mentions("ASH su Nibiru") == ["Ash Blossom & Joyous Spring", "Nibiru, the Primal Being"]
+
+
+def test_longest_leftmost_match_wins(extractor):
+    assert extractor.find_mention_spans("ghost belle & haunted mansion in risposta") == [
+        (0, 4, "Ghost Belle & Haunted Mansion"),
+    ]
+
+
+def test_length_filter_applies_to_aliases():
+    extractor = CardMentionExtractor([], aliases={"cat": "Cat Card", "lion": "Lion Card", "big cat": "Big Cat"})
+    assert extractor.find_mentions("the cat and the lion") == []
+    assert extractor.find_mentions("a big cat") == ["Big Cat"]
+
+
+def test_fuzzy_matcher():
+    matcher = CardNameMatcher(NAMES, localized={"Cenere Fiorita": "Ash Blossom & Joyous Spring"})
+    assert matcher.best_match("Infinite Imperrnanence") == "Infinite Impermanence"
+    assert matcher.best_match("Cenere Fiorlta") == "Ash Blossom & Joyous Spring"
+    assert matcher.best_match("zzzzzz") is None
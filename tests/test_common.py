@@ -0,0 +1,36 @@
+import sqlite3
+
+import pytest
+
+from common import connect, key_id
+
+
+def test_connect_commits_and_closes(tmp_path):
+    path = str(tmp_path / "db.sqlite")
+    with connect(path) as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.execute("INSERT INTO t VALUES (1)")
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+    with connect(path) as conn:
+        assert conn.execute("SELECT x FROM t").fetchall() == [(1,)]
+
+
+def test_connect_rolls_back_on_error(tmp_path):
+    path = str(tmp_path / "db.sqlite")
+    with connect(path) as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+    with pytest.raises(RuntimeError):
+        with connect(path) as conn:
+            conn.execute("INSERT INTO t VALUES (1)")
+            raise RuntimeError("boom")
+    with connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone() == (0,)
+
+
+def test_key_id_is_short_stable_and_hides_the_key():
+    assert key_id("secret-key") == key_id("secret-key")
+    assert len(key_id("secret-key")) == 16
+    assert "secret" not in key_id("secret-key")
+    assert key_id("secret-key") != key_id("other-key")
+    assert key_id(None) == key_id("")
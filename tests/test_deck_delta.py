@@ -0,0 +1,68 @@
+import json
+import os
+from collections import defaultdict
+
+import pytest
+
+import deck_delta
+
+LATEST_DECKS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "latest_decks.json")
+
+
+def raw(counts):
+    return [{"amount": n, "card": {"name": name, "image": f"https://img/{name[:3]}.jpg"}} for name, n in counts.items()]
+
+
+def test_core_list_majority_and_most_common_copies():
+    decks = [{"Ash": 3, "Nibiru": 2}, {"Ash": 3, "Nibiru": 1}, {"Ash": 2, "Droll": 3}]
+    assert deck_delta.core_list(decks) == {"Ash": 3, "Nibiru": 2}
+
+
+def test_delta_text_round_trip_with_commas_and_images():
+    core = {"Nibiru, the Primal Being": 2, "Ash Blossom & Joyous Spring": 3}
+    deck = {"Ash Blossom & Joyous Spring": 3, "Droll & Lock Bird": 1}
+    delta = deck_delta.encode_delta(deck, core)
+    text = deck_delta.render_delta(delta, {"Droll & Lock Bird": "https://img/droll.jpg"})
+    assert text == "+1 Droll & Lock Bird <https://img/droll.jpg> | -2 Nibiru, the Primal Being"
+    assert deck_delta.apply_delta(core, deck_delta.parse_delta(text)) == deck
+    assert deck_delta.render_delta({}) == deck_delta.SAME_AS_CORE
+    assert deck_delta.parse_cards(deck_delta.render_cards(core)) == core
+
+
+@pytest.mark.skipif(not os.path.exists(LATEST_DECKS), reason="latest_decks.json assente")
+def test_round_trip_on_saved_meta_decks():
+    with open(LATEST_DECKS, "r", encoding="utf-8") as f:
+        raw_decks = json.load(f)
+    by_arch = defaultdict(list)
+    for d in raw_decks:
+        by_arch[(d.get("deckType") or {}).get("name", "Unknown")].append(deck_delta.card_counts(d.get("main")))
+    cores = deck_delta.build_cores(by_arch)
+    assert cores
+    for arch, decks in by_arch.items():
+        for deck in decks:
+            assert deck_delta.parse_cards(deck_delta.render_cards(deck)) == deck
+            if arch in cores:
+                text = deck_delta.render_delta(deck_delta.encode_delta(deck, cores[arch]))
+                assert deck_delta.apply_delta(cores[arch], deck_delta.parse_delta(text)) == deck
+
+
+def test_encode_report_items_round_trip():
+    decks = [
+        {"Snake-Eye Ash": 3, "Diabellstar the Black Witch": 2, "Called by the Grave": 1},
+        {"Snake-Eye Ash": 3, "Diabellstar the Black Witch": 1, "Nibiru, the Primal Being": 2},
+        {"Snake-Eye Ash": 2, "Diabellstar the Black Witch": 2},
+    ]
+    items = [{"deck_text": "Snake-Eye", "raw_main": raw(d)} for d in decks]
+    items.append({"deck_text": "Tenpai Dragon", "raw_main": raw({"Sangen Summoning": 3})})
+    items.append({"deck_text": "Senza lista", "details": "testo originale"})
+
+    cores_text, details = deck_delta.encode_report_items(items)
+    core_line = next(line for line in cores_text.splitlines() if line.strip().startswith("Main Deck:"))
+    core = deck_delta.parse_cards(core_line.split("Main Deck:", 1)[1])
+    assert "- CORE Snake-Eye (3 mazzi)" in cores_text and "Tenpai" not in cores_text
+    for deck, detail in zip(decks, details):
+        assert "[DELTA vs CORE Snake-Eye]" in detail
+        delta_line = next(line for line in detail.splitlines() if line.strip().startswith("Main Deck:"))
+        assert deck_delta.apply_delta(core, deck_delta.parse_delta(delta_line.split("Main Deck:", 1)[1])) == deck
+    assert "[LISTA COMPLETA]" in details[3] and "3x Sangen Summoning" in details[3]
+    assert details[4] == "testo originale"
@@ -0,0 +1,62 @@
+import io
+
+import pytest
+from PIL import Image
+
+import deck_renderer
+import image_cache
+
+
+def jpeg_bytes(color):
+    out = io.BytesIO()
+    Image.new("RGB", (421, 614), color).save(out, format="JPEG")
+    return out.getvalue()
+
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    cache = image_cache.ImageCache(str(tmp_path / "images"))
+    monkeypatch.setattr(deck_renderer, "get_image_cache", lambda: cache)
+    monkeypatch.setattr(deck_renderer, "DECK_IMAGE_DIR", str(tmp_path / "static" / "decks"))
+    return cache
+
+
+CARDS = [{"name": "Ash Blossom & Joyous Spring", "url": "https://img/ash.jpg"},
+         {"name": "Infinite Impermanence", "url": "https://img/imperm.jpg"}]
+
+
+def test_section_is_saved_and_served_by_url(mirror, monkeypatch):
+    monkeypatch.setattr(mirror, "_download", lambda url: jpeg_bytes((200, len(url), 0)))
+    url, data, hotspots = deck_renderer.render_section(CARDS)
+    assert url.startswith(deck_renderer.DECK_IMAGE_URL + "/") and url.endswith(".jpg")
+    assert data and len(hotspots) == 2
+    html = deck_renderer.section_html(url, hotspots)
+    assert f'src="{url}"' in html and "base64" not in html
+    assert html.count("<a ") == 2
+
+    # Originale + miniatura per carta, più la sezione composta: tutti nella stessa LRU
+    count, size = mirror.stats()
+    assert count == 5 and size > len(data)
+    assert deck_renderer.render_section(CARDS)[0] == url
+
+
+def test_placeholder_render_is_not_saved(mirror, monkeypatch):
+    def offline(url):
+        raise ConnectionError("offline")
+
+    monkeypatch.setattr(mirror, "_download", offline)
+    url, data, _hotspots = deck_renderer.render_section(CARDS)
+    assert url is None and data
+    assert mirror.stats()[0] == 0
+
+    monkeypatch.setattr(mirror, "_download", lambda url: jpeg_bytes((0, 200, 0)))
+    assert deck_renderer.render_section(CARDS)[0] is not None
+
+
+def test_deck_renders_are_evicted_with_the_mirror(tmp_path, monkeypatch):
+    cache = image_cache.ImageCache(str(tmp_path / "images"), max_bytes=1000)
+    path = cache.put_file("deck-a", str(tmp_path / "static" / "a.jpg"), b"x" * 600)
+    cache.put_file("deck-b", str(tmp_path / "static" / "b.jpg"), b"x" * 600)
+    assert cache.file_path("deck-a") is None
+    assert not (tmp_path / "static" / "a.jpg").exists() and path.endswith("a.jpg")
+    assert cache.file_path("deck-b")
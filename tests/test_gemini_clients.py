@@ -0,0 +1,34 @@
+"""
+Guardia sull'SDK Gemini: gemini_clients si aggancia a GenerativeModel._client.
+Se un aggiornamento di google-generativeai rimuove l'aggancio, questi test
+falliscono invece di lasciare le chiamate sulla configurazione globale.
+"""
+import pytest
+
+genai = pytest.importorskip("google.generativeai")
+
+import gemini_clients  # noqa: E402
+
+
+def test_sdk_version_is_supported():
+    assert genai.__version__.startswith(gemini_clients.SUPPORTED_SDK_PREFIXES)
+
+
+def test_generative_model_still_exposes_client_hook():
+    model = genai.GenerativeModel("gemini-test")
+    assert hasattr(model, "_client")
+    assert model._client is None
+
+
+def test_model_is_bound_to_the_key_client():
+    model = gemini_clients.get_model("gemini-test", "key-a")
+    assert model._client is gemini_clients.get_client("key-a")
+    assert gemini_clients.get_model("gemini-test", "key-a") is model
+    other = gemini_clients.get_model("gemini-test", "key-b")
+    assert other._client is not model._client
+
+
+def test_unsupported_version_fails_loudly(monkeypatch):
+    monkeypatch.setattr(genai, "__version__", "9.9.9")
+    with pytest.raises(ImportError, match="non supportato"):
+        gemini_clients.check_sdk()
@@ -0,0 +1,38 @@
+from key_pool import KeyPool, get_key_pool, is_daily_quota_error, is_quota_error
+
+KEYS = {"alice": "key-a", "bob": "key-b", "carol": "key-c"}
+
+
+def test_round_robin():
+    pool = KeyPool(KEYS)
+    assert [pool.next_key()[0] for _ in range(4)] == ["alice", "bob", "carol", "alice"]
+
+
+def test_cooldown_skips_key_and_counts_errors():
+    pool = KeyPool(KEYS)
+    pool.cooldown("bob", 60)
+    assert [pool.next_key()[0] for _ in range(4)] == ["alice", "carol", "alice", "carol"]
+    status = {name: (remaining, calls, errors) for name, remaining, calls, errors in pool.status()}
+    assert status["bob"][0] > 50 and status["bob"][2] == 1
+    assert status["alice"][1] == 2
+
+
+def test_all_in_cooldown_returns_first_to_recover():
+    pool = KeyPool(KEYS)
+    pool.cooldown("alice", 300)
+    pool.cooldown("bob", 30)
+    pool.cooldown("carol", 120)
+    assert pool.next_key() == ("bob", "key-b")
+
+
+def test_quota_error_classification():
+    assert is_quota_error("429 Resource has been exhausted")
+    assert is_quota_error("Quota exceeded for metric")
+    assert not is_quota_error("500 Internal error")
+    assert is_daily_quota_error("Quota exceeded: GenerateRequestsPerDayPerProjectPerModel")
+    assert not is_daily_quota_error("GenerateRequestsPerMinutePerProjectPerModel")
+
+
+def test_pool_shared_per_key_set():
+    assert get_key_pool(dict(KEYS)) is get_key_pool(dict(reversed(list(KEYS.items()))))
+    assert get_key_pool({"alice": "key-a"}) is not get_key_pool(KEYS)
@@ -0,0 +1,111 @@
+from meta_index import MetaIndex, chunk_meta_report, get_meta_index
+
+REPORT = """REPORT META TCG
+Fonte: test
+
+=== CORE LIST ARCHETIPI ===
+- CORE Snake-Eye (2 mazzi)
+  3 Snake-Eye Ash
+  3 Ash Blossom & Joyous Spring
+- CORE Tenpai Dragon (2 mazzi)
+  3 Tenpai Dragon Chundra
+==========
+=== TOP CUT ===
+- 1st: Mario -> Snake-Eye
+   [DELTA vs CORE Snake-Eye]
+   +1 Called by the Grave
+- 2nd: Luigi -> Tenpai Dragon
+   [DELTA vs CORE Tenpai Dragon]
+   +2 Droll & Lock Bird
+- Top 4: Peach -> Yubel
+  3 Yubel - Terror Incarnate
+  3 Nibiru, the Primal Being
+==========
+=== DECK 1 ===
+Yubel (Regional Torino)
+  3 Yubel - Terror Incarnate
+  2 Nibiru, the Primal Being
+=== DECK 2 ===
+Labrynth (Regional Torino)
+  3 Lovely Labrynth of the Silver Castle
+"""
+
+
+def test_chunks_follow_sections_entries_and_decks():
+    header, chunks = chunk_meta_report(REPORT)
+    assert header == "REPORT META TCG\nFonte: test"
+    assert len(chunks) == 7
+    assert chunks[0] == "[CORE LIST ARCHETIPI]\n- CORE Snake-Eye (2 mazzi)\n  3 Snake-Eye Ash\n  3 Ash Blossom & Joyous Spring"
+    assert chunks[1].startswith("[CORE LIST ARCHETIPI]\n- CORE Tenpai Dragon")
+    # Ogni voce "- " è un blocco a sé, con la sezione in testa
+    assert chunks[2] == "[TOP CUT]\n- 1st: Mario -> Snake-Eye\n   [DELTA vs CORE Snake-Eye]\n   +1 Called by the Grave"
+    assert chunks[4].endswith("3 Nibiru, the Primal Being")
+    # Nei blocchi DECK le righe "- " non aprono nuovi blocchi; il separatore chiude
+    assert chunks[5].startswith("[TOP CUT]\nDECK 1\nYubel (Regional Torino)")
+    assert "Yubel - Terror Incarnate" in chunks[5]
+    assert chunks[6].startswith("[TOP CUT]\nDECK 2\nLabrynth")
+
+
+def test_long_blocks_are_split_but_core_lists_stay_whole():
+    lines = "\n".join(f"  1 Carta numero {i}" for i in range(200))
+    _, chunks = chunk_meta_report(f"=== DUMP ===\n- Lista lunga\n{lines}\n=== CORE ===\n- CORE Big (3 mazzi)\n{lines}\n")
+    dump = [c for c in chunks if c.startswith("[DUMP]")]
+    core = [c for c in chunks if c.startswith("[CORE]")]
+    assert len(dump) > 1
+    assert all(len(c) <= 2000 + len("[DUMP]\n") for c in dump)
+    assert len(core) == 1 and core[0].endswith("Carta numero 199")
+
+
+def test_bm25_ranks_the_most_specific_chunk_first():
+    index = MetaIndex(REPORT)
+    results = index.search("Lovely Labrynth", k=2)
+    assert results[0].startswith("[TOP CUT]\nDECK 2\nLabrynth")
+    # Solo i blocchi che contengono un termine ricevono un punteggio
+    scores = index.scores("Nibiru")
+    assert set(scores) == {4, 5}
+    # Un termine raro pesa più di uno presente in molti blocchi
+    scores = index.scores("Droll Nibiru")
+    assert scores[3] > scores[4]
+    assert index.scores("parola inesistente") == {}
+
+
+def test_unmatched_query_falls_back_to_report_order():
+    index = MetaIndex(REPORT)
+    assert index.search("zzz", k=2) == index.chunks[:2]
+
+
+def test_token_budget_skips_chunks_that_do_not_fit():
+    index = MetaIndex(REPORT)
+    full = index.search("Yubel Nibiru", k=8)
+    assert len(full) == 2
+    budget = min(index.chunk_tokens[4], index.chunk_tokens[5])
+    cut = index.search("Yubel Nibiru", k=8, token_budget=budget)
+    assert len(cut) == 1
+    assert sum(index.chunk_tokens[index.chunks.index(c)] for c in cut) <= budget
+
+
+def test_delta_deck_pulls_in_its_archetype_core_first():
+    index = MetaIndex(REPORT)
+    results = index.search("Mario", k=8)
+    assert results == [index.chunks[0], index.chunks[2]]
+    # Core e delta entrano insieme o nessuno dei due
+    cost = index.chunk_tokens[0] + index.chunk_tokens[2]
+    assert index.search("Mario", token_budget=cost - 1) == []
+
+
+def test_core_already_selected_is_not_repeated():
+    index = MetaIndex(REPORT)
+    results = index.search("Snake-Eye Mario", k=8)
+    assert results.count(index.chunks[0]) == 1
+    assert results.index(index.chunks[0]) < results.index(index.chunks[2])
+
+
+def test_context_includes_aggregates_and_index_is_shared():
+    data = [{"name": "Snake-Eye", "count": 3}, {"name": "Yubel", "count": 1}]
+    index = get_meta_index(REPORT, data)
+    assert get_meta_index(REPORT, data) is index
+    text, n = index.context_for("Labrynth", k=1)
+    assert n == 1
+    assert "MAZZI TOTALI: 4 (2 archetipi diversi)" in text
+    assert "- Snake-Eye: 3 (75.0%)" in text
+    assert "Lovely Labrynth" in text
@@ -0,0 +1,86 @@
+import pytest
+
+from meta_query import MetaQueryPlanner
+
+
+def _item(deck, main, place="Top 8", country="Italy", event_type="Regional", event="Regional Milano", side=()):
+    return {
+        "deck_text": deck, "place": place, "country": country, "event_type": event_type, "event_source": event,
+        "raw_main": [{"amount": n, "card": {"name": name}} for name, n in main],
+        "raw_side": [{"amount": n, "card": {"name": name}} for name, n in side],
+        "raw_extra": [],
+    }
+
+
+@pytest.fixture
+def planner():
+    items = [
+        _item("Snake-Eye", [("Snake-Eye Ash", 3), ("Ash Blossom & Joyous Spring", 3)], place="1st"),
+        _item("Snake-Eye", [("Snake-Eye Ash", 3), ("Droll & Lock Bird", 2)], country="Germany"),
+        _item("Tenpai Dragon", [("Infinite Impermanence", 3), ("Ash Blossom & Joyous Spring", 2)],
+              side=[("Ash Blossom & Joyous Spring", 1)]),
+        _item("Yubel", [("Infinite Impermanence", 1)], event_type="Major", event="YCS Bologna"),
+    ]
+    return MetaQueryPlanner(items)
+
+
+def test_card_usage_percent(planner):
+    plan = planner.plan("Che % dei top gioca Ash Blossom?")
+    assert plan["intent"] == "card_usage"
+    assert plan["cards"] == ["Ash Blossom & Joyous Spring"]
+    assert "Main Deck 50.0% (2/4" in planner.execute(plan)
+
+
+def test_deck_count_with_country_filter(planner):
+    plan = planner.plan("Quanti Snake-Eye hanno toppato in Italia?")
+    assert plan["intent"] == "deck_count" and plan["filters"]["countries"] == ["Italy"]
+    assert "**Snake-Eye**: 1 top su 3" in planner.execute(plan)
+
+
+def test_top_decks(planner):
+    answer = planner.answer("top 2 mazzi")
+    assert "1. **Snake-Eye**: 2 (50.0%)" in answer
+
+
+@pytest.mark.parametrize("question", [
+    "What is the best way to play around Ash Blossom?",
+    "Posso giocare Ash nel side contro Snake-Eye?",
+    "Ash vs Snake-Eye, quante copie?",
+    "Perché Snake-Eye gioca Ash?",
+    "Tenpai Dragon è forte?",
+    "Ash nel side?",
+])
+def test_open_ended_questions_go_to_model(planner, question):
+    assert planner.plan(question) is None
+
+
+def test_deck_name_inside_card_name_is_not_a_filter(planner):
+    plan = planner.plan("Snake-Eye Ash è giocata in quanti mazzi?")
+    assert plan["cards"] == ["Snake-Eye Ash"]
+    assert plan["decks"] == []
+    assert "(2/4" in planner.execute(plan)
+
+
+def test_unresolved_deck_name_goes_to_model(planner):
+    assert planner.plan("Quante copie di imperm giocano i Tenpai?") is None
+    plan = planner.plan("Quante copie di imperm giocano i Tenpai Dragon?")
+    assert plan["decks"] == ["Tenpai Dragon"]
+    assert plan["cards"] == ["Infinite Impermanence"]
+
+
+def test_explicit_side_statistic_stays_local(planner):
+    plan = planner.plan("what % of tops play Ash Blossom in side")
+    assert plan["sections"] == ["side"]
+    assert "Side Deck 25.0% (1/4" in planner.execute(plan)
+
+
+@pytest.mark.parametrize("question", ["How many Snake-Eye decks won?", "How many Snake-Eye wins?"])
+def test_won_and_wins_filter_winners(planner, question):
+    plan = planner.plan(question)
+    assert plan["filters"]["winners"]
+    assert "**Snake-Eye**: 1" in planner.execute(plan)
+
+
+def test_winrate_is_not_a_winners_filter(planner):
+    plan = planner.plan("How many Snake-Eye decks? winrate")
+    assert plan is None or not plan["filters"]["winners"]
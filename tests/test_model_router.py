@@ -0,0 +1,125 @@
+import threading
+import time
+
+from model_router import ModelRouter, StubBackend
+
+MODELS = ["gemini-2.5-flash", "gemini-2.5-pro", "gemini-2.0-flash"]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_router(profiles, **kwargs):
+    clock = FakeClock()
+    backend = StubBackend(profiles)
+    return ModelRouter(backend, candidates=MODELS, clock=clock, **kwargs), backend, clock
+
+
+def healthy_profiles():
+    return {"gemini-2.5-flash": (0.6, 0.0), "gemini-2.5-pro": (2.5, 0.0), "gemini-2.0-flash": (0.5, 0.0)}
+
+
+def test_initial_choice_is_first_healthy_candidate():
+    profiles = healthy_profiles()
+    profiles["gemini-2.5-flash"] = (0.6, 1.0)
+    router, _backend, _clock = make_router(profiles)
+    assert router.current() == "gemini-2.5-pro"
+
+
+def test_failover_on_call_errors_and_latency_slo():
+    router, backend, _clock = make_router(healthy_profiles())
+    assert router.refresh() == "gemini-2.5-flash"
+    for _ in range(3):
+        chosen = router.report("gemini-2.5-flash", None, False, error="500 Internal")
+    assert chosen == "gemini-2.5-pro"
+
+    backend.profiles["gemini-2.5-flash"] = (0.6, 1.0)
+    backend.profiles["gemini-2.5-pro"] = (30.0, 0.0)  # Fuori SLO
+    assert router.refresh() == "gemini-2.0-flash"
+
+
+def test_successful_probe_recovers_preferred_model():
+    router, backend, _clock = make_router(healthy_profiles())
+    router.refresh()
+    backend.profiles["gemini-2.5-flash"] = (0.6, 1.0)
+    for _ in range(20):
+        router.report("gemini-2.5-flash", None, False, error="503 Unavailable")
+    assert router.refresh() == "gemini-2.5-pro"
+
+    backend.profiles["gemini-2.5-flash"] = (0.6, 0.0)
+    assert router.refresh() == "gemini-2.5-flash"
+    assert router.stats()["gemini-2.5-flash"]["error_rate"] == 0.0
+
+
+def test_quota_error_stops_probe_round_and_defers_next_one():
+    router, backend, clock = make_router(healthy_profiles(), probe_interval=300)
+    router.refresh()
+    probes = []
+
+    def quota_probe(model_name):
+        probes.append(model_name)
+        raise RuntimeError("429 Resource has been exhausted (e.g. check quota).")
+
+    backend.probe = quota_probe
+    backend.quota_backoff = lambda: 900
+    assert router.refresh() == "gemini-2.5-flash"
+    # Un solo probe: il 429 riguarda la key, non i singoli modelli
+    assert probes == ["gemini-2.5-flash"]
+    stats = router.stats()["gemini-2.5-flash"]
+    assert stats["error_rate"] == 0.0 and stats["last_error"] is None
+
+    clock.now = 301  # intervallo normale passato, backoff no: nessun nuovo giro
+    router.current()
+    time.sleep(0.05)
+    assert len(probes) == 1
+    clock.now = 901
+    router.current()
+    for _ in range(100):
+        if len(probes) == 2:
+            break
+        time.sleep(0.01)
+    assert probes == ["gemini-2.5-flash"] * 2
+
+
+def test_initial_probe_runs_once_for_concurrent_callers():
+    calls = []
+
+    class SlowBackend:
+        def probe(self, model_name):
+            calls.append(model_name)
+            time.sleep(0.05)
+            return 0.5
+
+    router = ModelRouter(SlowBackend(), candidates=MODELS, clock=FakeClock())
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(router.current())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["gemini-2.5-flash"] * 8
+    assert calls == ["gemini-2.5-flash"]
+
+
+def test_background_probe_after_interval():
+    router, backend, clock = make_router(healthy_profiles(), probe_interval=300)
+    probe = backend.probe
+    probed = threading.Event()
+
+    def counting_probe(model_name):
+        probed.set()
+        return probe(model_name)
+
+    router.current()
+    backend.probe = counting_probe
+    clock.now = 100
+    assert router.current() == "gemini-2.5-flash"
+    assert not probed.is_set()
+    clock.now = 301
+    assert router.current() == "gemini-2.5-flash"  # Risposta immediata, probe in background
+    assert probed.wait(2)
@@ -0,0 +1,69 @@
+from judge_prompts import build_judge_prompt
+from prompt_compiler import OMITTED_MARKER, Section, budget_for, compile_prompt, truncate_tokens
+from rate_limiter import estimate_tokens
+
+TEMPLATE = "Domanda: {question}\nContesto: {context}\nStoria: {history}"
+
+
+def lines(prefix, n):
+    return "\n".join(f"{prefix} riga {i} " + "x" * 60 for i in range(n))
+
+
+def test_everything_fits_untouched():
+    compiled = compile_prompt("t", TEMPLATE, [
+        Section("question", "Chi vince?", 0), Section("context", "breve", 1), Section("history", "", 2),
+    ], budget=1000)
+    assert compiled.text == "Domanda: Chi vince?\nContesto: breve\nStoria: "
+    assert compiled.reduced == [] and not compiled.over_budget
+
+
+def test_lower_priority_sections_shrink_first():
+    compiled = compile_prompt("t", TEMPLATE, [
+        Section("question", "Chi vince?", 0),
+        Section("context", lines("ctx", 40), 1),
+        Section("history", lines("hist", 40), 2, keep="end"),
+    ], budget=1000)
+    assert compiled.tokens <= 1000
+    assert compiled.sections["context"]["action"] == "full"
+    assert compiled.sections["history"]["action"] == "truncated"
+    # keep="end": resta la parte più recente della cronologia
+    assert "hist riga 39" in compiled.text and "hist riga 0 " not in compiled.text
+
+
+def test_fallback_and_omission():
+    compiled = compile_prompt("t", TEMPLATE, [
+        Section("question", lines("q", 10), 0),
+        Section("context", lines("ctx", 100), 1, fallback="solo i nomi"),
+        Section("history", lines("hist", 100), 2, min_tokens=100),
+    ], budget=250)
+    assert compiled.sections["context"]["action"] == "summarized"
+    assert "solo i nomi" in compiled.text
+    assert compiled.sections["history"]["action"] == "omitted"
+    assert OMITTED_MARKER in compiled.text
+
+
+def test_mandatory_sections_are_never_cut():
+    question = lines("q", 100)
+    compiled = compile_prompt("t", TEMPLATE, [
+        Section("question", question, 0), Section("context", "c", 1), Section("history", "h", 2),
+    ], budget=100)
+    assert question in compiled.text and compiled.over_budget
+
+
+def test_truncate_tokens_marks_omitted_part():
+    text = lines("r", 50)
+    cut = truncate_tokens(text, 200)
+    assert estimate_tokens(cut) <= 200
+    assert cut.startswith("r riga 0 ") and "token successivi omessi" in cut
+    assert truncate_tokens("corto", 200) == "corto"
+
+
+def test_model_budgets():
+    assert budget_for("gemini-2.5-pro") < budget_for("gemini-2.5-flash")
+
+
+def test_judge_prompt_keeps_card_texts_whole():
+    cards_context = lines("CARTA", 2000)
+    prompt = build_judge_prompt(cards_context, "Chi risolve prima?", lines("RULING", 50), "gemini-2.5-pro")
+    assert cards_context in prompt
+    assert "RULING riga 0 " not in prompt  # i ruling extra sono i primi a ridursi
@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from rate_limiter import RateLimiter, estimate_tokens, get_rate_limiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("x" * 400) == 100
+
+
+def test_expected_wait_follows_both_buckets():
+    clock = FakeClock()
+    limiter = RateLimiter(rpm=60, tpm=6000, clock=clock)
+    assert limiter.expected_wait(100) == 0
+    assert limiter.acquire(6000) == 0
+    # Token finiti: 100 token tornano in 1s (6000/min)
+    assert limiter.expected_wait(100) == pytest.approx(1.0)
+    clock.now = 0.5
+    assert limiter.expected_wait(100) == pytest.approx(0.5)
+    clock.now = 60
+    assert limiter.expected_wait(100) == 0
+
+
+def test_settle_puts_bucket_in_debt():
+    clock = FakeClock()
+    limiter = RateLimiter(rpm=60, tpm=6000, clock=clock)
+    limiter.acquire(100)
+    limiter.settle(100, 6100)  # la risposta è costata molto più della stima
+    assert limiter.expected_wait(100) == pytest.approx(2.0)
+
+
+def test_backoff_pauses_every_caller():
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock)
+    delay = limiter.backoff(0)
+    assert 2.5 <= delay <= 7.5
+    assert limiter.expected_wait() == pytest.approx(delay)
+    assert get_rate_limiter("key-a") is get_rate_limiter("key-a") is not get_rate_limiter("key-b")
+
+
+def test_requests_beyond_rpm_wait_in_fifo_order():
+    limiter = RateLimiter(rpm=1200, tpm=10 ** 6)  # una richiesta ogni 50 ms a bucket vuoto
+    for _ in range(1200):
+        limiter.acquire(1)
+    order = []
+
+    def call(i):
+        limiter.acquire(1)
+        order.append(i)
+
+    threads = []
+    start = time.monotonic()
+    for i in range(4):
+        threads.append(threading.Thread(target=call, args=(i,)))
+        threads[-1].start()
+        time.sleep(0.005)  # ordine di arrivo certo
+    for thread in threads:
+        thread.join()
+    assert order == [0, 1, 2, 3]
+    assert time.monotonic() - start >= 0.15
+
+
+def test_acquire_timeout():
+    limiter = RateLimiter(rpm=1, tpm=10 ** 6)
+    limiter.acquire(1)
+    with pytest.raises(TimeoutError):
+        limiter.acquire(1, timeout=0.05)
+    assert limiter.queue_depth == 0
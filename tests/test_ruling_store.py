@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+import card_catalog
+from ruling_store import RulingStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(card_catalog, "load_name_index", lambda path=None: {"Mirrorjade the Iceblade Dragon": 44146295})
+    return RulingStore(str(tmp_path / "rulings.sqlite"))
+
+
+def write_seed(path, rulings):
+    path.write_text(json.dumps({"rulings": rulings}), encoding="utf-8")
+
+
+def test_relevant_prefers_pair_rulings(store, tmp_path):
+    seed = tmp_path / "rulings.json"
+    write_seed(seed, [
+        {"cards": ["Mirrorjade the Iceblade Dragon"], "question": "Solo Mirrorjade?", "answer": "Sì."},
+        {"cards": ["Mirrorjade the Iceblade Dragon", "Ash Blossom & Joyous Spring"],
+         "question": "Ash su Mirrorjade?", "answer": "Nega l'effetto."},
+    ])
+    assert store.load_json(str(seed)) == 2
+    assert store.load_json(str(seed)) == 0
+    rulings = store.relevant({"44146295", "name:ash blossom & joyous spring"})
+    assert rulings[0] == ("Ash su Mirrorjade?", "Nega l'effetto.")
+    assert len(rulings) == 2
+
+
+def test_seed_change_replaces_previous_seed_rows(store, tmp_path):
+    seed = tmp_path / "rulings.json"
+    manual = tmp_path / "manual.json"
+    write_seed(seed, [{"cards": [44146295], "question": "Vecchia?", "answer": "Ruling superato."}])
+    write_seed(manual, [{"cards": [44146295], "question": "Manuale?", "answer": "Resta."}])
+    store.ensure_seed(str(seed))
+    store.load_json(str(manual))
+
+    write_seed(seed, [{"cards": [44146295], "question": "Vecchia?", "answer": "Ruling corretto."}])
+    store.ensure_seed(str(seed))
+    answers = {answer for _q, answer in store.relevant({"44146295"})}
+    assert answers == {"Ruling corretto.", "Resta."}
+    assert store.stats()[0] == 2
+
+    # Stesso file: nessun nuovo import
+    store.ensure_seed(str(seed))
+    assert store.stats()[0] == 2
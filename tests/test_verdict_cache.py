@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+from verdict_cache import VerdictCache, make_key, rulings_hash
+
+CARDS = ["14558127", "44146295"]
+QUESTION = "Se attivo Ash Blossom sull'effetto di Mirrorjade, Mirrorjade viene comunque bandita?"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return VerdictCache(str(tmp_path / "verdicts.sqlite"))
+
+
+def store(cache, question=QUESTION, rulings="", response="Sì."):
+    key = make_key(CARDS, question, "gemini-2.5-flash", 2, rulings)
+    cache.put(key, response, CARDS, question, "gemini-2.5-flash", 2, rulings)
+    return key
+
+
+def test_exact_hit_ignores_case_and_punctuation(cache):
+    store(cache)
+    assert cache.get(make_key(CARDS, QUESTION.upper() + "!!", "gemini-2.5-flash", 2)) == "Sì."
+    assert cache.get(make_key(CARDS, QUESTION, "gemini-2.5-pro", 2)) is None
+
+
+def test_near_duplicate_hit(cache):
+    key = store(cache)
+    similar = cache.find_similar(CARDS, QUESTION.replace("Se attivo", "Quando attivo"), "gemini-2.5-flash", 2)
+    assert similar["key"] == key and similar["similarity"] >= 0.6
+    assert cache.find_similar(CARDS, "Quanti mostri posso evocare?", "gemini-2.5-flash", 2) is None
+
+
+def test_rulings_change_invalidates_verdict(cache):
+    old_rulings = rulings_hash("Q: Ash su Mirrorjade?\nA: No.\n")
+    store(cache, rulings=old_rulings)
+    new_rulings = rulings_hash("Q: Ash su Mirrorjade?\nA: Sì.\n")
+    assert cache.get(make_key(CARDS, QUESTION, "gemini-2.5-flash", 2, new_rulings)) is None
+    assert cache.find_similar(CARDS, QUESTION, "gemini-2.5-flash", 2, new_rulings) is None
+    assert cache.find_similar(CARDS, QUESTION, "gemini-2.5-flash", 2, old_rulings) is not None
+
+
+def test_ttl_expiry(tmp_path):
+    cache = VerdictCache(str(tmp_path / "verdicts.sqlite"), ttl=60)
+    key = store(cache)
+    with cache._connect() as conn:
+        conn.execute("UPDATE verdicts SET created_at = ?", (time.time() - 120,))
+    assert cache.find_similar(CARDS, QUESTION, "gemini-2.5-flash", 2) is None
+    assert cache.get(key) is None
+    assert cache.stats()[0] == 0
+
+
+def test_lru_eviction(tmp_path):
+    cache = VerdictCache(str(tmp_path / "verdicts.sqlite"), max_entries=2)
+    first = store(cache, question="prima domanda", response="1")
+    second = store(cache, question="seconda domanda", response="2")
+    with cache._connect() as conn:
+        conn.execute("UPDATE verdicts SET last_access = last_access - 10 WHERE key = ?", (second,))
+    assert cache.get(first) == "1"  # la prima diventa la più recente
+    store(cache, question="terza domanda", response="3")
+    assert cache.get(second) is None
+    assert cache.get(first) == "1"
+    assert cache.stats()[0] == 2
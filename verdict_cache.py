@@ -0,0 +1,220 @@
+"""
+Cache persistente dei verdetti del Judge, condivisa tra tutte le sessioni.
+
+Chiave = hash canonico di (ID carte risolte ordinati, scenario normalizzato,
+modello, versione del prompt, hash dei ruling in archivio usati nel prompt). Le voci scadono dopo VERDICT_TTL e oltre
+MAX_ENTRIES si eliminano quelle usate meno di recente.
+
+Per le domande formulate in modo diverso c'è un secondo livello: firma
+MinHash dello scenario + LSH a bande, sempre a parità di carte/modello/prompt.
+"""
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+import unicodedata
+
+from common import CACHE_DIR, connect
+
+VERDICT_DB_PATH = os.path.join(CACHE_DIR, "verdicts.sqlite")
+VERDICT_TTL = 7 * 24 * 3600  # Le card vengono errattate / i ruling aggiornati: niente cache eterna
+MAX_ENTRIES = 5000
+
+SIMILARITY_THRESHOLD = 0.6  # Jaccard stimata minima per proporre un verdetto simile
+
+# MinHash: 64 permutazioni = 16 bande da 4 righe (soglia LSH ~0.5)
+NUM_PERM = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+_PRIME = (1 << 61) - 1
+_perm_rng = random.Random(1337)  # Seed fisso: le firme salvate restano confrontabili tra riavvii
+_PERMUTATIONS = [(_perm_rng.randrange(1, _PRIME), _perm_rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_WHITESPACE = re.compile(r"\s+")
+_TOKEN = re.compile(r"\w+")
+
+
+def normalize_scenario(text):
+    """Scenario in forma canonica: NFKC, minuscolo, spazi compattati, senza punteggiatura finale."""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return _WHITESPACE.sub(" ", text).strip().rstrip("?!. ")
+
+
+def card_keys(cards_data, missing_names=()):
+    """ID canonici ordinati delle carte; le carte non risolte entrano per nome."""
+    keys = {str(card["id"]) for card in cards_data if card.get("id") is not None}
+    keys.update(f"name:{name.strip().lower()}" for name in missing_names if name.strip())
+    return sorted(keys)
+
+
+def rulings_hash(rulings_text):
+    """Impronta dei ruling extra del prompt: se l'archivio cambia, i verdetti vecchi non valgono più."""
+    return hashlib.sha256((rulings_text or "").encode("utf-8")).hexdigest()[:16]
+
+
+def make_key(card_ids, scenario, model_name, prompt_version, rulings=""):
+    payload = json.dumps(
+        [list(card_ids), normalize_scenario(scenario), model_name, prompt_version, rulings],
+        ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def shingles(scenario):
+    """Parole e coppie di parole consecutive dello scenario normalizzato."""
+    tokens = _TOKEN.findall(normalize_scenario(scenario))
+    return set(tokens) | {f"{a} {b}" for a, b in zip(tokens, tokens[1:])}
+
+
+def minhash_signature(shingle_set):
+    if not shingle_set:
+        return [_PRIME] * NUM_PERM
+    hashes = [int.from_bytes(hashlib.blake2b(sh.encode("utf-8"), digest_size=8).digest(), "big")
+              for sh in shingle_set]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def estimate_similarity(sig_a, sig_b):
+    """Jaccard stimata = frazione di posizioni uguali nelle due firme."""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def _gate(card_ids, model_name, prompt_version, rulings=""):
+    """Solo verdetti con le stesse carte, lo stesso modello, lo stesso prompt e gli stessi ruling sono confrontabili."""
+    payload = json.dumps([list(card_ids), model_name, str(prompt_version), rulings], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _band_keys(gate, signature):
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(repr(rows).encode("ascii"), digest_size=8).hexdigest()
+        keys.append(f"{gate}:{band}:{digest}")
+    return keys
+
+
+class VerdictCache:
+    """Cache SQLite thread-safe con TTL ed eviction LRU."""
+
+    def __init__(self, path=VERDICT_DB_PATH, ttl=VERDICT_TTL, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS verdicts (
+                    key TEXT PRIMARY KEY,
+                    card_ids TEXT NOT NULL,
+                    scenario TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_verdicts_access ON verdicts (last_access)")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(verdicts)")}
+            if "signature" not in columns:
+                conn.execute("ALTER TABLE verdicts ADD COLUMN signature TEXT")
+            conn.execute("CREATE TABLE IF NOT EXISTS verdict_lsh (band TEXT NOT NULL, key TEXT NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_verdict_lsh_band ON verdict_lsh (band)")
+
+    def _connect(self):
+        return connect(self.path)
+
+    def get(self, key):
+        """Testo del verdetto salvato, o None se assente/scaduto."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT response, created_at FROM verdicts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            response, created_at = row
+            if now - created_at > self.ttl:
+                conn.execute("DELETE FROM verdicts WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE verdicts SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            return response
+
+    def touch(self, key):
+        """Conta un riuso (es. verdetto simile accettato dall'utente)."""
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE verdicts SET last_access = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+
+    def put(self, key, response, card_ids, scenario, model_name, prompt_version, rulings=""):
+        now = time.time()
+        signature = minhash_signature(shingles(scenario))
+        with self._lock, self._connect() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO verdicts
+                    (key, card_ids, scenario, model, prompt_version, response, created_at, last_access, hits, signature)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?)
+            """, (key, json.dumps(list(card_ids)), normalize_scenario(scenario), model_name,
+                  str(prompt_version), response, now, now, json.dumps(signature)))
+            conn.execute("DELETE FROM verdict_lsh WHERE key = ?", (key,))
+            conn.executemany(
+                "INSERT INTO verdict_lsh (band, key) VALUES (?, ?)",
+                [(band, key) for band in _band_keys(_gate(card_ids, model_name, prompt_version, rulings), signature)]
+            )
+            self._evict(conn, now)
+
+    def find_similar(self, card_ids, scenario, model_name, prompt_version, rulings="", threshold=SIMILARITY_THRESHOLD):
+        """
+        Verdetto già emesso per uno scenario quasi identico con le stesse carte.
+        Returns dict {key, response, scenario, similarity} oppure None.
+        """
+        signature = minhash_signature(shingles(scenario))
+        bands = _band_keys(_gate(card_ids, model_name, prompt_version, rulings), signature)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            placeholders = ",".join("?" * len(bands))
+            rows = conn.execute(f"""
+                SELECT key, response, scenario, signature, created_at FROM verdicts
+                WHERE key IN (SELECT DISTINCT key FROM verdict_lsh WHERE band IN ({placeholders}))
+            """, bands).fetchall()
+
+        best = None
+        for key, response, stored_scenario, stored_sig, created_at in rows:
+            if not stored_sig or now - created_at > self.ttl:
+                continue
+            similarity = estimate_similarity(signature, json.loads(stored_sig))
+            if similarity >= threshold and (best is None or similarity > best["similarity"]):
+                best = {"key": key, "response": response, "scenario": stored_scenario, "similarity": similarity}
+        return best
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM verdicts WHERE created_at < ?", (now - self.ttl,))
+        count = conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute("""
+                DELETE FROM verdicts WHERE key IN (
+                    SELECT key FROM verdicts ORDER BY last_access LIMIT ?
+                )
+            """, (count - self.max_entries,))
+        conn.execute("DELETE FROM verdict_lsh WHERE key NOT IN (SELECT key FROM verdicts)")
+
+    def stats(self):
+        """(voci, hit totali)."""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM verdicts").fetchone()
+
+
+_verdict_cache = None
+_verdict_cache_lock = threading.Lock()
+
+
+def get_verdict_cache():
+    """VerdictCache condivisa dal processo."""
+    global _verdict_cache
+    with _verdict_cache_lock:
+        if _verdict_cache is None:
+            _verdict_cache = VerdictCache()
+        return _verdict_cache
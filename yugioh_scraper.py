@@ -1,6 +1,7 @@
 import requests
 import urllib.parse
 import streamlit as st
+import deck_delta
 
 class YuGiOhMetaScraper:
     BASE_URL = "https://www.yugiohmeta.com/api/v1/top-decks"
@@ -727,15 +728,17 @@ class YuGiOhMetaScraper:
             print(f"Tech Deep Dive Error: {e}")
             return data
 
-    def parse_deck_list(self, deck_data):
+    def parse_deck_list(self, deck_data, core=None):
         """
         Converts raw deck JSON into a standardized string format for the AI.
+        With `core` ({name: count} archetype core list, see deck_delta) the
+        main deck is rendered as a delta against the core instead of in full.
         """
         output = []
         
         try:
             player = deck_data.get("author", "Unknown Player")
-            deck_name = deck_data.get("deckType", {}).get("name", "Unknown Deck")
+            deck_name = (deck_data.get("deckType") or {}).get("name", "Unknown Deck")
             raw_rank = deck_data.get("tournamentPlacement", "N/A")
             rank_str = self._format_rank(raw_rank)
             
@@ -751,7 +754,12 @@ class YuGiOhMetaScraper:
                 main_deck.append(f"{count}x {name}")
                 
             output.append(f"- {rank_str}: {player} ({deck_name})")
-            output.append(f"  Main Deck: {', '.join(main_deck)}")
+            if core is not None:
+                delta = deck_delta.encode_delta(deck_delta.card_counts(raw_main), core)
+                output.append(f"  [DELTA vs CORE {deck_name}]")
+                output.append(f"  Main Deck: {deck_delta.render_delta(delta)}")
+            else:
+                output.append(f"  Main Deck: {', '.join(main_deck)}")
             
             return "\n".join(output)
         except Exception as e: